@@ -0,0 +1,269 @@
+import heapq
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from bin.model.MeridianModel import MeridianModel
+
+AUDIO_EXTENSIONS = ['flac', 'm4a', 'mp3', 'mp4', 'mpeg', 'mpga', 'oga', 'ogg', 'wav', 'webm']
+
+# Controller of the current worker process, created once by _init_worker
+_worker_controller = None
+
+
+class BatchJob:
+    """
+    A single recording to transcribe, summarize and save to the campaign.
+    """
+
+    def __init__(self, path: str, priority: int = 0, num_speakers: int = 4):
+        self.path = path
+        self.priority = priority
+        self.num_speakers = num_speakers
+        self.attempts = 0
+        self.status = "pending"
+        self.errors = []
+        self.result = {}
+
+    def to_dict(self) -> dict:
+        return {
+            "path": self.path,
+            "priority": self.priority,
+            "num_speakers": self.num_speakers,
+            "attempts": self.attempts,
+            "status": self.status,
+            "errors": self.errors,
+            **self.result,
+        }
+
+
+def load_jobs(source: str, num_speakers: int = 4) -> list:
+    """
+    Creates the jobs for a directory of recordings or a manifest file.
+
+    A manifest is either a JSON list whose entries are paths or objects with "path" and optional
+    "priority" and "num_speakers" keys, or a text file with one path per line. Relative paths are
+    resolved against the manifest's directory.
+
+    Args:
+        source (str): A directory or manifest file.
+        num_speakers (int, optional): The number of speakers for entries which do not set it. Defaults to 4.
+
+    Returns:
+        list: The jobs, in the order they were listed.
+    """
+    if os.path.isdir(source):
+        files = sorted(file for file in os.listdir(source)
+                       if os.path.splitext(file)[1][1:].lower() in AUDIO_EXTENSIONS)
+        return [BatchJob(os.path.join(source, file), num_speakers=num_speakers) for file in files]
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    with open(source, 'r') as f:
+        if source.lower().endswith(".json"):
+            entries = json.load(f)
+        else:
+            entries = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+    jobs = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {"path": entry}
+        jobs.append(BatchJob(os.path.join(base_dir, entry["path"]),
+                             priority=entry.get("priority", 0),
+                             num_speakers=entry.get("num_speakers", num_speakers)))
+    return jobs
+
+
+def _init_worker(transcription_service: str, agent_options: dict) -> None:
+    # Each worker process loads its own models once and keeps them for every job it runs
+    global _worker_controller
+    from bin.controller.MeridianController import MeridianController
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(process)d - %(levelname)s - %(message)s',
+                        handlers=[logging.StreamHandler(sys.stdout)])
+    _worker_controller = MeridianController(transcription_service=transcription_service, **agent_options)
+
+
+def _run_job(path: str, num_speakers: int, output_dir: str) -> dict:
+    from bin.transcription.LocalTranscription import TRANSCRIPTION_ERROR
+
+    base_name = os.path.splitext(os.path.basename(path))[0]
+    timings = {}
+
+    start_time = time.time()
+    # A retried windowed job continues from the last window the failed attempt finished
+    transcript = _worker_controller.transcribe_audio(path, num_speakers, resume=True)
+    timings["transcription"] = time.time() - start_time
+    if transcript is None or transcript == TRANSCRIPTION_ERROR:
+        raise RuntimeError(f"Transcription failed for {path}")
+
+    transcript_path = os.path.join(output_dir, f"{base_name}.txt")
+    _worker_controller.save_data(transcript_path, transcript)
+
+    start_time = time.time()
+    summary = _worker_controller.summarize_session(transcript_path)
+    timings["summary"] = time.time() - start_time
+    if summary is None:
+        raise RuntimeError(f"Summarization failed for {path}")
+
+    summary_path = os.path.join(output_dir, f"{base_name}_summary.txt")
+    _worker_controller.save_data(summary_path, summary)
+
+    return {
+        "transcript_path": transcript_path,
+        "summary_path": summary_path,
+        "summary": summary,
+        "timings": timings,
+        "stage_report": _worker_controller.get_stage_report(),
+    }
+
+
+class BatchRunner:
+    """
+    Runs transcribe, summarize and save-to-campaign over many recordings without a display.
+
+    Jobs are handed to a bounded pool of worker processes, highest priority first, and failed jobs
+    are retried. If a worker process dies, the pool is started again and the jobs it was running
+    count as failed attempts. Campaign saves happen in this process, one at a time, after each job
+    finishes.
+    """
+
+    def __init__(self, transcription_service: str = "local", workers: int = 1, retries: int = 1,
+                 output_dir: str = None, save_to_campaign: bool = True, window_seconds: int = None,
+                 shard_workers: int = None, autotune: bool = None):
+        """
+        Initializes a new instance of the BatchRunner class.
+
+        Args:
+            transcription_service (str, optional): "local" or "remote". Defaults to "local".
+            workers (int, optional): The number of worker processes. Defaults to 1.
+            retries (int, optional): How often a failed job is retried. Defaults to 1.
+            output_dir (str, optional): Where transcripts and summaries are written. Defaults to
+                next to each recording.
+            save_to_campaign (bool, optional): Add each summary to the campaign. Defaults to True.
+            window_seconds (int, optional): Transcribe locally in checkpointed windows of this many seconds.
+            shard_workers (int, optional): CPU worker processes per local transcription.
+            autotune (bool, optional): Use this host's calibrated execution profile for local transcription.
+        """
+        self.transcription_service = transcription_service
+        self.workers = workers
+        self.retries = retries
+        self.output_dir = output_dir
+        self.save_to_campaign = save_to_campaign
+        self.model = MeridianModel() if save_to_campaign else None
+        self.agent_options = {"window_seconds": window_seconds, "shard_workers": shard_workers, "autotune": autotune}
+
+    def run(self, jobs: list, report_path: str = None) -> dict:
+        """
+        Runs every job and writes a JSON summary report.
+
+        Args:
+            jobs (list): The BatchJob instances to run.
+            report_path (str, optional): Where to write the report. Defaults to batch_report.json
+                in the output directory, or the working directory.
+
+        Returns:
+            dict: The report.
+        """
+        start_time = time.time()
+        queue = []
+        for sequence, job in enumerate(jobs):
+            heapq.heappush(queue, (-job.priority, sequence, job))
+        sequence = len(jobs)
+
+        # Spawn rather than fork so CUDA state is never inherited by the workers
+        context = multiprocessing.get_context("spawn")
+        in_flight = {}
+        executor = self._start_pool(context)
+        try:
+            while queue or in_flight:
+                # Only hand out as many jobs as there are workers, so priorities apply to everything still queued
+                while queue and len(in_flight) < self.workers:
+                    _, _, job = heapq.heappop(queue)
+                    job.attempts += 1
+                    job.status = "running"
+                    output_dir = self.output_dir or os.path.dirname(os.path.abspath(job.path))
+                    os.makedirs(output_dir, exist_ok=True)
+                    logging.info(f"Starting batch job {job.path} (priority {job.priority}, attempt {job.attempts})")
+                    try:
+                        future = executor.submit(_run_job, job.path, job.num_speakers, output_dir)
+                    except BrokenProcessPool:
+                        executor = self._restart_pool(executor, context)
+                        future = executor.submit(_run_job, job.path, job.num_speakers, output_dir)
+                    in_flight[future] = job
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                broken = any(isinstance(future.exception(), BrokenProcessPool) for future in done)
+                if broken:
+                    # Every job of a broken pool fails, so collect them all before starting a new one
+                    done = set(wait(in_flight).done)
+                for future in done:
+                    job = in_flight.pop(future)
+                    try:
+                        job.result = future.result()
+                    except Exception as e:
+                        if isinstance(e, BrokenProcessPool):
+                            e = RuntimeError(f"The worker process running the job exited unexpectedly ({e})")
+                        logging.error(f"Batch job {job.path} failed on attempt {job.attempts}: {e}")
+                        job.errors.append(str(e))
+                        if job.attempts <= self.retries:
+                            job.status = "retrying"
+                            heapq.heappush(queue, (-job.priority, sequence, job))
+                            sequence += 1
+                        else:
+                            job.status = "failed"
+                        continue
+
+                    job.status = "succeeded"
+                    self._save_to_campaign(job)
+                    logging.info(f"Finished batch job {job.path}")
+                if broken:
+                    executor = self._restart_pool(executor, context)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        report = {
+            "started": start_time,
+            "wall_time": time.time() - start_time,
+            "workers": self.workers,
+            "succeeded": sum(1 for job in jobs if job.status == "succeeded"),
+            "failed": sum(1 for job in jobs if job.status == "failed"),
+            "jobs": [job.to_dict() for job in jobs],
+        }
+        for job in report["jobs"]:
+            job.pop("summary", None)
+
+        if report_path is None:
+            report_path = os.path.join(self.output_dir or os.getcwd(), "batch_report.json")
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        logging.info(f"Batch finished: {report['succeeded']} succeeded, {report['failed']} failed. Report written to {report_path}")
+
+        return report
+
+    def _start_pool(self, context) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=_init_worker,
+                                   initargs=(self.transcription_service, self.agent_options))
+
+    def _restart_pool(self, executor: ProcessPoolExecutor, context) -> ProcessPoolExecutor:
+        logging.warning("A batch worker process exited unexpectedly - starting new worker processes")
+        executor.shutdown(wait=False, cancel_futures=True)
+        return self._start_pool(context)
+
+    def _save_to_campaign(self, job: BatchJob) -> None:
+        if self.model is None:
+            return
+        try:
+            start_time = time.time()
+            self.model.save_to_campaign(job.result["summary"])
+            job.result["campaign_saved"] = True
+            job.result.setdefault("timings", {})["campaign"] = time.time() - start_time
+        except Exception as e:
+            logging.error(f"Could not save {job.path} to the campaign: {e}")
+            job.result["campaign_saved"] = False
+            job.errors.append(f"Campaign save failed: {e}")
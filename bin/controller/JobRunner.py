@@ -0,0 +1,251 @@
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import time
+
+# Where the word timings of finished jobs are kept until they are written next to a transcript
+SIDECAR_DIR = "./cache/jobs"
+
+
+class TranscriptionJob:
+    """
+    A recording queued for transcription in a JobRunner worker, and its progress.
+    """
+
+    def __init__(self, job_id: int, path: str, num_speakers: int):
+        self.id = job_id
+        self.path = path
+        self.num_speakers = num_speakers
+        self.status = "queued"
+        self.stage = None
+        self.percent = None
+        self.stages = {}
+        self.transcript = None
+        self.stage_report = None
+        self.sidecar_path = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed", "cancelled")
+
+    def describe(self) -> str:
+        """
+        Returns a one-line status, e.g. "session.mp3 - running: transcription 42%".
+        """
+        text = f"{os.path.basename(self.path)} - {self.status}"
+        if self.status == "running" and self.stage is not None:
+            text += f": {self.stage}"
+            if self.percent is not None:
+                text += f" {self.percent:.0f}%"
+        elif self.done and self.started is not None:
+            text += f" after {(self.finished - self.started):.0f} s"
+        return text
+
+
+def _worker_main(transcription_service: str, requests, events, cancel) -> None:
+    # Runs in the worker process: loads the models once and transcribes one request at a time
+    from bin.controller.MeridianController import MeridianController
+    from bin.transcription.LocalTranscription import TRANSCRIPTION_ERROR
+    from bin.transcription.StagePipeline import PipelineCancelled
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(process)d - %(levelname)s - %(message)s',
+                        handlers=[logging.StreamHandler(sys.stderr)])
+    controller = MeridianController(transcription_service=transcription_service)
+    controller.agent.cancel_event = cancel
+
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+        job_id, path, num_speakers, sidecar_path = request
+        # The runner clears the flag before handing out a job, so it is only set if this job was cancelled
+        if cancel.is_set():
+            events.put({"type": "cancelled", "job": job_id})
+            continue
+        controller.agent.progress_callback = lambda event: events.put(dict(event, type="progress", job=job_id))
+        events.put({"type": "started", "job": job_id})
+        try:
+            # Windowed transcriptions continue from the checkpoint of an earlier job that was cancelled or crashed
+            transcript = controller.transcribe_audio(path, num_speakers, resume=True)
+            if transcript is None or transcript == TRANSCRIPTION_ERROR:
+                raise RuntimeError(f"Transcription failed for {path}")
+            if not controller.save_compact_transcript(sidecar_path):
+                sidecar_path = None
+            events.put({"type": "succeeded", "job": job_id, "transcript": transcript,
+                        "stage_report": controller.get_stage_report(), "sidecar_path": sidecar_path})
+        except PipelineCancelled:
+            events.put({"type": "cancelled", "job": job_id})
+        except Exception as e:
+            logging.error(f"Job {job_id} failed: {e}")
+            events.put({"type": "failed", "job": job_id, "error": str(e)})
+        finally:
+            controller.agent.progress_callback = None
+
+
+class _Worker:
+    # A worker process with its own request queue and cancel flag
+
+    def __init__(self, context, transcription_service: str, events):
+        # The cancel flag belongs to the job handed to the worker, and is cleared before the next one
+        self.requests = context.Queue()
+        self.cancel = context.Event()
+        self.job = None
+        self.process = context.Process(target=_worker_main, name="transcription-worker",
+                                       args=(transcription_service, self.requests, events, self.cancel))
+        self.process.start()
+
+
+class JobRunner:
+    """
+    Transcribes recordings in worker processes while the GUI stays responsive.
+
+    Jobs are queued with submit() and handed out first come, first served, one per worker. Each
+    worker process loads its models once and reports every stage it starts and finishes, with the
+    percentage of transcription and alignment done, as events. poll() applies the pending events
+    to the jobs and never blocks, so it can run from Tk's after(). Cancelling a running job sets
+    its worker's cancel flag, which the transcription checks between stages and between batches
+    of segments.
+    """
+
+    def __init__(self, transcription_service: str = "local", workers: int = 1, sidecar_dir: str = SIDECAR_DIR):
+        """
+        Initializes a new instance of the JobRunner class. Worker processes start with the first job.
+
+        Args:
+            transcription_service (str, optional): "local" or "remote". Defaults to "local".
+            workers (int, optional): The number of worker processes. Defaults to 1.
+            sidecar_dir (str, optional): Where the word timings of finished jobs are written.
+        """
+        self.transcription_service = transcription_service
+        self.workers = workers
+        self.sidecar_dir = sidecar_dir
+        self.jobs = {}
+        self._pending = []
+        self._workers = []
+        self._next_id = 1
+        # Spawn rather than fork so CUDA state is never inherited by the workers
+        self._context = multiprocessing.get_context("spawn")
+        self._events = self._context.Queue()
+
+    def submit(self, path: str, num_speakers: int) -> TranscriptionJob:
+        """
+        Queues a recording for transcription.
+        """
+        job = TranscriptionJob(self._next_id, path, num_speakers)
+        self._next_id += 1
+        self.jobs[job.id] = job
+        self._pending.append(job)
+        logging.info(f"Queued transcription job {job.id} for {path}")
+        self._dispatch()
+        return job
+
+    def cancel(self, job_id: int) -> None:
+        """
+        Cancels a queued job at once, or asks the worker of a running job to stop it.
+        """
+        job = self.jobs.get(job_id)
+        if job is None or job.done:
+            return
+        if job in self._pending:
+            self._pending.remove(job)
+            job.status = "cancelled"
+            job.finished = time.time()
+            return
+        for worker in self._workers:
+            if worker.job is job:
+                logging.info(f"Cancelling transcription job {job.id}")
+                job.status = "cancelling"
+                worker.cancel.set()
+
+    def poll(self) -> list:
+        """
+        Applies the events the workers sent since the last call and hands out queued jobs.
+
+        Returns:
+            list: The jobs which changed.
+        """
+        changed = {}
+        while True:
+            try:
+                event = self._events.get_nowait()
+            except queue.Empty:
+                break
+            job = self.jobs.get(event.get("job"))
+            if job is None:
+                continue
+            self._apply(job, event)
+            changed[job.id] = job
+
+        # A worker which died takes its job with it
+        for worker in list(self._workers):
+            if not worker.process.is_alive():
+                self._workers.remove(worker)
+                if worker.job is not None and not worker.job.done:
+                    worker.job.status = "failed"
+                    worker.job.error = f"The worker process exited with code {worker.process.exitcode}"
+                    worker.job.finished = time.time()
+                    changed[worker.job.id] = worker.job
+
+        self._dispatch()
+        return list(changed.values())
+
+    def _apply(self, job: TranscriptionJob, event: dict) -> None:
+        kind = event["type"]
+        if kind == "started":
+            job.status = "running" if job.status != "cancelling" else job.status
+            job.started = time.time()
+        elif kind == "progress":
+            job.stages[event["stage"]] = event["state"]
+            if event["state"] in ("started", "progress"):
+                job.stage = event["stage"]
+                job.percent = event["percent"]
+        else:
+            job.finished = time.time()
+            if job.status == "cancelling":
+                # A job asked to cancel stays cancelled, even if the worker finished it before noticing
+                job.status = "cancelled"
+            else:
+                job.status = kind
+                job.transcript = event.get("transcript")
+                job.stage_report = event.get("stage_report")
+                job.sidecar_path = event.get("sidecar_path")
+                job.error = event.get("error")
+            for worker in self._workers:
+                if worker.job is job:
+                    worker.job = None
+
+    def _dispatch(self) -> None:
+        while self._pending:
+            worker = next((worker for worker in self._workers if worker.job is None), None)
+            if worker is None:
+                if len(self._workers) >= self.workers:
+                    return
+                worker = _Worker(self._context, self.transcription_service, self._events)
+                self._workers.append(worker)
+
+            job = self._pending.pop(0)
+            os.makedirs(self.sidecar_dir, exist_ok=True)
+            sidecar_path = os.path.join(self.sidecar_dir, f"job_{os.getpid()}_{job.id}.mtr")
+            worker.job = job
+            worker.cancel.clear()
+            worker.requests.put((job.id, job.path, job.num_speakers, sidecar_path))
+
+    def close(self) -> None:
+        """
+        Cancels the running jobs and stops the worker processes.
+        """
+        self._pending.clear()
+        for worker in self._workers:
+            worker.cancel.set()
+            worker.requests.put(None)
+        for worker in self._workers:
+            worker.process.join(timeout=10)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        self._workers.clear()
@@ -7,52 +7,112 @@ from bin.transcription.RemoteTranscription import RemoteTranscription
 
 class MeridianController:
     
-    def __init__(self, transcription_service = None):
+    def __init__(self, transcription_service = None, window_seconds = None, shard_workers = None, autotune = None):
         
         self.model = None # Handles persistency and historical data
         self.agent = None # Handles transcription and summarization
         self.responses = []
+        self.last_summary_stats = None
         
         if transcription_service is None:
             # Initialize any necessary variables or resources here
             transcription_service = input("Choose transcription service (Local/Remote): ")
             
         if transcription_service.lower() == "local":
-            self.agent = LocalTranscription()
+            self.agent = LocalTranscription(window_seconds=window_seconds, shard_workers=shard_workers, autotune=autotune)
         elif transcription_service.lower() == "remote":
             self.agent = RemoteTranscription()
         else:
             print("Invalid transcription service choice. Defaulting to Local.")
-            self.agent = LocalTranscription()
+            self.agent = LocalTranscription(window_seconds=window_seconds, shard_workers=shard_workers, autotune=autotune)
         
         self.model = MeridianModel()
         
-    def transcribe_audio(self, audio_file:str, num_speakers:int) -> str:
+    def transcribe_audio(self, audio_file:str, num_speakers:int, resume:bool = False) -> str:
         # Add your code to transcribe the audio file here
-        logging.info("transcribe_audio function called with audio_file: %s", audio_file)
-        if os.path.exists(audio_file):
-            result = self.agent.transcribe_audio_v2(audio_file, num_speakers)
-        else:
+        logging.info("transcribe_audio function called with audio_file: %s, resume: %s", audio_file, resume)
+        if not os.path.exists(audio_file):
             result = None
+        elif isinstance(self.agent, LocalTranscription):
+            result = self.agent.transcribe_audio_v2(audio_file, num_speakers, resume=resume)
+        else:
+            # The remote service has no speaker diarization or checkpoints
+            result = self.agent.transcribe_audio(audio_file)
 
         return result
 
-    def summarize_session(self, file_path) -> str:
+    def get_stage_report(self) -> str:
+        # Per-stage timings of the last local transcription, if there was one
+        report = getattr(self.agent, "last_stage_report", None)
+        if report is None:
+            return None
+        return str(report)
+
+    def save_compact_transcript(self, filename:str) -> bool:
+        # Word timings of the last local transcription, in the memory-mapped binary format
+        transcript = getattr(self.agent, "last_transcript", None)
+        if transcript is None:
+            return False
+
+        logging.info("save_compact_transcript function called with filename: %s", filename)
+        transcript.save(filename)
+        return True
+
+    def transcribe_audio_stream(self, audio_file:str, num_speakers:int, resume:bool = False):
+        logging.info("transcribe_audio_stream function called with audio_file: %s", audio_file)
+        # Lines are yielded while the recording is still being processed. The remote service has no
+        # windows, so its lines only come once the whole recording is transcribed
+        if not os.path.exists(audio_file):
+            return iter(())
+
+        return self.agent.transcribe_audio_stream(audio_file, num_speakers=num_speakers, resume=resume)
+
+    def summarize_session(self, file_path, on_partial = None) -> str:
         logging.info("summarize_session function called with file_path: %s", file_path)
         # Add your code to summarize the file here
         with open(file_path, 'r') as file:
             contents = file.read()
-            result = self.agent.summarize_text(contents)
+            result = self.agent.summarize_text(contents, on_partial=on_partial)
+        self.last_summary_stats = self.agent.get_summary_stats()
+        logging.info("Summary cache statistics: %s", self.last_summary_stats)
         return result
+
+    def get_summary_stats(self) -> dict:
+        # Hits, misses and hit rate of the summary cache during the last summarize_session call
+        return self.last_summary_stats
     
-    def ask_question(self, question, source_info, num_ctx = 4096):
+    def ask_question(self, question, source_info, num_ctx = 4096, on_token = None, cancel = None):
         logging.info("ask_question function called with question: %s, source_info: %s", question, source_info)
         # Add your code to ask a question here
-        response = self.agent.ask_question(question, source_info, num_ctx)
+        response = self.agent.ask_question(question, source_info, num_ctx, on_token=on_token, cancel=cancel)
         logging.info("Response: %s", response)
         self.responses.append(response)
         
         return response
+
+    def start_analyze_session(self):
+        logging.info("start_analyze_session function called")
+        # Keep the text model loaded while the analyze window is open
+        self.agent.pin_session()
+
+    def end_analyze_session(self):
+        logging.info("end_analyze_session function called")
+        self.agent.unpin_session()
+
+    def get_chat_timings(self) -> dict:
+        # Time to first token, prompt evaluation and generation of the last answer
+        return getattr(self.agent, "last_chat_timings", None)
+
+    def get_conversation_stats(self) -> dict:
+        # History size, prompt tokens and needed context size of the current conversation
+        return self.agent.get_conversation_stats()
+
+    def get_question_report(self) -> str:
+        # Index, retrieval and generation timings of the last question, if the agent records them
+        report = getattr(self.agent, "last_question_report", None)
+        if report is None:
+            return None
+        return str(report)
     
     def clear_conversation(self):
         logging.info("clear_conversation function called")
@@ -85,6 +145,10 @@ class MeridianController:
         # Add your code to save the session here
         self.model.save_session()
     
+    def save_to_campaign(self, data:str) -> None:
+        logging.info("save_to_campaign function called")
+        self.model.save_to_campaign(data)
+
     def load_campaign(self, filename):
         logging.info("load_campaign function called with filename: %s", filename)
         # Add your code to load the campaign here
@@ -1,9 +1,16 @@
 import logging
+import queue
+import threading
+import time
 import tkinter as tk
 from tkinter import messagebox
 from tkinter import filedialog
 
 from bin.controller.MeridianController import MeridianController
+from bin.gui.TranscriptViewer import TranscriptViewer
+
+# How often the streamed answer is moved from the worker thread to the response textbox
+POLL_MS = 50
 
 class MeridianAnalyzeGUI(tk.Toplevel):
         
@@ -25,12 +32,9 @@ class MeridianAnalyzeGUI(tk.Toplevel):
         transcript_label = tk.Label(transcript_frame, text="Transcript:")
         transcript_label.pack(side=tk.TOP)
         
-        # Create a textbox for Transcript
-        self.transcript_textbox = tk.Text(transcript_frame, height=10)
-        self.transcript_textbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        transcript_scrollbar = tk.Scrollbar(transcript_frame, command=self.transcript_textbox.yview)
-        transcript_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.transcript_textbox.config(yscrollcommand=transcript_scrollbar.set)
+        # Create a viewer for Transcript - it only renders the visible lines, so long sessions stay fast
+        self.transcript_viewer = TranscriptViewer(transcript_frame, height=10)
+        self.transcript_viewer.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         #transcript_frame.grid(column=col, row=row, sticky=tk.W + tk.E)
         row+=1
        
@@ -51,6 +55,13 @@ class MeridianAnalyzeGUI(tk.Toplevel):
         self.context_size.set("4096")
         self.context_size_entry = tk.Entry(query_button_frame, textvariable=self.context_size).pack(side=tk.LEFT, ipadx=5)
 
+        # Size the context from the prompt of each question instead of the field
+        self.auto_context_size = tk.BooleanVar()
+        self.auto_context_size.set(True)
+        tk.Checkbutton(query_button_frame, text="Auto", variable=self.auto_context_size).pack(side=tk.LEFT, ipadx=5)
+        self.history_label = tk.Label(query_button_frame, text="History: empty")
+        self.history_label.pack(side=tk.LEFT, ipadx=5)
+
         #self.buttons["context_size"].insert(tk.END, "4096")
         row+=1
 
@@ -85,6 +96,10 @@ class MeridianAnalyzeGUI(tk.Toplevel):
         self.response_textbox.config(yscrollcommand=response_scrollbar.set)
         #response_frame.grid(column=0, row=row, pady=spacing_y, sticky=tk.W + tk.E )
         response_frame.pack(fill=tk.BOTH, side=tk.TOP, expand=True)
+
+        # Time to first token and generation speed of the last answer
+        self.speed_label = tk.Label(self, text="")
+        self.speed_label.pack(side=tk.TOP)
         row+=1
 
         # Create a frame for the buttons
@@ -93,13 +108,31 @@ class MeridianAnalyzeGUI(tk.Toplevel):
         self.load_transcript_button.pack(side=tk.LEFT, ipadx=5)        
         self.submit_question_button = tk.Button(button_frame, text="Submit Question", command = self.submit_question)
         self.submit_question_button.pack(side=tk.LEFT, ipadx=5)
+        self.cancel_button = tk.Button(button_frame, text="Cancel", command=self.cancel_question, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, ipadx=5)
         self.save_response_button = tk.Button(button_frame, text="Save Response", command = self.save_response)
         self.save_response_button.pack(side=tk.LEFT, ipadx=5)        
-        self.exit_button = tk.Button(button_frame, text="Exit", command= lambda : self.destroy())
+        self.exit_button = tk.Button(button_frame, text="Exit", command=self.close)
         self.exit_button.pack(side=tk.LEFT, ipadx=5)
         #button_frame.grid(column=0, row=row, pady=spacing_y, sticky=tk.W + tk.E )
         button_frame.pack()
+
+        self.answer_queue = None
+        self.cancel_event = None
+        self.poll_id = None
+
+        self.protocol("WM_DELETE_WINDOW", self.close)
+        self.controller.start_analyze_session()
      
+    def close(self):
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+        if self.poll_id is not None:
+            self.after_cancel(self.poll_id)
+        self.controller.end_analyze_session()
+        self.transcript_viewer.close()
+        self.destroy()
+
     def validate_context_size(self, value):
         if value.isdigit():
             size = int(value)
@@ -112,40 +145,120 @@ class MeridianAnalyzeGUI(tk.Toplevel):
     def load_transcript(self):
         file_path = filedialog.askopenfilename(filetypes=(('Text Files', '*.txt'), ('All Files', '*.*')), parent=self)
         if file_path:
-            with open(file_path, 'r') as file:
-                content = file.read()
-                self.transcript_textbox.delete("1.0", tk.END)
-                self.transcript_textbox.insert(tk.END, content)
+            self.transcript_viewer.load_file(file_path)
         logging.info(f"load_transcript function called for file {file_path}")
 
     def submit_question(self):
         # Code to be executed when "Submit Question" button is pressed
         logging.info("submit_question function called")
-        self.submit_question_button.config(state=tk.DISABLED)
+        if self.poll_id is not None:
+            # A question is still being answered
+            return
         question = self.query_textbox.get("1.0", tk.END).strip()
-        transcript = self.transcript_textbox.get("1.0", tk.END).strip()
-        context_size = -1
+        transcript = self.transcript_viewer.get_text().strip()
+        context_size = None
         
-        if self.validate_context_size(self.context_size.get()):
-            context_size = int(self.context_size.get())
-        else:
+        if not self.auto_context_size.get():
+            if self.validate_context_size(self.context_size.get()):
+                context_size = int(self.context_size.get())
+            else:
+                return
+
+        if not question or not transcript:
+            messagebox.showinfo("Invalid Question", "Please enter a valid question.")
             return
-            
+
+        # The answer is generated on a worker thread and streamed to the textbox through a queue,
+        # since Tk widgets may only be touched from the main thread
+        self.submit_question_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
+        self.response_textbox.delete("1.0", tk.END)
+        self.speed_label.config(text="Waiting for the first token...")
+        self.answer_queue = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.question_start = time.time()
+        self.first_token_time = None
+        self.token_count = 0
+
+        def ask():
+            try:
+                response = self.controller.ask_question(question, transcript, context_size,
+                                                        on_token=lambda token: self.answer_queue.put(("token", token)),
+                                                        cancel=self.cancel_event)
+                self.answer_queue.put(("done", response))
+            except Exception as e:
+                self.answer_queue.put(("error", e))
+
+        threading.Thread(target=ask, name="analyze-question", daemon=True).start()
+        self.poll_id = self.after(POLL_MS, self.poll_answer)
+
+    def poll_answer(self):
+        tokens = []
+        finished = None
         try:
-           
-            if question and transcript:
-                response = self.controller.ask_question(question, transcript, context_size)
-                self.response_textbox.delete("1.0", tk.END)
-                self.response_textbox.insert(tk.END, response)
-            else:
-                messagebox.showinfo("Invalid Question", "Please enter a valid question.")
-        except Exception as e:
-            messagebox.showerror("Error", f"An error occurred: {e}")
-            logging.error(e)
-            
+            while finished is None:
+                kind, value = self.answer_queue.get_nowait()
+                if kind == "token":
+                    tokens.append(value)
+                else:
+                    finished = (kind, value)
+        except queue.Empty:
+            pass
+
+        if tokens:
+            now = time.time()
+            if self.first_token_time is None:
+                self.first_token_time = now
+            self.token_count += len(tokens)
+            self.response_textbox.insert(tk.END, "".join(tokens))
+            self.response_textbox.see(tk.END)
+            elapsed = now - self.first_token_time
+            rate = self.token_count / elapsed if elapsed > 0 else 0.0
+            self.speed_label.config(text=f"First token: {(self.first_token_time - self.question_start):.2f} s - {rate:.1f} tokens/s")
+
+        if finished is None:
+            self.poll_id = self.after(POLL_MS, self.poll_answer)
+            return
+
+        self.poll_id = None
+
+        kind, value = finished
+        if kind == "error":
+            messagebox.showerror("Error", f"An error occurred: {value}")
+            logging.error(value)
+        elif self.first_token_time is None:
+            # Nothing was streamed, e.g. the query failed before generating
+            self.response_textbox.insert(tk.END, value)
+
+        timings = self.controller.get_chat_timings()
+        if kind == "done" and timings is not None and timings["time_to_first_token"] is not None and not self.cancel_event.is_set():
+            self.speed_label.config(text=f"First token: {timings['time_to_first_token']:.2f} s "
+                                         f"({timings['prompt_eval_count']} prompt tokens in {timings['prompt_eval_seconds']:.2f} s) - "
+                                         f"{timings['tokens_per_second']:.1f} tokens/s")
+        elif self.cancel_event.is_set():
+            self.speed_label.config(text=self.speed_label.cget("text") + " - cancelled")
+
+        self.update_history_label()
+        self.cancel_button.config(state=tk.DISABLED)
         self.submit_question_button.config(state=tk.NORMAL)
         logging.info("submit_question function exit")
 
+    def cancel_question(self):
+        logging.info("cancel_question function called")
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+
+    def update_history_label(self):
+        stats = self.controller.get_conversation_stats()
+        if stats is None:
+            self.history_label.config(text="History: empty")
+            return
+
+        self.history_label.config(text=f"History: {stats['turns']} turns ({stats['summarized_turns']} summarized), "
+                                       f"{stats['history_tokens']} tokens - last prompt {stats['prompt_tokens']} tokens")
+        if self.auto_context_size.get():
+            self.context_size.set(str(stats['context_tokens']))
+
     def save_response(self):
         logging.info("save_response function called")
         file_path = filedialog.asksaveasfilename(filetypes=(('Text Files', '*.txt'), ('All Files', '*.*')))
@@ -174,6 +287,7 @@ class MeridianAnalyzeGUI(tk.Toplevel):
         logging.info("Clearing conversation")
         self.controller.clear_conversation()
         self.response_textbox.delete("1.0", tk.END)
+        self.update_history_label()
         
     def save_conversation(self):
         # Code to be executed when "Save Conversation" button is pressed
@@ -3,13 +3,18 @@
 import tkinter as tk
 from tkinter import messagebox, filedialog
 from bin.controller.MeridianController import MeridianController
+from bin.controller.JobRunner import JobRunner
 from bin.gui.MeridianAnalyzeGUI import MeridianAnalyzeGUI
+from bin.gui.TranscriptViewer import TranscriptViewer
 from dotenv import load_dotenv
 from PIL import Image, ImageTk
 import os
 import random
 import logging 
-import time
+import shutil
+
+# How often the progress of transcription jobs is collected
+JOB_POLL_MS = 200
 
 class MeridianGUI(tk.Tk):
     
@@ -29,6 +34,10 @@ class MeridianGUI(tk.Tk):
             
         self.controller = MeridianController(transcription_service=service)
         self.model = None
+
+        # Transcriptions run in worker processes, which report back to the windows listening for jobs
+        self.job_runner = JobRunner(transcription_service=service, workers=int(os.getenv("MERIDIAN_JOB_WORKERS", "1")))
+        self.job_listeners = []
         
         self.geometry("")
         # Randomly pick an image
@@ -101,6 +110,8 @@ class MeridianGUI(tk.Tk):
         self.set_topmost(self, False)
       
         # Continue with execution
+        self.protocol("WM_DELETE_WINDOW", self.exit_application)
+        self.after(JOB_POLL_MS, self.poll_jobs)
  
         self.mainloop()
     
@@ -108,6 +119,12 @@ class MeridianGUI(tk.Tk):
     def get_controller(self) -> MeridianController:
         return self.controller                
 
+    def poll_jobs(self):
+        for job in self.job_runner.poll():
+            for listener in list(self.job_listeners):
+                listener(job)
+        self.after(JOB_POLL_MS, self.poll_jobs)
+
     def set_topmost(self, window:tk.Tk, boolean_arg=True):
         if window is None:
             self.attributes("-topmost", boolean_arg)
@@ -162,20 +179,32 @@ class MeridianGUI(tk.Tk):
         frame = tk.Frame(transcription_window)
         frame.pack(fill=tk.BOTH, expand=True)
 
-        # Create a textbox inside the frame
-        textbox = tk.Text(frame)
-        textbox.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+        # Create a viewer inside the frame
+        viewer = TranscriptViewer(frame)
+        viewer.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
         
+        # Jobs started from this window, and the one whose transcript is shown
+        window_jobs = {}
+        shown_job = {"job": None}
+
         def save_transcription():
-            self.get_controller().save_session(textbox.get("1.0", tk.END))
+            self.get_controller().save_session(viewer.get_text())
         
         def write_transcription():
             file_path = filedialog.asksaveasfilename(filetypes=(('Text Files', '*.txt'), ('All Files', '*.*')))
             if file_path:
-                self.get_controller().save_data(file_path, textbox.get("1.0", tk.END))  
+                self.get_controller().save_data(file_path, viewer.get_text())
+                # Keep the word timings next to the text so they can be reloaded later
+                job = shown_job["job"]
+                if job is not None and job.sidecar_path is not None and os.path.exists(job.sidecar_path):
+                    shutil.copyfile(job.sidecar_path, os.path.splitext(file_path)[0] + ".mtr")
+                else:
+                    self.get_controller().save_compact_transcript(os.path.splitext(file_path)[0] + ".mtr")
                     
         def exit_transcription():
+            self.job_listeners.remove(on_job_changed)
             self.buttons["transcribe_button"].config(state=tk.NORMAL)
+            viewer.close()
             transcription_window.destroy()
         
         # Function to validate the input value
@@ -187,45 +216,71 @@ class MeridianGUI(tk.Tk):
             return num_speakers
 
         def do_transcription(num_speakers:int=None):
-    
-            while True:
-                # Ask the user for the transcription file
-
-                file_path = filedialog.askopenfilename(filetypes=(('Audio Files', '*.flac;*.m4a;*.mp3;*.mp4;*.mpeg;*.mpga;*.oga;*.ogg;*.wav;*.webm'), ('All Files', '*.*')), parent=transcription_window)
-                if file_path:
-                    try:
-                        num_speakers = validate_num_speakers()
-                        # Display an info message warning that transcription will take a while
-                        transcription_window.title("Transcribing.....")
-                        messagebox.showinfo("Transcription", "Program may hang while transcription is going on - this is normal. Please be patient...")
-                        textbox.delete("1.0", tk.END)
-                        start_time = time.time()
-                        logging.info("GUI: Calling transcribe_audio function")
-                        transcription = self.get_controller().transcribe_audio(file_path, num_speakers)
-                        logging.info(f"GUI: Transcription completed after {time.time() - start_time} seconds")
-        
-                        # Display a notification with the transcription duration
-                        transcription_window.title(transcription_title)
-                        if transcription is not None:
-                            messagebox.showinfo("Transcription Complete", f"Transcription completed in {time.time() - start_time} seconds.")
-                            textbox.insert(tk.END, transcription)
-                        else:
-                            messagebox.showerror("Transcription Error", "An error occurred during transcription.")
-                            
-
-                        break
-                    except Exception as e:
-                        messagebox.showerror("Transcription Error", f"An error occurred: {e}")
-                        logging.error(e)
-        
-                if transcription is None:
-                    answer = messagebox.askretrycancel("Transcription Error", f"Could not do transcription for {file_path}. Try again?")
-                    logging.info(f"Failed transcription: user response = {answer}")
-                    if answer == 'cancel':
-                        break
+            # Ask the user for the transcription file
+            file_path = filedialog.askopenfilename(filetypes=(('Audio Files', '*.flac;*.m4a;*.mp3;*.mp4;*.mpeg;*.mpga;*.oga;*.ogg;*.wav;*.webm'), ('All Files', '*.*')), parent=transcription_window)
+            if not file_path:
+                return
+            try:
+                num_speakers = validate_num_speakers()
+            except Exception as e:
+                messagebox.showerror("Transcription Error", f"An error occurred: {e}", parent=transcription_window)
+                logging.error(e)
+                return
+
+            logging.info("GUI: Queueing transcription job")
+            job = self.job_runner.submit(file_path, num_speakers)
+            window_jobs[job.id] = job
+            jobs_listbox.insert(tk.END, job.describe())
+            transcription_window.title("Transcribing.....")
+
+        def on_job_changed(job):
+            if job.id not in window_jobs:
+                return
+            jobs_listbox.delete(list(window_jobs).index(job.id))
+            jobs_listbox.insert(list(window_jobs).index(job.id), job.describe())
+
+            if job.status == "succeeded":
+                logging.info(f"GUI: Transcription job {job.id} completed after {job.finished - job.started} seconds")
+                show_job(job)
+                message = f"Transcription of {os.path.basename(job.path)} completed in {job.finished - job.started} seconds."
+                if job.stage_report is not None:
+                    message += f"\n\n{job.stage_report}"
+                messagebox.showinfo("Transcription Complete", message, parent=transcription_window)
+            elif job.status == "failed":
+                messagebox.showerror("Transcription Error", f"Could not do transcription for {job.path}: {job.error}", parent=transcription_window)
+            if all(other.done for other in window_jobs.values()):
+                transcription_window.title(transcription_title)
+
+        def show_job(job):
+            shown_job["job"] = job
+            viewer.load_text(job.transcript, job.sidecar_path)
+
+        def on_job_selected(event):
+            selection = jobs_listbox.curselection()
+            if selection:
+                job = list(window_jobs.values())[selection[0]]
+                if job.status == "succeeded":
+                    show_job(job)
+
+        def cancel_transcription():
+            selection = jobs_listbox.curselection()
+            jobs = [list(window_jobs.values())[index] for index in selection] or [job for job in window_jobs.values() if not job.done]
+            for job in jobs:
+                self.job_runner.cancel(job.id)
+                on_job_changed(job)
+
+        # Queued and running jobs with their progress - select a finished one to show its transcript
+        jobs_listbox = tk.Listbox(frame, height=4)
+        jobs_listbox.pack(side=tk.TOP, fill=tk.X)
+        jobs_listbox.bind("<<ListboxSelect>>", on_job_selected)
+        self.job_listeners.append(on_job_changed)
+        transcription_window.protocol("WM_DELETE_WINDOW", exit_transcription)
    
         transcription_button = tk.Button(frame, text="Transcribe Audio", command= do_transcription)
         transcription_button.pack(side=tk.LEFT, padx=10, pady=10)
+
+        cancel_button = tk.Button(frame, text="Cancel", command= cancel_transcription)
+        cancel_button.pack(side=tk.LEFT, padx=10, pady=10)
         
         # Create an input box for Number of Speakers
         num_speakers_label = tk.Label(frame, text="Number of Speakers:")
@@ -275,6 +330,7 @@ class MeridianGUI(tk.Tk):
             else:
                 exit = True
         
+        self.job_runner.close()
         self.destroy()
         
 
@@ -364,26 +420,27 @@ class MeridianGUI(tk.Tk):
     def load_summary(self):
         file_path = filedialog.askopenfilename(filetypes=(('Text Files', '*.txt'), ('All Files', '*.*')))
         if file_path:
-            with open(file_path, 'r') as file:
-                content = file.read()
-            
             # Create a new window
             summary_window = tk.Toplevel(self)
             summary_window.title("Transcript")
             summary_window.geometry("500x500")
             
-            # Create a text widget inside the window
-            text_widget = tk.Text(summary_window)
-            text_widget.pack(fill=tk.BOTH, expand=True)
-            
-            # Insert the content into the text widget
-            text_widget.insert(tk.END, content)
+            # Create a viewer inside the window, which reads the file lazily as it is scrolled
+            viewer = TranscriptViewer(summary_window)
+            viewer.pack(fill=tk.BOTH, expand=True)
+            viewer.load_file(file_path)
                 
-            save_to_campaign_button = tk.Button(summary_window, text="Save to Campaign", command= lambda: self.get_controller().save_to_campaign(content) )
+            save_to_campaign_button = tk.Button(summary_window, text="Save to Campaign", command= lambda: self.get_controller().save_to_campaign(viewer.get_text()) )
             save_to_campaign_button.pack(side=tk.LEFT, padx=10, pady=10)
 
-            exit_transcript_button = tk.Button(summary_window, text="Exit", command=summary_window.destroy)
+            # Unmap the file when the window closes, so it can be overwritten again
+            def exit_summary():
+                viewer.close()
+                summary_window.destroy()
+
+            exit_transcript_button = tk.Button(summary_window, text="Exit", command=exit_summary)
             exit_transcript_button.pack(side=tk.RIGHT, padx=10, pady=10)
+            summary_window.protocol("WM_DELETE_WINDOW", exit_summary)
             
             # Make the window resizable
             summary_window.resizable(True, True)
@@ -0,0 +1,336 @@
+import logging
+import mmap
+import os
+import re
+import tkinter as tk
+from tkinter import font as tkfont
+from tkinter import messagebox, ttk
+
+import numpy as np
+
+from bin.transcription.CompactTranscript import CompactTranscript
+
+# Lines rendered beyond the visible ones, so wrapped lines and resizes do not leave gaps
+RENDER_MARGIN = 10
+
+# Speaker prefix of a transcript line, e.g. "SPEAKER_01: ..."
+_SPEAKER_PATTERN = re.compile(rb"^([^:\n]{1,40}): ", re.MULTILINE)
+
+# Bytes scanned for speaker names when there are no word timings
+SPEAKER_SAMPLE_BYTES = 1 << 20
+
+
+class TranscriptFile:
+    """
+    Line-addressable view of a transcript, read lazily from a memory-mapped file.
+
+    Opening builds an index of where every line starts, which takes one pass over the bytes
+    without decoding them. Lines are then decoded only when they are asked for.
+    """
+
+    def __init__(self, data, file_path: str = None):
+        self.file_path = file_path
+        self._data = data
+        if len(data):
+            newlines = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == ord("\n"))
+        else:
+            newlines = np.zeros(0, dtype=np.int64)
+        starts = np.concatenate(([0], newlines + 1)).astype(np.int64)
+        # A trailing newline does not start another line
+        end = len(data)
+        if len(starts) > 1 and starts[-1] == len(data):
+            starts = starts[:-1]
+            end -= 1
+        self._starts = starts
+        self._ends = np.append(starts[1:] - 1, end).astype(np.int64)
+
+    @classmethod
+    def open(cls, file_path: str) -> "TranscriptFile":
+        with open(file_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return cls(b"", file_path)
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(data, file_path)
+
+    @classmethod
+    def from_text(cls, text: str) -> "TranscriptFile":
+        return cls(text.encode('utf-8'))
+
+    def __len__(self) -> int:
+        return len(self._starts) if len(self._data) else 0
+
+    def lines(self, first: int, count: int) -> list:
+        """
+        Returns up to count lines starting at line first, without their newlines.
+        """
+        last = min(first + count, len(self))
+        return [bytes(self._data[self._starts[i]:self._ends[i]]).decode('utf-8', errors='replace').rstrip("\r")
+                for i in range(first, last)]
+
+    def line_at(self, offset: int) -> int:
+        """
+        Returns the number of the line containing the byte offset.
+        """
+        return int(np.searchsorted(self._starts, offset, side='right') - 1)
+
+    def find_line(self, prefix: str, after: int = -1) -> int:
+        """
+        Returns the first line after line number after that starts with prefix, wrapping around, or None.
+        """
+        pattern = re.compile(rb"^" + re.escape(prefix.encode('utf-8')), re.MULTILINE)
+        start = int(self._ends[after]) if 0 <= after < len(self) else 0
+        match = pattern.search(self._data, start) or pattern.search(self._data, 0, start)
+        return None if match is None else self.line_at(match.start())
+
+    def speakers(self, sample_bytes: int = SPEAKER_SAMPLE_BYTES) -> list:
+        """
+        Returns the speaker names found at the start of the lines in the first sample_bytes of the transcript.
+        """
+        names = {}
+        for match in _SPEAKER_PATTERN.finditer(self._data, 0, min(sample_bytes, len(self._data))):
+            names.setdefault(match.group(1).decode('utf-8', errors='replace'), None)
+        return list(names)
+
+    def text(self) -> str:
+        """
+        Returns the whole transcript. This reads every line, so only use it when all of them are needed.
+        """
+        return bytes(self._data[:]).decode('utf-8', errors='replace')
+
+    def close(self) -> None:
+        """
+        Releases the memory mapping. On Windows, the file cannot be overwritten while it is mapped.
+        """
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+            self._data = b""
+            self._starts = np.zeros(1, dtype=np.int64)
+            self._ends = np.zeros(1, dtype=np.int64)
+
+
+class TranscriptViewer(tk.Frame):
+    """
+    Text view which only renders the lines on screen, with an edit mode for changing the transcript.
+
+    The transcript stays in a memory-mapped TranscriptFile and the text widget holds just the
+    visible lines, so multi-megabyte transcripts open and scroll as fast as short ones. If the
+    word timings of the transcript (its .mtr sidecar) are available, the view can jump to a
+    time in the recording; it can always jump to the next turn of a speaker. **Edit** loads the
+    whole transcript into the text widget, and **Done** keeps the edited text in memory.
+    """
+
+    def __init__(self, parent, height: int = 20, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.transcript = TranscriptFile(b"")
+        self.timings = None
+        self.sidecar_path = None
+        self.top = 0
+        self.current = -1
+        self.editing = False
+
+        controls = tk.Frame(self)
+        controls.pack(side=tk.BOTTOM, fill=tk.X)
+        tk.Label(controls, text="Time (h:mm:ss):").pack(side=tk.LEFT)
+        self.time_entry = tk.Entry(controls, width=10)
+        self.time_entry.pack(side=tk.LEFT)
+        self.time_entry.bind("<Return>", lambda event: self.jump_to_time_entry())
+        self.time_button = tk.Button(controls, text="Go", command=self.jump_to_time_entry)
+        self.time_button.pack(side=tk.LEFT, padx=5)
+        tk.Label(controls, text="Speaker:").pack(side=tk.LEFT)
+        self.speaker_box = ttk.Combobox(controls, width=16)
+        self.speaker_box.pack(side=tk.LEFT)
+        self.turn_button = tk.Button(controls, text="Next Turn", command=self.jump_to_speaker_entry)
+        self.turn_button.pack(side=tk.LEFT, padx=5)
+        self.edit_button = tk.Button(controls, text="Edit", command=lambda: self.set_editing(not self.editing))
+        self.edit_button.pack(side=tk.LEFT, padx=5)
+        self.position_label = tk.Label(controls, text="")
+        self.position_label.pack(side=tk.RIGHT)
+
+        self.text = tk.Text(self, height=height, wrap=tk.WORD, state=tk.DISABLED)
+        self.text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.text.tag_configure("target", background="yellow")
+        self.line_height = max(tkfont.Font(font=self.text.cget("font")).metrics("linespace"), 1)
+        self.scrollbar = tk.Scrollbar(self, command=self._on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.text.bind("<Configure>", lambda event: self.render())
+        self.text.bind("<MouseWheel>", lambda event: self.scroll(-1 if event.delta > 0 else 1, "units", 3))
+        self.text.bind("<Button-4>", lambda event: self.scroll(-1, "units", 3))
+        self.text.bind("<Button-5>", lambda event: self.scroll(1, "units", 3))
+        self.text.bind("<Up>", lambda event: self.scroll(-1, "units"))
+        self.text.bind("<Down>", lambda event: self.scroll(1, "units"))
+        self.text.bind("<Prior>", lambda event: self.scroll(-1, "pages"))
+        self.text.bind("<Next>", lambda event: self.scroll(1, "pages"))
+        self.bind("<Destroy>", self._on_destroy)
+        self._update_controls()
+
+    def load_file(self, file_path: str, sidecar_path: str = None) -> None:
+        """
+        Shows a transcript file. The word timings are read from sidecar_path, or from the .mtr file
+        next to the transcript if there is one.
+        """
+        self._set_transcript(TranscriptFile.open(file_path),
+                             sidecar_path or os.path.splitext(file_path)[0] + ".mtr")
+
+    def load_text(self, text: str, sidecar_path: str = None) -> None:
+        """
+        Shows a transcript held in memory.
+        """
+        self._set_transcript(TranscriptFile.from_text(text), sidecar_path)
+
+    def get_text(self) -> str:
+        if self.editing:
+            return self.text.get("1.0", "end-1c")
+        return self.transcript.text()
+
+    def set_editing(self, editing: bool, keep_edits: bool = True) -> None:
+        """
+        Switches between viewing and editing the transcript.
+
+        Editing inserts the whole transcript into the text widget, which is slow for multi-hour
+        sessions, so it only happens on demand. Leaving edit mode keeps the edited text unless
+        keep_edits is False, and goes back to rendering only the visible lines.
+        """
+        if editing == self.editing:
+            return
+        if editing:
+            self.text.config(state=tk.NORMAL, yscrollcommand=self.scrollbar.set)
+            self.text.delete("1.0", tk.END)
+            self.text.insert(tk.END, self.transcript.text())
+            self.text.yview(f"{self.top + 1}.0")
+            self.scrollbar.config(command=self.text.yview)
+            self.editing = True
+        else:
+            if keep_edits:
+                top = int(self.text.index("@0,0").split(".")[0]) - 1
+                text = self.get_text()
+            self.editing = False
+            self.text.config(state=tk.DISABLED, yscrollcommand="")
+            self.scrollbar.config(command=self._on_scrollbar)
+            if keep_edits:
+                self._set_transcript(TranscriptFile.from_text(text), self.sidecar_path)
+                self.top = top
+        self.edit_button.config(text="Done" if self.editing else "Edit")
+        self._update_controls()
+        self.render()
+
+    def clear(self) -> None:
+        self._set_transcript(TranscriptFile(b""), None)
+
+    def close(self) -> None:
+        """
+        Closes the transcript file, so it can be overwritten. The viewer is empty afterwards.
+        """
+        self.set_editing(False, keep_edits=False)
+        self.transcript.close()
+        self.transcript = TranscriptFile(b"")
+
+    def _on_destroy(self, event) -> None:
+        if event.widget is self:
+            # The text widget may already be gone, so edits are dropped without touching it
+            self.editing = False
+            self.close()
+
+    def _set_transcript(self, transcript: TranscriptFile, sidecar_path: str) -> None:
+        # A newly loaded transcript replaces any unfinished edits
+        self.set_editing(False, keep_edits=False)
+        self.transcript.close()
+        self.transcript = transcript
+        self.sidecar_path = sidecar_path
+        self.timings = None
+        if sidecar_path is not None and os.path.exists(sidecar_path):
+            try:
+                self.timings = CompactTranscript.load(sidecar_path)
+            except Exception as e:
+                logging.warning(f"Could not load word timings from {sidecar_path}: {e}")
+        if self.timings is not None and len(self.timings) != len(self.transcript):
+            logging.warning(f"{sidecar_path} has {len(self.timings)} segments for {len(self.transcript)} lines - "
+                            "the transcript was edited, so jumps to a time are approximate")
+        self.top = 0
+        self.current = -1
+        self._update_controls()
+        self.render()
+
+    def _update_controls(self) -> None:
+        # Jumps move the rendered lines, so they wait until editing is done
+        self.time_button.config(state=tk.NORMAL if self.timings is not None and not self.editing else tk.DISABLED)
+        self.turn_button.config(state=tk.DISABLED if self.editing else tk.NORMAL)
+        self.speaker_box.config(values=list(self.timings.speakers) if self.timings is not None else self.transcript.speakers())
+
+    def visible_lines(self) -> int:
+        return max(self.text.winfo_height() // self.line_height, 1)
+
+    def render(self, target: int = None) -> None:
+        """
+        Fills the text widget with the lines from self.top, highlighting the target line if given.
+        """
+        if self.editing:
+            return
+        page = self.visible_lines()
+        self.top = max(min(self.top, len(self.transcript) - page), 0)
+        lines = self.transcript.lines(self.top, page + RENDER_MARGIN)
+
+        self.text.config(state=tk.NORMAL)
+        self.text.delete("1.0", tk.END)
+        self.text.insert(tk.END, "\n".join(lines))
+        if target is not None and self.top <= target < self.top + len(lines):
+            row = target - self.top + 1
+            self.text.tag_add("target", f"{row}.0", f"{row}.end")
+        self.text.config(state=tk.DISABLED)
+
+        total = max(len(self.transcript), 1)
+        self.scrollbar.set(self.top / total, min(self.top + page, total) / total)
+        self.position_label.config(text=f"Line {self.top + 1 if len(self.transcript) else 0} of {len(self.transcript)}")
+
+    def scroll(self, number: int, what: str = "units", step: int = 1) -> str:
+        if self.editing:
+            # Let the text widget scroll and move its cursor itself
+            return None
+        lines = number * (self.visible_lines() if what == "pages" else step)
+        self.top += lines
+        self.render()
+        return "break"
+
+    def _on_scrollbar(self, *args) -> None:
+        if args[0] == "moveto":
+            self.top = int(float(args[1]) * len(self.transcript))
+            self.render()
+        elif args[0] == "scroll":
+            self.scroll(int(args[1]), args[2])
+
+    def jump_to_line(self, line: int) -> None:
+        # Show the line a few rows from the top, so the context before it is visible
+        self.current = line
+        self.top = max(line - 2, 0)
+        self.render(target=line)
+
+    def jump_to_time(self, seconds: float) -> None:
+        if self.timings is None:
+            return
+        line = self.timings.segment_at(seconds)
+        self.jump_to_line(min(line, len(self.transcript) - 1))
+
+    def jump_to_time_entry(self) -> None:
+        try:
+            seconds = 0.0
+            for part in self.time_entry.get().strip().split(":"):
+                seconds = seconds * 60 + float(part)
+        except ValueError:
+            messagebox.showerror("Invalid Time", "Please enter a time as h:mm:ss, m:ss or seconds.", parent=self)
+            return
+        self.jump_to_time(seconds)
+
+    def jump_to_speaker(self, speaker: str) -> None:
+        """
+        Jumps to the next line of the speaker after the last jump, wrapping around at the end.
+        """
+        line = self.transcript.find_line(speaker + ":", self.current)
+        if line is None:
+            messagebox.showinfo("Speaker Not Found", f"{speaker} does not speak in this transcript.", parent=self)
+            return
+        self.jump_to_line(line)
+
+    def jump_to_speaker_entry(self) -> None:
+        speaker = self.speaker_box.get().strip()
+        if speaker:
+            self.jump_to_speaker(speaker)
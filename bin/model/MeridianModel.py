@@ -1,37 +1,109 @@
-from bin.transcription.LocalTranscription import LocalTranscription
-from bin.transcription.RemoteTranscription import RemoteTranscription
-
-import os
 import json
-from llama_index.core import SimpleDirectoryReader, VectorStoreIndex, StorageContext, load_index_from_storage
+import logging
+import os
 import random
 import string
+import time
+
+from llama_index.core import Document, VectorStoreIndex, StorageContext, load_index_from_storage
+from llama_index.core.storage.docstore.utils import doc_to_json, json_to_doc
+
+# Sessions added to the campaign since the last full save, one JSON line each with their embedded nodes
+DELTA_LOG = "campaign_delta.jsonl"
+
+# The full index is written again, and the delta log emptied, after this many added sessions
+COMPACT_EVERY = 50
 
 
 class MeridianModel:
+    """
+    The campaign: every saved session in a vector index, persisted in persist_dir.
+
+    Adding a session embeds only that session and inserts its nodes into the loaded index. Instead
+    of writing the whole index again, the new nodes and their embeddings are appended to a delta
+    log, so saving costs the same whether the campaign has ten sessions or a thousand. Loading
+    replays the log on top of the last full save without embedding anything again. Every
+    COMPACT_EVERY sessions, and on save_session(), the full index is written and the log emptied.
+    """
 
-    def __init__(self, persist_dir:str = "./data"):
-        
+    def __init__(self, persist_dir:str = "./data", embed_model=None, compact_every:int = COMPACT_EVERY):
+        """
+        Initializes a new instance of the MeridianModel class.
+
+        Args:
+            persist_dir (str, optional): Where the campaign is stored. Defaults to "./data".
+            embed_model (BaseEmbedding, optional): The embedding model. Defaults to llama_index's Settings.
+            compact_every (int, optional): Sessions added between full saves. Defaults to COMPACT_EVERY.
+        """
         self.index = None
         self.persist_dir = persist_dir
+        self.embed_model = embed_model
+        self.compact_every = compact_every
+        self.pending_deltas = 0
 
-    def save_session(self) -> None:
+    @property
+    def delta_path(self) -> str:
+        return os.path.join(self.persist_dir, DELTA_LOG)
 
-        # Implement the save_session function here
+    def save_session(self) -> None:
+        """
+        Writes the full index and empties the delta log.
+        """
+        if self.index is None:
+            return
+        os.makedirs(self.persist_dir, exist_ok=True)
         self.index.storage_context.persist(persist_dir=self.persist_dir)
+        # Only empty the log once the full index is written - replaying it twice is harmless
+        with open(self.delta_path, 'w'):
+            pass
+        self.pending_deltas = 0
 
     def load_campaign(self, file_path=None) -> None:
-        # Implement the load_progress function here
-        
+        """
+        Loads the campaign in file_path (or persist_dir), and makes it the campaign sessions are added to.
+        """
         if file_path is None:
             file_path = self.persist_dir
-            
-        storage_context = StorageContext.from_defaults(persist_dir=file_path)
-        self.index = load_index_from_storage(storage_context)
+        self.persist_dir = file_path
+
+        if os.path.exists(os.path.join(file_path, "docstore.json")):
+            storage_context = StorageContext.from_defaults(persist_dir=file_path)
+            self.index = load_index_from_storage(storage_context, embed_model=self.embed_model)
+        else:
+            self.index = VectorStoreIndex(nodes=[], embed_model=self.embed_model)
+        self.pending_deltas = self._replay_deltas()
+
+    def _replay_deltas(self) -> int:
+        # Insert the sessions added since the last full save, with the embeddings stored in the log
+        if not os.path.exists(self.delta_path):
+            return 0
+        lines = []
+        skipped = False
+        with open(self.delta_path, 'r') as file:
+            for line_number, line in enumerate(file, 1):
+                try:
+                    delta = json.loads(line)
+                except json.JSONDecodeError:
+                    # A save interrupted while appending leaves a partial last line
+                    logging.warning(f"Skipping unreadable line {line_number} of {self.delta_path}")
+                    skipped = True
+                    continue
+                self.index.insert_nodes([json_to_doc(node) for node in delta["nodes"]])
+                self.index.docstore.set_document_hash(delta["doc_id"], delta["doc_hash"])
+                lines.append(line if line.endswith("\n") else line + "\n")
+        if skipped:
+            # Drop the unreadable lines so later sessions are not appended to a partial one
+            with open(self.delta_path, 'w') as file:
+                file.writelines(lines)
+        replayed = len(lines)
+        if replayed:
+            logging.info(f"Replayed {replayed} sessions from {self.delta_path}")
+        return replayed
 
     def save_to_campaign(self, data) -> None:
-        
-        # Implement the save_to_campaign function here
+        """
+        Adds a session to the campaign, embedding only its text.
+        """
         def generate_random_filename(length):
             letters_and_digits = string.ascii_letters + string.digits
             while True:
@@ -39,15 +111,88 @@ class MeridianModel:
                 if not os.path.exists(os.path.join(self.persist_dir, filename)):
                     return filename
 
-        # Make filenames unique and 10 characters long  
+        if self.index is None:
+            self.load_campaign(self.persist_dir)
+
+        # Make filenames unique and 10 characters long
+        os.makedirs(self.persist_dir, exist_ok=True)
         filename = generate_random_filename(10)
         with open(os.path.join(self.persist_dir, filename), 'w') as file:
             file.write(data)
-            
-        # Reload the campaign
-        self.load_campaign(self.persist_dir)
-        
-        # Save the new index
-        self.save_session()
+
+        document = Document(text=data, id_=filename)
+        self.index.insert(document)
+
+        # The vector store holds the embeddings, the docstore the nodes without them
+        node_ids = self.index.docstore.get_ref_doc_info(filename).node_ids
+        nodes = []
+        for node in self.index.docstore.get_nodes(node_ids):
+            node.embedding = self.index.vector_store.get(node.node_id)
+            nodes.append(doc_to_json(node))
+        with open(self.delta_path, 'a') as file:
+            file.write(json.dumps({"doc_id": filename, "doc_hash": document.hash, "nodes": nodes}) + "\n")
+        self.pending_deltas += 1
+
+        if self.pending_deltas >= self.compact_every:
+            logging.info(f"Compacting the campaign in {self.persist_dir} after {self.pending_deltas} sessions")
+            self.save_session()
+
+
+def benchmark(num_sessions: int = 300, session_words: int = 1500, compact_every: int = COMPACT_EVERY) -> dict:
+    """
+    Times adding num_sessions synthetic sessions to a new campaign, incrementally and by writing
+    the full index after every session as before, with a mock embedding model.
+    """
+    import tempfile
+    import statistics
+    from llama_index.core import MockEmbedding
+
+    words = ["dragon", "tavern", "sword", "wizard", "goblin", "castle", "quest", "gold", "spell", "party"]
+    embed_model = MockEmbedding(embed_dim=768)
+
+    def session_text(number):
+        rng = random.Random(number)
+        return f"Session {number}. " + " ".join(rng.choice(words) for _ in range(session_words))
+
+    def block_medians(timings):
+        # Median latency of each block of compact_every sessions
+        return [round(statistics.median(timings[i:i + compact_every]) * 1000, 2)
+                for i in range(0, len(timings), compact_every)]
+
+    with tempfile.TemporaryDirectory() as incremental_dir, tempfile.TemporaryDirectory() as full_dir:
+        model = MeridianModel(incremental_dir, embed_model=embed_model, compact_every=compact_every)
+        incremental, compactions = [], []
+        for number in range(num_sessions):
+            start_time = time.perf_counter()
+            model.save_to_campaign(session_text(number))
+            elapsed = time.perf_counter() - start_time
+            (compactions if model.pending_deltas == 0 else incremental).append(elapsed)
+
+        start_time = time.perf_counter()
+        reloaded = MeridianModel(incremental_dir, embed_model=embed_model)
+        reloaded.load_campaign()
+        load_time = time.perf_counter() - start_time
+        assert len(reloaded.index.docstore.docs) == len(model.index.docstore.docs)
+
+        index = VectorStoreIndex(nodes=[], embed_model=embed_model)
+        full = []
+        for number in range(num_sessions):
+            start_time = time.perf_counter()
+            index.insert(Document(text=session_text(number)))
+            index.storage_context.persist(persist_dir=full_dir)
+            full.append(time.perf_counter() - start_time)
+
+    report = {
+        "sessions": num_sessions,
+        "incremental_ms_per_block": block_medians(incremental),
+        "compaction_ms": [round(t * 1000, 2) for t in compactions],
+        "full_persist_ms_per_block": block_medians(full),
+        "load_seconds": round(load_time, 3),
+    }
+    logging.info(f"Campaign save benchmark: {report}")
+    return report
 
 
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    print(benchmark())
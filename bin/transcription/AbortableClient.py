@@ -0,0 +1,66 @@
+import socket
+import threading
+
+import ollama
+
+
+class AbortableClient(ollama.Client):
+    """
+    An ollama client whose requests can be aborted from another thread.
+
+    Closing a streamed response only takes effect once ollama sends its next piece, and ollama sends
+    nothing while it is evaluating the prompt. abort() shuts down the client's connections instead,
+    which wakes the thread waiting on them at once and lets ollama see the closed connection and stop.
+    Every client opens its own connections, so use a new client for each request that may be aborted.
+    """
+
+    def __init__(self, host: str = None, **kwargs):
+        """
+        Initializes a new instance of the AbortableClient class.
+
+        Args:
+            host (str, optional): The ollama server. Defaults to OLLAMA_HOST or the local server.
+            **kwargs: Passed on to the httpx client.
+        """
+        self._sockets = []
+        self._lock = threading.Lock()
+        self.aborted = False
+        super().__init__(host, event_hooks={"request": [self._trace_request]}, **kwargs)
+
+    def _trace_request(self, request) -> None:
+        # httpcore reports every connection it opens for the request to its trace extension
+        request.extensions["trace"] = self._trace
+
+    def _trace(self, event: str, info: dict) -> None:
+        if event != "connection.connect_tcp.complete":
+            return
+        sock = info["return_value"].get_extra_info("socket")
+        with self._lock:
+            self._sockets.append(sock)
+            aborted = self.aborted
+        if aborted:
+            # Aborted while the connection was being opened
+            self._shutdown(sock)
+
+    @staticmethod
+    def _shutdown(sock) -> None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def abort(self) -> None:
+        """
+        Shuts down every connection of the client, failing the requests waiting on them.
+        """
+        with self._lock:
+            self.aborted = True
+            sockets = list(self._sockets)
+        for sock in sockets:
+            self._shutdown(sock)
+
+    def close(self) -> None:
+        """
+        Closes the client's connections.
+        """
+        self._client.close()
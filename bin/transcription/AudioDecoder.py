@@ -0,0 +1,399 @@
+import json
+import logging
+import os
+import struct
+import subprocess
+import time
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+# Bytes per 16-bit PCM sample
+SAMPLE_WIDTH = 2
+
+# Largest file accepted by the whisper API
+MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+
+# Container that an audio stream is copied into without re-encoding, by codec. Every one of them is
+# a file type the whisper API accepts; other codecs are re-encoded to Opus.
+COPY_CONTAINERS = {
+    "aac": ".m4a",
+    "alac": ".m4a",
+    "mp3": ".mp3",
+    "mp2": ".mp3",
+    "opus": ".ogg",
+    "vorbis": ".ogg",
+    "flac": ".flac",
+    "pcm_s16le": ".wav",
+    "pcm_s24le": ".wav",
+    "pcm_f32le": ".wav",
+}
+
+
+def get_audio_duration(file_path: str) -> float:
+    """
+    Returns the duration of an audio file in seconds using ffprobe.
+    """
+    command = [
+        'ffprobe',
+        '-v', 'error',
+        '-show_entries', 'format=duration',
+        '-of', 'default=noprint_wrappers=1:nokey=1',
+        file_path
+    ]
+    output = subprocess.run(command, capture_output=True, check=True).stdout
+    return float(output.decode().strip())
+
+
+def find_pcm_data(file_path: str, sr: int = SAMPLE_RATE):
+    """
+    Returns the (offset, length) of the sample data if the file is a 16-bit mono WAV at the given rate.
+
+    Returns:
+        tuple: Byte offset and length of the data chunk, or None if the file must be decoded by ffmpeg.
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            header = f.read(12)
+            if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+                return None
+
+            format_ok = False
+            while True:
+                chunk = f.read(8)
+                if len(chunk) < 8:
+                    return None
+                chunk_id, chunk_size = struct.unpack('<4sI', chunk)
+                if chunk_id == b'fmt ':
+                    fmt = f.read(chunk_size + chunk_size % 2)
+                    audio_format, channels, rate, _, _, bits = struct.unpack('<HHIIHH', fmt[:16])
+                    format_ok = audio_format == 1 and channels == 1 and rate == sr and bits == 16
+                elif chunk_id == b'data':
+                    if not format_ok:
+                        return None
+                    # Streamed WAVs may leave the size unset, so trust the file length over the header
+                    available = os.path.getsize(file_path) - f.tell()
+                    length = min(chunk_size, available) if chunk_size else available
+                    return f.tell(), length - length % SAMPLE_WIDTH
+                else:
+                    f.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+    except OSError:
+        return None
+
+
+class AudioDecoder:
+    """
+    Decodes audio files to 16 kHz mono float32 PCM, the input format of every local model.
+
+    Files which are already 16 kHz mono 16-bit WAV are memory-mapped instead of decoded. Everything
+    else is streamed from an ffmpeg pipe straight into preallocated buffers, so no intermediate audio
+    file is ever written and no extra copy of the raw bytes is held.
+    """
+
+    def __init__(self, file_path: str, sr: int = SAMPLE_RATE):
+        """
+        Initializes a new instance of the AudioDecoder class.
+
+        Args:
+            file_path (str): The path to the audio file.
+            sr (int, optional): The sample rate to decode to. Defaults to 16 kHz.
+        """
+        self.file_path = file_path
+        self.sr = sr
+        self._pcm = find_pcm_data(file_path, sr)
+        self._duration = None
+
+    @property
+    def is_native(self) -> bool:
+        """
+        True if the file is memory-mapped rather than decoded.
+        """
+        return self._pcm is not None
+
+    @property
+    def duration(self) -> float:
+        if self._duration is None:
+            if self._pcm is not None:
+                self._duration = self._pcm[1] / SAMPLE_WIDTH / self.sr
+            else:
+                self._duration = get_audio_duration(self.file_path)
+        return self._duration
+
+    def _mapped(self) -> np.ndarray:
+        offset, length = self._pcm
+        return np.memmap(self.file_path, dtype='<i2', mode='r', offset=offset, shape=(length // SAMPLE_WIDTH,))
+
+    def _open_pipe(self, start: float = 0.0, duration: float = None) -> subprocess.Popen:
+        command = ['ffmpeg', '-nostdin', '-threads', '0']
+        if start > 0:
+            command += ['-ss', f'{start:.3f}']       # Seek before opening the input so earlier audio is skipped
+        if duration is not None:
+            command += ['-t', f'{duration:.3f}']
+        command += ['-i', self.file_path, '-f', 's16le', '-ac', '1', '-acodec', 'pcm_s16le', '-ar', str(self.sr), '-loglevel', 'error', '-']
+        return subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    @staticmethod
+    def _close_pipe(process: subprocess.Popen, description: str) -> None:
+        process.stdout.close()
+        stderr = process.stderr.read()
+        process.stderr.close()
+        if process.wait() != 0:
+            raise RuntimeError(f"Failed to decode {description}: {stderr.decode(errors='replace')}")
+
+    @staticmethod
+    def _read_into(process: subprocess.Popen, buffer: np.ndarray) -> int:
+        # Fill the int16 buffer from the pipe and return the number of whole samples read
+        view = memoryview(buffer).cast('B')
+        filled = 0
+        while filled < len(view):
+            count = process.stdout.readinto(view[filled:])
+            if not count:
+                break
+            filled += count
+        return filled // SAMPLE_WIDTH
+
+    def load(self) -> np.ndarray:
+        """
+        Decodes the whole file.
+
+        Returns:
+            np.ndarray: The samples, as float32 scaled to [-1, 1].
+        """
+        start_time = time.time()
+        if self._pcm is not None:
+            audio = self._mapped().astype(np.float32) / 32768.0
+            logging.info(f"Memory-mapped {self.file_path} ({len(audio) / self.sr:.1f} seconds) in {(time.time() - start_time):.3f} seconds")
+            return audio
+
+        # Size the buffer from the container's duration and grow it if the estimate is short
+        buffer = np.empty(int(self.duration * self.sr) + self.sr, dtype=np.int16)
+        process = self._open_pipe()
+        filled = 0
+        try:
+            while True:
+                filled += self._read_into(process, buffer[filled:])
+                if filled < len(buffer):
+                    break
+                buffer = np.resize(buffer, len(buffer) * 2)
+        finally:
+            self._close_pipe(process, self.file_path)
+
+        audio = np.empty(filled, dtype=np.float32)
+        np.multiply(buffer[:filled], 1 / 32768.0, out=audio, casting='unsafe')
+        logging.info(f"Decoded {self.file_path} ({filled / self.sr:.1f} seconds) in {(time.time() - start_time):.3f} seconds")
+        return audio
+
+    def window(self, start: float, duration: float) -> np.ndarray:
+        """
+        Decodes a single window of the file without reading the rest of it.
+
+        Args:
+            start (float): Offset of the window in seconds.
+            duration (float): Length of the window in seconds.
+
+        Returns:
+            np.ndarray: The samples of the window, as float32 scaled to [-1, 1].
+        """
+        if self._pcm is not None:
+            mapped = self._mapped()
+            first = int(start * self.sr)
+            return mapped[first:first + int(duration * self.sr)].astype(np.float32) / 32768.0
+
+        buffer = np.empty(int(np.ceil(duration * self.sr)), dtype=np.int16)
+        process = self._open_pipe(start, duration)
+        try:
+            filled = self._read_into(process, buffer)
+        finally:
+            self._close_pipe(process, f"audio window {start:.1f}-{start + duration:.1f}s of {self.file_path}")
+        return buffer[:filled].astype(np.float32) / 32768.0
+
+    def iter_chunks(self, chunk_seconds: float = 30.0, start: float = 0.0, duration: float = None):
+        """
+        Yields the audio in consecutive chunks, decoding only one chunk ahead.
+
+        The same output buffer is reused for every chunk, so a caller which keeps a chunk after
+        asking for the next one must copy it.
+
+        Args:
+            chunk_seconds (float, optional): The length of each chunk. Defaults to 30.
+            start (float, optional): Where to start, in seconds. Defaults to 0.
+            duration (float, optional): How much audio to read. Defaults to the rest of the file.
+
+        Yields:
+            np.ndarray: float32 samples scaled to [-1, 1]; the last chunk may be shorter.
+        """
+        chunk_size = int(chunk_seconds * self.sr)
+        output = np.empty(chunk_size, dtype=np.float32)
+
+        if self._pcm is not None:
+            mapped = self._mapped()
+            first = int(start * self.sr)
+            last = len(mapped) if duration is None else min(len(mapped), first + int(duration * self.sr))
+            for offset in range(first, last, chunk_size):
+                piece = mapped[offset:min(offset + chunk_size, last)]
+                np.multiply(piece, 1 / 32768.0, out=output[:len(piece)], casting='unsafe')
+                yield output[:len(piece)]
+            return
+
+        buffer = np.empty(chunk_size, dtype=np.int16)
+        process = self._open_pipe(start, duration)
+        finished = False
+        try:
+            while True:
+                filled = self._read_into(process, buffer)
+                if filled == 0:
+                    break
+                np.multiply(buffer[:filled], 1 / 32768.0, out=output[:filled], casting='unsafe')
+                yield output[:filled]
+                if filled < chunk_size:
+                    break
+            finished = True
+        finally:
+            if finished:
+                self._close_pipe(process, self.file_path)
+            else:
+                # The caller stopped early, so ffmpeg is stopped rather than waited on
+                process.kill()
+                process.stdout.close()
+                process.stderr.close()
+                process.wait()
+
+
+def load_audio(file_path: str, sr: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    Decodes a whole audio file to mono float32 PCM. Drop-in replacement for whisperx.load_audio.
+    """
+    return AudioDecoder(file_path, sr).load()
+
+
+def probe_audio(file_path: str) -> dict:
+    """
+    Returns the duration in seconds, the bit rate in bits per second and the codec of the first audio
+    stream of a file.
+    """
+    command = [
+        'ffprobe',
+        '-v', 'error',
+        '-select_streams', 'a:0',
+        '-show_entries', 'format=duration,bit_rate:stream=codec_name,bit_rate',
+        '-of', 'json',
+        file_path
+    ]
+    output = json.loads(subprocess.run(command, capture_output=True, check=True).stdout)
+    streams = output.get("streams") or [{}]
+    duration = float(output["format"]["duration"])
+    # Prefer the audio stream's own bit rate, since the container's includes any video
+    bit_rate = streams[0].get("bit_rate")
+    if bit_rate in (None, "N/A"):
+        bit_rate = output["format"].get("bit_rate")
+    # Some containers don't report a bit rate, so fall back to the average over the file
+    bit_rate = float(bit_rate) if bit_rate not in (None, "N/A") else os.path.getsize(file_path) * 8 / max(duration, 1e-6)
+    return {"duration": duration, "bit_rate": bit_rate, "codec": streams[0].get("codec_name")}
+
+
+def detect_silences(file_path: str, noise_db: float = -35.0, min_silence: float = 0.5) -> list:
+    """
+    Returns the (start, end) of every silence in an audio file, found with ffmpeg's silencedetect filter.
+    """
+    command = [
+        'ffmpeg',
+        '-nostdin',
+        '-i', file_path,
+        '-vn',
+        '-af', f'silencedetect=noise={noise_db}dB:d={min_silence}',
+        '-f', 'null',
+        '-'
+    ]
+    output = subprocess.run(command, capture_output=True, check=True).stderr.decode(errors='replace')
+    silences = []
+    start = None
+    for line in output.splitlines():
+        if "silence_start:" in line:
+            start = float(line.split("silence_start:")[1].split()[0])
+        elif "silence_end:" in line and start is not None:
+            silences.append((start, float(line.split("silence_end:")[1].split()[0])))
+            start = None
+    return silences
+
+
+def plan_cuts(duration: float, max_seconds: float, silences: list = None, search_seconds: float = 60.0) -> list:
+    """
+    Chooses where to cut a recording so that no segment is longer than max_seconds.
+
+    Each cut is placed in the middle of the latest silence within search_seconds before the limit,
+    so words are not split between segments. Where there is no such silence the cut falls on the limit.
+
+    Returns:
+        list: The cut times in seconds, in order.
+    """
+    midpoints = sorted((start + end) / 2 for start, end in silences or [])
+    cuts = []
+    position = 0.0
+    while duration - position > max_seconds:
+        limit = position + max_seconds
+        candidates = [point for point in midpoints if max(position, limit - search_seconds) < point <= limit]
+        position = candidates[-1] if candidates else limit
+        cuts.append(position)
+    return cuts
+
+
+def split_audio(file_path: str, output_dir: str, max_bytes: int = MAX_UPLOAD_BYTES, reencode: bool = False,
+                opus_bitrate: int = 24000) -> list:
+    """
+    Splits an audio file into segments which each stay under an upload size limit, cutting at silences.
+
+    Segment lengths are worked out from the bit rate of the output, with a safety margin for container
+    overhead. Only the first audio stream is kept. Without reencode it is copied into a container that
+    matches its codec, otherwise (or when no such container is accepted for upload) it is re-encoded to
+    mono Opus at opus_bitrate, which is usually far smaller than the source.
+
+    Args:
+        file_path (str): The path to the audio file.
+        output_dir (str): The directory the segments are written to.
+        max_bytes (int, optional): The largest allowed segment. Defaults to the 25 MB whisper API limit.
+        reencode (bool, optional): Re-encode to low bit rate mono Opus. Defaults to False.
+        opus_bitrate (int, optional): The Opus bit rate in bits per second. Defaults to 24000.
+
+    Returns:
+        list: The paths of the segments, in order.
+    """
+    info = probe_audio(file_path)
+    if not reencode and info["codec"] not in COPY_CONTAINERS:
+        logging.info(f"Cannot copy {info['codec']} audio into an uploadable container - re-encoding {file_path} to Opus")
+        reencode = True
+    bit_rate = opus_bitrate if reencode else info["bit_rate"]
+    max_seconds = max_bytes * 0.9 * 8 / bit_rate
+
+    cuts = []
+    if info["duration"] > max_seconds:
+        start_time = time.time()
+        cuts = plan_cuts(info["duration"], max_seconds, detect_silences(file_path), search_seconds=min(60.0, max_seconds / 4))
+        logging.info(f"Planned {len(cuts) + 1} segments of at most {max_seconds:.0f} seconds in {(time.time() - start_time):.3f} seconds")
+
+    # The segment muxer picks the container from the extension, so it follows the audio codec rather
+    # than the input's name - an .mp4 or .webm input keeps its audio but not its video
+    extension = ".ogg" if reencode else COPY_CONTAINERS[info["codec"]]
+    codec = ['-ac', '1', '-c:a', 'libopus', '-b:a', str(opus_bitrate)] if reencode else ['-c:a', 'copy']
+    segment_list = os.path.join(output_dir, "segments.txt")
+    command = [
+        'ffmpeg',
+        '-nostdin',
+        '-loglevel', 'error',
+        '-i', file_path,                            # Input file
+        '-map', '0:a:0',                            # Only the first audio stream, no video or subtitles
+        *codec,
+        '-f', 'segment',                            # Use the segment muxer
+        '-segment_list', segment_list,              # Record exactly which files were written
+        '-segment_list_type', 'flat',
+    ]
+    if cuts:
+        command += ['-segment_times', ",".join(f"{cut:.3f}" for cut in cuts)]
+    else:
+        command += ['-segment_time', str(info["duration"] + 1)]
+    command.append(os.path.join(output_dir, f'segment_%03d{extension}'))
+    logging.info("Running ffmpeg command: %s", command)
+    subprocess.run(command, check=True)
+
+    with open(segment_list, 'r') as f:
+        return [os.path.join(output_dir, line.strip()) for line in f if line.strip()]
@@ -0,0 +1,214 @@
+import logging
+from collections import Counter
+
+import numpy as np
+
+from bin.transcription.AudioDecoder import SAMPLE_RATE, AudioDecoder
+
+
+def load_audio_window(file_path: str, start: float, duration: float, sr: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    Decodes a single window of an audio file to mono float32 PCM without reading the rest of the file.
+
+    Args:
+        file_path (str): The path to the audio file.
+        start (float): Offset of the window in seconds.
+        duration (float): Length of the window in seconds.
+        sr (int, optional): Sample rate to resample to. Defaults to 16 kHz.
+
+    Returns:
+        np.ndarray: The samples of the window, scaled to [-1, 1].
+    """
+    return AudioDecoder(file_path, sr).window(start, duration)
+
+
+def plan_windows(duration: float, window_seconds: float, overlap_seconds: float) -> list:
+    """
+    Splits the timeline [0, duration) into overlapping (start, end) windows.
+    """
+    if overlap_seconds >= window_seconds:
+        raise ValueError("Window overlap must be smaller than the window length.")
+
+    windows = []
+    start = 0.0
+    step = window_seconds - overlap_seconds
+    while True:
+        end = min(start + window_seconds, duration)
+        windows.append((start, end))
+        if end >= duration:
+            break
+        start += step
+    return windows
+
+
+def commit_boundaries(windows: list) -> list:
+    """
+    Returns, for each window, the time up to which its output is kept.
+
+    Output of neighbouring windows is cut in the middle of their overlap, where both windows have
+    the most context on either side.
+    """
+    boundaries = []
+    for i in range(len(windows) - 1):
+        boundaries.append((windows[i + 1][0] + windows[i][1]) / 2)
+    boundaries.append(float("inf"))
+    return boundaries
+
+
+def shift_segments(segments: list, offset: float) -> list:
+    """
+    Moves segment and word timestamps from window-relative to absolute time, in place.
+    """
+    for segment in segments:
+        for item in [segment] + segment.get("words", []):
+            if "start" in item:
+                item["start"] += offset
+            if "end" in item:
+                item["end"] += offset
+    return segments
+
+
+def clip_segments(segments: list, lower: float, upper: float) -> list:
+    """
+    Keeps the words which start in [lower, upper), splitting segments that straddle either bound.
+
+    Words without timestamps inherit the start of the preceding word, so they stay with their neighbours.
+    """
+    clipped = []
+    for segment in segments:
+        words = segment.get("words")
+        if not words:
+            if lower <= segment["start"] < upper:
+                clipped.append(segment)
+            continue
+
+        kept = []
+        last_start = segment["start"]
+        for word in words:
+            last_start = word.get("start", last_start)
+            if lower <= last_start < upper:
+                kept.append(word)
+
+        if not kept:
+            continue
+        if len(kept) == len(words):
+            clipped.append(segment)
+            continue
+
+        timed = [word for word in kept if "start" in word]
+        new_segment = dict(segment)
+        new_segment["words"] = kept
+        new_segment["text"] = " ".join(word["word"] for word in kept)
+        if timed:
+            new_segment["start"] = timed[0]["start"]
+            new_segment["end"] = timed[-1]["end"]
+        speakers = Counter(word["speaker"] for word in kept if "speaker" in word)
+        if speakers:
+            new_segment["speaker"] = speakers.most_common(1)[0][0]
+        clipped.append(new_segment)
+
+    return clipped
+
+
+class SpeakerTracker:
+    """
+    Maps the speaker labels of independently diarized windows onto one set of session-wide labels.
+
+    Each window's speakers are matched to the known speakers by cosine similarity of their
+    embedding centroids. Unmatched speakers become new speakers until max_speakers is reached.
+    """
+
+    def __init__(self, max_speakers: int = None, similarity_threshold: float = 0.5):
+        self._max_speakers = max_speakers
+        self._threshold = similarity_threshold
+        self._centroids = []
+        self._weights = []
+
+    @property
+    def num_speakers(self) -> int:
+        return len(self._centroids)
+
+    def get_state(self) -> dict:
+        return {
+            "centroids": [centroid.tolist() for centroid in self._centroids],
+            "weights": list(self._weights),
+        }
+
+    def set_state(self, state: dict) -> None:
+        self._centroids = [np.asarray(centroid, dtype=np.float32) for centroid in state["centroids"]]
+        self._weights = list(state["weights"])
+
+    @staticmethod
+    def label(index: int) -> str:
+        return f"SPEAKER_{index:02d}"
+
+    def map_labels(self, labels: list, embeddings, durations: dict = None) -> dict:
+        """
+        Returns a dictionary from the window's local labels to session-wide labels.
+
+        Args:
+            labels (list): Local speaker labels, in the order of the embedding rows.
+            embeddings (np.ndarray): Centroid embedding of each local speaker, or None if unavailable.
+            durations (dict, optional): Speaking time per local label, used to weigh centroid updates.
+        """
+        if embeddings is None:
+            logging.warning("No speaker embeddings available - speaker labels may not match across windows")
+            return {label: label for label in labels}
+
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        durations = durations or {}
+        mapping = {}
+
+        # Score every (local, global) pair and match greedily from the most similar pair down
+        pairs = []
+        for i, label in enumerate(labels):
+            if not np.all(np.isfinite(embeddings[i])):
+                continue
+            for j, centroid in enumerate(self._centroids):
+                pairs.append((self._similarity(embeddings[i], centroid), i, j))
+        pairs.sort(reverse=True)
+
+        matched_global = set()
+        for similarity, i, j in pairs:
+            if labels[i] in mapping or j in matched_global or similarity < self._threshold:
+                continue
+            mapping[labels[i]] = j
+            matched_global.add(j)
+
+        for i, label in enumerate(labels):
+            if label in mapping:
+                continue
+            finite = np.all(np.isfinite(embeddings[i]))
+            if finite and (self._max_speakers is None or len(self._centroids) < self._max_speakers):
+                self._centroids.append(np.zeros_like(embeddings[i]))
+                self._weights.append(0.0)
+                mapping[label] = len(self._centroids) - 1
+            elif finite and self._centroids:
+                # Out of speakers - fall back to the most similar known speaker
+                mapping[label] = max(range(len(self._centroids)),
+                                     key=lambda j: self._similarity(embeddings[i], self._centroids[j]))
+            elif self._centroids:
+                mapping[label] = 0
+            else:
+                self._centroids.append(np.zeros(embeddings.shape[1], dtype=np.float32))
+                self._weights.append(0.0)
+                mapping[label] = 0
+
+        # Fold this window's centroids into the running session centroids
+        for i, label in enumerate(labels):
+            if not np.all(np.isfinite(embeddings[i])):
+                continue
+            j = mapping[label]
+            weight = max(durations.get(label, 1.0), 1e-3)
+            total = self._weights[j] + weight
+            self._centroids[j] = (self._centroids[j] * self._weights[j] + embeddings[i] * weight) / total
+            self._weights[j] = total
+
+        return {label: self.label(index) for label, index in mapping.items()}
+
+    @staticmethod
+    def _similarity(a, b) -> float:
+        norm = np.linalg.norm(a) * np.linalg.norm(b)
+        if norm == 0:
+            return -1.0
+        return float(np.dot(a, b) / norm)
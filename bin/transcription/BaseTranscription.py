@@ -1,5 +1,10 @@
 import logging
 
+from bin.transcription.PromptChunker import PromptChunker, TokenCounter
+from bin.transcription.StagePipeline import PipelineCancelled
+from bin.transcription.SummarizationEngine import SummarizationEngine
+from bin.transcription.SummaryCache import SummaryCache
+
 class BaseTranscription:
     
     """
@@ -39,7 +44,23 @@ class BaseTranscription:
             'content' : r"No question has been provided - please inform the user of this."  
         }
         
-        self.chat_responses = None
+        self.conversation = None # ConversationMemory of the analyze chat
+
+        # Summarization settings, set by each backend to match its model
+        self._summary_model = None
+        self._summary_system_prompt = "You are an assistant trying to help summarize a text"
+        self._summary_template = "{text}"
+        self._summary_context_tokens = 8192
+        self._summary_output_tokens = 1024
+        self._summary_concurrency = 4
+        self._summary_fan_in = 4
+        self._token_counter = None
+        self._summary_cache = SummaryCache()
+        self.last_summary_report = None
+
+        # Set by a job runner to follow and cancel a transcription
+        self.progress_callback = None
+        self.cancel_event = None
         
     @property
     def system_instructions(self):
@@ -65,6 +86,25 @@ class BaseTranscription:
         return f"The data to analyze is below:\n{context}\n\n The question is:\n{question}"
         
 
+    def report_progress(self, stage: str, state: str, percent: float = None) -> None:
+        """
+        Passes a progress event to progress_callback, if one is set.
+
+        Args:
+            stage (str): The name of the stage, e.g. "decode" or "transcription".
+            state (str): "started", "progress", "finished" or "failed".
+            percent (float, optional): How much of the stage is done, for "progress" events.
+        """
+        if self.progress_callback is not None:
+            self.progress_callback({"stage": stage, "state": state, "percent": percent})
+
+    def check_cancelled(self, stage: str = None) -> None:
+        """
+        Raises PipelineCancelled if cancel_event is set.
+        """
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise PipelineCancelled(f"Cancelled before {stage}" if stage else "Cancelled")
+
     def transcribe_audio(self, file_path) -> str:
         """
         Transcribes the audio file located at the specified file path.
@@ -77,26 +117,95 @@ class BaseTranscription:
         """
         raise NotImplementedError("The transcribe_audio method must be implemented in a derived class.")
 
-    def summarize_text(self, transcription) -> str:
+    def transcribe_audio_stream(self, file_path, num_speakers=4, window_seconds=600, overlap_seconds=30, resume=False):
+        """
+        Transcribes the audio file, yielding its lines. Backends which cannot transcribe in windows
+        transcribe the whole file first, ignoring the window settings.
+
+        Yields:
+            str: Transcribed lines.
+        """
+        transcription = self.transcribe_audio(file_path)
+        if transcription:
+            yield from transcription.splitlines()
+
+    def complete(self, system_prompt, prompt) -> str:
+        """
+        Sends a single prompt to the text model and returns its answer.
+
+        Args:
+            system_prompt (str): The system prompt.
+            prompt (str): The user prompt.
+
+        Returns:
+            str: The answer of the model.
+        """
+        raise NotImplementedError("The complete method must be implemented in a derived class.")
+
+    def get_summarization_engine(self) -> SummarizationEngine:
+        """
+        Returns a summarization engine sized for this backend's text model.
+        """
+        if self._token_counter is None:
+            self._token_counter = TokenCounter(self._summary_model)
+        chunker = PromptChunker(self._token_counter, self._summary_context_tokens, self._summary_system_prompt,
+                                self._summary_template, self._summary_output_tokens)
+        cache_params = {
+            "model": self._summary_model,
+            "context_tokens": self._summary_context_tokens,
+            "output_tokens": self._summary_output_tokens,
+        }
+        return SummarizationEngine(self.complete, chunker, self._summary_system_prompt, self._summary_template,
+                                   max_concurrency=self._summary_concurrency, fan_in=self._summary_fan_in,
+                                   cache=self._summary_cache, cache_params=cache_params)
+
+    def get_summary_stats(self) -> dict:
+        """
+        Returns the summary cache hits, misses and hit rate of the last summarization.
+        """
+        return self._summary_cache.get_stats()
+
+    def summarize_text(self, transcription, on_partial=None) -> str:
         """
         Summarizes the transcription of a session.
 
+        The transcription is split into chunks that fill the model's context, the chunks are
+        summarized concurrently and the summaries are merged in a tree until one summary is left.
+        Every call is memoized, so summarizing an edited transcript again only redoes the calls
+        whose input changed.
+
         Args:
-            transcription (str): The transcription of the session.
+            transcription (str or list): The transcription of the session, as a string or a list of lines.
+            on_partial (callable, optional): Called with each partial summary as soon as it is ready,
+                see SummarizationEngine.stream.
 
         Returns:
-            str: The summarized version of the transcription.
+            str: The summarized version of the transcription, or None if summarization failed.
         """
-        
-        raise NotImplementedError("The summarize_text method must be implemented in a derived class.")
+        if isinstance(transcription, list):
+            transcription = "\n".join(transcription)
+
+        engine = self.get_summarization_engine()
+        self._summary_cache.reset_stats()
+        try:
+            return engine.summarize(transcription, on_partial)
+        except Exception as e:
+            logging.error(f"Summarization failed: {e}")
+            return None
+        finally:
+            self.last_summary_report = engine.report
+            self._summary_cache.log_stats()
     
-    def ask_question(self, question, source_info) -> str:
+    def ask_question(self, question, source_info, num_ctx=None, on_token=None, cancel=None) -> str:
         """
         Answers a question about a session.
 
         Args:
             question (str): The question to be answered.
             source_info (str): Information about the session.
+            num_ctx (int, optional): The context size of the model, or None to size it from the prompt.
+            on_token (callable, optional): Called with every piece of the answer as it is generated.
+            cancel (threading.Event, optional): Stops the generation once set.
 
         Returns:
             str: The answer to the question.
@@ -104,8 +213,29 @@ class BaseTranscription:
         
         raise NotImplementedError("The ask_question method must be implemented in a derived class.")
     
+    def pin_session(self) -> None:
+        """
+        Keeps the text model ready for the questions of an analyze session, where the backend supports it.
+        """
+        pass
+
+    def unpin_session(self) -> None:
+        """
+        Ends what pin_session started.
+        """
+        pass
+
+    def get_conversation_stats(self) -> dict:
+        """
+        Returns the history size and prompt tokens of the current conversation, or None if there is none.
+        """
+        if self.conversation is None:
+            return None
+        return self.conversation.get_stats()
+
     def clear_chat_responses(self):
         
         logging.info("Clearing chat responses...")
-        logging.debug(f"Chat responses before clearing:\n\n {self.chat_responses}")
-        self.chat_responses = None
+        if self.conversation is not None:
+            logging.debug(f"Conversation before clearing:\n\n {self.conversation.get_stats()}")
+        self.conversation = None
@@ -0,0 +1,268 @@
+import json
+import struct
+
+import numpy as np
+
+MAGIC = b"MTRN"
+VERSION = 1
+ALIGNMENT = 64
+UNKNOWN_SPEAKER = -1
+
+# Name and dtype of every column stored in the file
+WORD_COLUMNS = [
+    ("word_start", np.float32),
+    ("word_end", np.float32),
+    ("word_score", np.float32),
+    ("word_speaker", np.int16),
+    ("word_text", np.int32),
+]
+SEGMENT_COLUMNS = [
+    ("segment_start", np.float32),
+    ("segment_end", np.float32),
+    ("segment_speaker", np.int16),
+    ("segment_text", np.int32),
+    ("segment_word_offset", np.int32),
+]
+POOL_COLUMNS = [
+    ("pool_offset", np.int64),
+    ("pool_data", np.uint8),
+]
+
+
+class StringPool:
+    """
+    Interned strings stored as one UTF-8 blob plus an offset array.
+    """
+
+    def __init__(self, offsets: np.ndarray = None, data: np.ndarray = None):
+        self.offsets = offsets
+        self.data = data
+        self._decoded = {}
+        self._ids = {}
+        self._strings = []
+
+    def intern(self, text: str) -> int:
+        if text not in self._ids:
+            self._ids[text] = len(self._strings)
+            self._strings.append(text)
+        return self._ids[text]
+
+    def freeze(self) -> None:
+        encoded = [text.encode('utf-8') for text in self._strings]
+        self.offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum([len(item) for item in encoded])
+        self.data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        self._ids = {}
+        self._strings = []
+
+    def __getitem__(self, index: int) -> str:
+        index = int(index)
+        text = self._decoded.get(index)
+        if text is None:
+            text = bytes(self.data[self.offsets[index]:self.offsets[index + 1]]).decode('utf-8')
+            self._decoded[index] = text
+        return text
+
+
+class CompactTranscript:
+    """
+    Columnar transcript: parallel NumPy arrays for word timings, scores and speakers plus an interned string pool.
+
+    Transcripts save to a binary file that loads by memory-mapping, so opening a long session costs
+    almost nothing until words are read. Slices by time range or speaker share the parent's arrays,
+    and lines are rendered to the "SPEAKER: text" format only when they are iterated.
+    """
+
+    def __init__(self, columns: dict, pool: StringPool, speakers: list, segment_ids: np.ndarray = None):
+        self._columns = columns
+        self._pool = pool
+        self.speakers = speakers
+        num_segments = len(columns["segment_start"])
+        self._segment_ids = np.arange(num_segments) if segment_ids is None else segment_ids
+
+    @classmethod
+    def from_result(cls, result: dict) -> "CompactTranscript":
+        """
+        Builds a transcript from a whisperx result with speaker labels.
+        """
+        pool = StringPool()
+        speakers = []
+        speaker_ids = {}
+
+        def speaker_id(label):
+            if label is None:
+                return UNKNOWN_SPEAKER
+            if label not in speaker_ids:
+                speaker_ids[label] = len(speakers)
+                speakers.append(label)
+            return speaker_ids[label]
+
+        segment_rows = []
+        word_rows = []
+        for segment in result["segments"]:
+            words = segment.get("words") or [{"word": segment["text"].strip(), "start": segment["start"], "end": segment["end"]}]
+            segment_rows.append((segment["start"], segment["end"], speaker_id(segment.get("speaker")),
+                                 pool.intern(segment["text"]), len(word_rows)))
+            for word in words:
+                word_rows.append((word.get("start", np.nan), word.get("end", np.nan), word.get("score", np.nan),
+                                  speaker_id(word.get("speaker")), pool.intern(word["word"])))
+        pool.freeze()
+
+        columns = {}
+        for index, (name, dtype) in enumerate(WORD_COLUMNS):
+            columns[name] = np.array([row[index] for row in word_rows], dtype=dtype)
+        for index, (name, dtype) in enumerate(SEGMENT_COLUMNS[:-1]):
+            columns[name] = np.array([row[index] for row in segment_rows], dtype=dtype)
+        columns["segment_word_offset"] = np.array([row[4] for row in segment_rows] + [len(word_rows)], dtype=np.int32)
+
+        return cls(columns, pool, speakers)
+
+    def save(self, file_path: str) -> None:
+        """
+        Writes the transcript (or slice) to a binary file which can be loaded with load().
+        """
+        transcript = self if len(self._segment_ids) == len(self._columns["segment_start"]) else self._materialize()
+        columns = dict(transcript._columns)
+        columns["pool_offset"] = transcript._pool.offsets
+        columns["pool_data"] = transcript._pool.data
+
+        layout = {}
+        offset = 0
+        for name, dtype in WORD_COLUMNS + SEGMENT_COLUMNS + POOL_COLUMNS:
+            array = np.ascontiguousarray(columns[name], dtype=dtype)
+            columns[name] = array
+            layout[name] = {"offset": offset, "count": len(array), "dtype": np.dtype(dtype).str}
+            offset += _aligned(array.nbytes)
+
+        header = json.dumps({"speakers": transcript.speakers, "columns": layout}).encode('utf-8')
+        prefix_size = _aligned(len(MAGIC) + 8 + len(header))
+
+        with open(file_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<II", VERSION, len(header)))
+            f.write(header)
+            f.write(b"\0" * (prefix_size - len(MAGIC) - 8 - len(header)))
+            for name, _ in WORD_COLUMNS + SEGMENT_COLUMNS + POOL_COLUMNS:
+                data = columns[name].tobytes()
+                f.write(data)
+                f.write(b"\0" * (_aligned(len(data)) - len(data)))
+
+    @classmethod
+    def load(cls, file_path: str) -> "CompactTranscript":
+        """
+        Memory-maps a transcript saved with save(). The arrays are read-only views into the file.
+        """
+        mapped = np.memmap(file_path, dtype=np.uint8, mode='r')
+        if bytes(mapped[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{file_path} is not a compact transcript file")
+        version, header_size = struct.unpack("<II", bytes(mapped[len(MAGIC):len(MAGIC) + 8]))
+        if version != VERSION:
+            raise ValueError(f"Unsupported compact transcript version {version} in {file_path}")
+
+        header = json.loads(bytes(mapped[len(MAGIC) + 8:len(MAGIC) + 8 + header_size]).decode('utf-8'))
+        base = _aligned(len(MAGIC) + 8 + header_size)
+        columns = {}
+        for name, info in header["columns"].items():
+            columns[name] = np.frombuffer(mapped, dtype=np.dtype(info["dtype"]), count=info["count"],
+                                          offset=base + info["offset"])
+
+        pool = StringPool(columns.pop("pool_offset"), columns.pop("pool_data"))
+        return cls(columns, pool, header["speakers"])
+
+    def __len__(self) -> int:
+        return len(self._segment_ids)
+
+    @property
+    def num_words(self) -> int:
+        offsets = self._columns["segment_word_offset"]
+        return int(np.sum(offsets[self._segment_ids + 1] - offsets[self._segment_ids]))
+
+    @property
+    def start_times(self) -> np.ndarray:
+        return self._columns["segment_start"][self._segment_ids]
+
+    def speaker_label(self, speaker_id: int) -> str:
+        return None if speaker_id == UNKNOWN_SPEAKER else self.speakers[speaker_id]
+
+    def time_slice(self, start: float, end: float) -> "CompactTranscript":
+        """
+        Returns the segments which overlap [start, end). Segments are assumed to be in time order.
+        """
+        segment_start = self._columns["segment_start"]
+        segment_end = self._columns["segment_end"]
+        first = np.searchsorted(segment_start[self._segment_ids], end, side='left')
+        ids = self._segment_ids[:first]
+        ids = ids[segment_end[ids] > start]
+        return CompactTranscript(self._columns, self._pool, self.speakers, ids)
+
+    def speaker_slice(self, speaker: str) -> "CompactTranscript":
+        """
+        Returns the segments spoken by the given speaker.
+        """
+        speaker_id = self.speakers.index(speaker) if speaker in self.speakers else None
+        if speaker_id is None:
+            ids = self._segment_ids[:0]
+        else:
+            ids = self._segment_ids[self._columns["segment_speaker"][self._segment_ids] == speaker_id]
+        return CompactTranscript(self._columns, self._pool, self.speakers, ids)
+
+    def segment_at(self, time: float) -> int:
+        """
+        Returns the position (within this transcript) of the last segment starting at or before time.
+        """
+        position = np.searchsorted(self.start_times, time, side='right') - 1
+        return int(max(position, 0))
+
+    def words(self, position: int) -> list:
+        """
+        Returns the words of a segment as dictionaries in the whisperx format.
+        """
+        segment = self._segment_ids[position]
+        offsets = self._columns["segment_word_offset"]
+        words = []
+        for i in range(offsets[segment], offsets[segment + 1]):
+            word = {"word": self._pool[self._columns["word_text"][i]]}
+            for key in ("start", "end", "score"):
+                value = self._columns[f"word_{key}"][i]
+                if not np.isnan(value):
+                    word[key] = float(value)
+            speaker = self.speaker_label(self._columns["word_speaker"][i])
+            if speaker is not None:
+                word["speaker"] = speaker
+            words.append(word)
+        return words
+
+    def iter_lines(self):
+        """
+        Yields the transcript one "SPEAKER: text" line per segment.
+        """
+        for segment in self._segment_ids:
+            text = self._pool[self._columns["segment_text"][segment]]
+            speaker = self.speaker_label(self._columns["segment_speaker"][segment])
+            if speaker is None:
+                yield "Unknown speaker: " + text
+            else:
+                yield speaker + ": " + text
+
+    def __iter__(self):
+        return self.iter_lines()
+
+    def __str__(self) -> str:
+        return "\n".join(self.iter_lines())
+
+    def _materialize(self) -> "CompactTranscript":
+        # Copy the selected segments into standalone arrays, e.g. before saving a slice
+        segments = []
+        for position, segment in enumerate(self._segment_ids):
+            segments.append({
+                "start": float(self._columns["segment_start"][segment]),
+                "end": float(self._columns["segment_end"][segment]),
+                "text": self._pool[self._columns["segment_text"][segment]],
+                "speaker": self.speaker_label(self._columns["segment_speaker"][segment]),
+                "words": self.words(position),
+            })
+        return CompactTranscript.from_result({"segments": segments})
+
+
+def _aligned(size: int) -> int:
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
@@ -0,0 +1,186 @@
+import logging
+import threading
+
+# Tokens the chat template adds around every message
+MESSAGE_TOKENS = 4
+
+# Requested context sizes are rounded up to a multiple of this
+CONTEXT_STEP = 512
+
+SUMMARY_PROMPT = """Update the summary of a conversation about a Dungeons & Dragons session with the exchanges below.
+Keep every fact, name and answer the user may ask about again, and leave out greetings and repetition.
+
+SUMMARY SO FAR:
+
+{summary}
+
+EXCHANGES:
+
+{exchanges}
+"""
+
+
+class ConversationMemory:
+    """
+    The chat history of one analyze session, kept within a token budget.
+
+    Every turn is stored as one question and one answer message. The prefix (the system prompt and
+    the transcript) is sent first with every question, followed by a summary of the oldest turns
+    and then the most recent turns verbatim. Once the turns outgrow the history budget, the oldest
+    ones are folded into the summary on a background thread, so the user does not wait for it.
+    Until that finishes, turns that do not fit are left out of the prompt.
+    """
+
+    def __init__(self, counter, prefix: list, summarize=None, history_tokens: int = 2048,
+                 output_tokens: int = 1024, keep_turns: int = 2):
+        """
+        Initializes a new instance of the ConversationMemory class.
+
+        Args:
+            counter (TokenCounter): Counts the tokens of the chat model.
+            prefix (list): The messages sent first with every question.
+            summarize (callable, optional): Called as summarize(prompt) and returns the updated summary.
+                Without it, the oldest turns are dropped instead.
+            history_tokens (int, optional): The most tokens of summary and turns sent per question. Defaults to 2048.
+            output_tokens (int, optional): Tokens kept free for the answer. Defaults to 1024.
+            keep_turns (int, optional): The most recent turns which are never summarized. Defaults to 2.
+        """
+        self.counter = counter
+        self.prefix = prefix
+        self._summarize = summarize
+        self.history_tokens = history_tokens
+        self.output_tokens = output_tokens
+        self.keep_turns = keep_turns
+        self.summary = ""
+        self.turns = []
+        self.summarized_turns = 0
+        self.last_prompt_tokens = 0
+        self._lock = threading.Lock()
+        self._compactor = None
+
+    def count_messages(self, messages: list) -> int:
+        return sum(self.counter.count(message["content"]) + MESSAGE_TOKENS for message in messages)
+
+    @property
+    def prefix_tokens(self) -> int:
+        return self.count_messages(self.prefix)
+
+    @staticmethod
+    def _turn_messages(question: str, answer: str) -> list:
+        return [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+
+    def history(self) -> list:
+        """
+        Returns the summary and the most recent turns that fit in the history budget.
+        """
+        with self._lock:
+            summary = self.summary
+            turns = list(self.turns)
+
+        messages = []
+        used = 0
+        if summary:
+            messages.append({"role": "user", "content": f"Summary of the earlier conversation:\n\n{summary}"})
+            used = self.count_messages(messages)
+
+        recent = []
+        for question, answer in reversed(turns):
+            turn = self._turn_messages(question, answer)
+            tokens = self.count_messages(turn)
+            if used + tokens > self.history_tokens:
+                break
+            recent[:0] = turn
+            used += tokens
+        return messages + recent
+
+    def history_size(self) -> int:
+        """
+        Returns the tokens of every turn and the summary, whether or not they fit in the budget.
+        """
+        with self._lock:
+            messages = [{"role": "user", "content": self.summary}] if self.summary else []
+            for question, answer in self.turns:
+                messages.extend(self._turn_messages(question, answer))
+        return self.count_messages(messages)
+
+    def messages(self, question: str) -> list:
+        """
+        Returns the messages to send for a new question.
+        """
+        messages = self.prefix + self.history() + [{"role": "user", "content": question}]
+        self.last_prompt_tokens = self.count_messages(messages)
+        return messages
+
+    def context_tokens(self) -> int:
+        """
+        Returns the context size needed for the last prompt and its answer, rounded up to CONTEXT_STEP.
+        """
+        needed = self.last_prompt_tokens + self.output_tokens
+        return -(-needed // CONTEXT_STEP) * CONTEXT_STEP
+
+    def fit(self, num_ctx: int, history_tokens: int) -> None:
+        """
+        Limits the history to what is left of a context of num_ctx tokens after the prefix and the answer.
+        """
+        self.history_tokens = max(min(history_tokens, num_ctx - self.prefix_tokens - self.output_tokens), 0)
+
+    def add_turn(self, question: str, answer: str) -> None:
+        """
+        Stores a finished turn and starts folding old turns into the summary if the history is over budget.
+        """
+        with self._lock:
+            self.turns.append((question, answer))
+        if self.history_size() > self.history_tokens and (self._compactor is None or not self._compactor.is_alive()):
+            self._compactor = threading.Thread(target=self._compact, name="conversation-summary", daemon=True)
+            self._compactor.start()
+
+    def _compact(self) -> None:
+        # Fold the oldest turns into the summary until the rest fit in half the budget
+        with self._lock:
+            turns = list(self.turns)
+            summary = self.summary
+        folded = 0
+        remaining = self.count_messages([{"role": "user", "content": summary}] if summary else [])
+        remaining += sum(self.count_messages(self._turn_messages(*turn)) for turn in turns)
+        while folded < len(turns) - self.keep_turns and remaining > self.history_tokens // 2:
+            remaining -= self.count_messages(self._turn_messages(*turns[folded]))
+            folded += 1
+        if folded == 0:
+            return
+
+        exchanges = "\n\n".join(f"QUESTION: {question}\nANSWER: {answer}" for question, answer in turns[:folded])
+        try:
+            if self._summarize is None:
+                raise RuntimeError("no summarizer")
+            summary = self._summarize(SUMMARY_PROMPT.format(summary=summary or "(none)", exchanges=exchanges))
+        except Exception as e:
+            logging.warning(f"Could not summarize {folded} conversation turns, dropping them: {e}")
+
+        with self._lock:
+            self.summary = summary
+            del self.turns[:folded]
+            self.summarized_turns += folded
+        logging.info(f"Folded {folded} conversation turns into the summary - {self.history_size()} history tokens left")
+
+    def wait(self) -> None:
+        """
+        Waits for a running summary of old turns to finish.
+        """
+        if self._compactor is not None:
+            self._compactor.join()
+
+    def get_stats(self) -> dict:
+        """
+        Returns the size of the history and of the last prompt, and the context size it needs.
+        """
+        with self._lock:
+            turns = len(self.turns)
+        return {
+            "turns": turns,
+            "summarized_turns": self.summarized_turns,
+            "history_tokens": self.history_size(),
+            "history_budget": self.history_tokens,
+            "prefix_tokens": self.prefix_tokens,
+            "prompt_tokens": self.last_prompt_tokens,
+            "context_tokens": self.context_tokens(),
+        }
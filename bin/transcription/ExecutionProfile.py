@@ -0,0 +1,236 @@
+import json
+import logging
+import os
+import platform
+import time
+
+import numpy as np
+import torch
+
+from bin.transcription.AudioWindowing import SAMPLE_RATE
+from bin.transcription.ResultCache import atomic_write_json
+
+PROFILE_VERSION = 1
+
+# Whisper processes audio in chunks of this many seconds
+CHUNK_SECONDS = 30
+
+# Settings tried during calibration, per device
+CANDIDATES = {
+    "cuda": {"audio_model": "medium.en", "compute_types": ["float16", "int8_float16"], "batch_sizes": [8, 16, 32]},
+    "cpu": {"audio_model": "small.en", "compute_types": ["int8", "float32"], "batch_sizes": [2, 4, 8]},
+}
+
+
+def synthetic_clip(seconds: float, sr: int = SAMPLE_RATE, seed: int = 0) -> np.ndarray:
+    """
+    Returns a speech-like test signal: voiced harmonics with a moving pitch, gated into syllables.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sr)) / sr
+    pitch = 140 + 40 * np.sin(2 * np.pi * 0.3 * t) + 15 * np.sin(2 * np.pi * 2.1 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sr
+    # Harmonics weighted around typical vowel formants
+    signal = sum(np.sin(k * phase) / k * (1 + 2 * np.exp(-((k * 140 - 700) / 300) ** 2)) for k in range(1, 20))
+    syllables = np.clip(np.sin(2 * np.pi * 4 * t), 0, None) ** 0.5
+    pauses = (np.sin(2 * np.pi * 0.2 * t) > -0.7).astype(np.float64)
+    audio = signal * syllables * pauses + 0.01 * rng.standard_normal(len(t))
+    return (0.3 * audio / np.max(np.abs(audio))).astype(np.float32)
+
+
+def host_info() -> dict:
+    """
+    Returns the hardware a profile was calibrated on.
+    """
+    info = {"hostname": platform.node(), "cpu_count": os.cpu_count(), "gpu": None}
+    if torch.cuda.is_available():
+        info["gpu"] = torch.cuda.get_device_name(0)
+    return info
+
+
+class ExecutionProfile:
+    """
+    Device, compute type, batch size and thread counts that run fastest on this host.
+
+    A profile is found once by calibrate(), which times short runs of the models on a synthetic
+    clip, and is saved per host so later runs start with the tuned settings.
+    """
+
+    def __init__(self, device: str, audio_model: str, compute_type: str, batch_size: int, asr_threads: int,
+                 torch_threads: int, host: dict = None, timings: dict = None):
+        """
+        Initializes a new instance of the ExecutionProfile class.
+
+        Args:
+            device (str): "cuda" or "cpu".
+            audio_model (str): The whisper model to load.
+            compute_type (str): The CTranslate2 compute type of the whisper model.
+            batch_size (int): The transcription batch size.
+            asr_threads (int): CTranslate2 CPU threads of the whisper model.
+            torch_threads (int): Torch intra-op threads, used by alignment and diarization.
+            host (dict, optional): The hardware the profile was calibrated on.
+            timings (dict, optional): The calibration measurements, in seconds.
+        """
+        self.device = device
+        self.audio_model = audio_model
+        self.compute_type = compute_type
+        self.batch_size = batch_size
+        self.asr_threads = asr_threads
+        self.torch_threads = torch_threads
+        self.host = host or host_info()
+        self.timings = timings or {}
+
+    @staticmethod
+    def default_path(profile_dir: str = "./cache/profiles") -> str:
+        return os.path.join(profile_dir, f"{platform.node() or 'default'}.json")
+
+    def to_dict(self) -> dict:
+        return {
+            "version": PROFILE_VERSION,
+            "device": self.device,
+            "audio_model": self.audio_model,
+            "compute_type": self.compute_type,
+            "batch_size": self.batch_size,
+            "asr_threads": self.asr_threads,
+            "torch_threads": self.torch_threads,
+            "host": self.host,
+            "timings": self.timings,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ExecutionProfile":
+        return cls(data["device"], data["audio_model"], data["compute_type"], data["batch_size"],
+                   data["asr_threads"], data["torch_threads"], data.get("host"), data.get("timings"))
+
+    def save(self, file_path: str = None) -> None:
+        atomic_write_json(file_path or self.default_path(), self.to_dict())
+
+    @classmethod
+    def load(cls, file_path: str = None) -> "ExecutionProfile":
+        """
+        Returns the saved profile, or None if there is none or it was calibrated on different hardware.
+        """
+        file_path = file_path or cls.default_path()
+        try:
+            with open(file_path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if data.get("version") != PROFILE_VERSION or data.get("host") != host_info():
+            logging.info(f"Ignoring execution profile {file_path} - it was made for different hardware or an older version")
+            return None
+        return cls.from_dict(data)
+
+    @classmethod
+    def load_or_calibrate(cls, file_path: str = None, recalibrate: bool = False) -> "ExecutionProfile":
+        """
+        Returns the saved profile of this host, calibrating and saving a new one if needed.
+        """
+        profile = None if recalibrate else cls.load(file_path)
+        if profile is None:
+            profile = cls.calibrate()
+            profile.save(file_path)
+        logging.info(f"Execution profile: {profile}")
+        return profile
+
+    def apply(self) -> None:
+        """
+        Sizes the torch thread pool used by alignment and diarization.
+        """
+        torch.set_num_threads(self.torch_threads)
+
+    def __str__(self) -> str:
+        return (f"{self.audio_model} on {self.device} ({self.compute_type}), batch size {self.batch_size}, "
+                f"{self.asr_threads} ASR threads, {self.torch_threads} torch threads")
+
+    @classmethod
+    def calibrate(cls, device: str = None) -> "ExecutionProfile":
+        """
+        Times the candidate settings on a synthetic clip and returns the fastest combination.
+
+        The search is greedy to keep calibration short: compute type first, then ASR threads (CPU
+        only), then batch size, and finally torch threads for alignment. The clip is fed straight
+        to the whisper model so voice activity detection cannot skip any of it.
+        """
+        import whisperx as whisper
+
+        start_time = time.time()
+        device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        candidates = CANDIDATES[device]
+        cores = os.cpu_count() or 1
+        batch_sizes = candidates["batch_sizes"]
+        middle_batch = batch_sizes[len(batch_sizes) // 2]
+        clip = synthetic_clip(CHUNK_SECONDS * max(batch_sizes))
+        timings = {"compute_type": {}, "asr_threads": {}, "batch_size": {}, "torch_threads": {}}
+
+        def time_asr(compute_type, threads, batch_size):
+            try:
+                model = whisper.load_model(whisper_arch=candidates["audio_model"], device=device,
+                                           compute_type=compute_type, language="en", threads=threads)
+            except ValueError as e:
+                # Not every compute type is supported by every device
+                logging.info(f"Skipping compute type {compute_type}: {e}")
+                return float("inf")
+            try:
+                _run_asr(model, clip[:CHUNK_SECONDS * SAMPLE_RATE], 1)   # Warm up
+                run_start = time.time()
+                _run_asr(model, clip, batch_size)
+                return time.time() - run_start
+            finally:
+                del model
+                if device == "cuda":
+                    torch.cuda.empty_cache()
+
+        default_threads = cores if device == "cpu" else 4
+        for compute_type in candidates["compute_types"]:
+            timings["compute_type"][compute_type] = time_asr(compute_type, default_threads, middle_batch)
+        compute_type = min(timings["compute_type"], key=timings["compute_type"].get)
+
+        asr_threads = default_threads
+        if device == "cpu":
+            for threads in sorted({max(1, cores // 2), cores}):
+                timings["asr_threads"][threads] = (timings["compute_type"][compute_type] if threads == default_threads
+                                                   else time_asr(compute_type, threads, middle_batch))
+            asr_threads = min(timings["asr_threads"], key=timings["asr_threads"].get)
+
+        for batch_size in batch_sizes:
+            timings["batch_size"][batch_size] = (timings["compute_type"][compute_type]
+                                                 if batch_size == middle_batch and asr_threads == default_threads
+                                                 else time_asr(compute_type, asr_threads, batch_size))
+        batch_size = min(timings["batch_size"], key=timings["batch_size"].get)
+
+        model_a, metadata = whisper.load_align_model(language_code="en", device=device)
+        align_clip = clip[:CHUNK_SECONDS * SAMPLE_RATE]
+        segments = [{"start": 0.0, "end": float(CHUNK_SECONDS), "text": " ".join(["calibration"] * 60)}]
+        for threads in sorted({max(1, cores // 4), max(1, cores // 2), cores}):
+            torch.set_num_threads(threads)
+            run_start = time.time()
+            whisper.align(segments, model_a, metadata, align_clip, device, return_char_alignments=False)
+            timings["torch_threads"][threads] = time.time() - run_start
+        torch_threads = min(timings["torch_threads"], key=timings["torch_threads"].get)
+        del model_a
+
+        timings["total"] = time.time() - start_time
+        profile = cls(device, candidates["audio_model"], compute_type, batch_size, asr_threads, torch_threads,
+                      timings=timings)
+        logging.info(f"Calibrated execution profile in {timings['total']:.1f} seconds: {profile}")
+        return profile
+
+
+def _run_asr(model, audio: np.ndarray, batch_size: int) -> None:
+    # Feed fixed 30 second chunks straight to the batched pipeline, bypassing voice activity detection
+    chunk = CHUNK_SECONDS * SAMPLE_RATE
+
+    def data():
+        for start in range(0, len(audio), chunk):
+            yield {'inputs': audio[start:start + chunk]}
+
+    for _ in model(data(), batch_size=batch_size, num_workers=0):
+        pass
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    profile = ExecutionProfile.load_or_calibrate(recalibrate=True)
+    print(json.dumps(profile.to_dict(), indent=2))
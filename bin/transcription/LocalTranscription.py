@@ -1,14 +1,57 @@
 import logging
 import time
 import whisperx as whisper
+import faster_whisper.tokenizer
+from whisperx.vad import merge_chunks
 import ollama
-import json
 import torch
 import os
+import queue
+import pandas as pd
+from bin.transcription.AbortableClient import AbortableClient
 from bin.transcription.BaseTranscription import BaseTranscription
-from pydub import AudioSegment
+from bin.transcription.PromptChunker import TokenCounter
+from bin.transcription.ConversationMemory import ConversationMemory
+from bin.transcription.ModelRegistry import ModelRegistry
+from bin.transcription.StagePipeline import PipelineCancelled, StagePipeline, StageReport
+from bin.transcription.ResultCache import ResultCache
+from bin.transcription.TranscriptionCheckpoint import TranscriptionCheckpoint
+from bin.transcription.SpeechTimeline import SpeechTimeline
+from bin.transcription.SpeakerAssignment import assign_word_speakers
+from bin.transcription.CompactTranscript import CompactTranscript
+from bin.transcription.ShardedTranscription import ShardedTranscription
+from bin.transcription.ExecutionProfile import ExecutionProfile
+from bin.transcription.AudioDecoder import get_audio_duration, load_audio
+from bin.transcription.TranscriptRetriever import TranscriptRetriever
+from bin.transcription.AudioWindowing import SAMPLE_RATE, SpeakerTracker, clip_segments, commit_boundaries, load_audio_window, plan_windows, shift_segments
 from pyannote.audio import Pipeline
 import torch
+import threading
+
+# Model used by whisperx.DiarizationPipeline
+DIARIZATION_MODEL = "pyannote/speaker-diarization-3.1"
+
+# Context window requested from ollama for summaries, and the part of it kept for the answer
+SUMMARY_CONTEXT_TOKENS = 8192
+SUMMARY_OUTPUT_TOKENS = 1024
+
+# Analyze chat: the largest context requested, the history kept verbatim and the room for each answer
+MAX_CHAT_CONTEXT_TOKENS = 16384
+CHAT_HISTORY_TOKENS = 2048
+CHAT_OUTPUT_TOKENS = 1024
+
+# How long ollama keeps the text model loaded once an analyze session is over
+DEFAULT_KEEP_ALIVE = "5m"
+
+# How often a streamed answer checks its cancel event while waiting for the next token
+CANCEL_POLL_SECONDS = 0.1
+
+# Returned in place of a transcription when it fails
+TRANSCRIPTION_ERROR = "Could not transcribe audio. Please try again."
+
+# How many segments are aligned between cancellation checks
+ALIGN_BATCH_SEGMENTS = 50
+
 
 class LocalTranscription(BaseTranscription):
     """
@@ -20,12 +63,27 @@ class LocalTranscription(BaseTranscription):
                  text_model = 'llama3',
                  batch_size = 16,
                  compute_type = "float16",
-                 device="cuda"):
+                 device="cuda",
+                 model_memory_budget_mb = None,
+                 result_cache = None,
+                 window_seconds = None,
+                 skip_silence = True,
+                 shard_workers = None,
+                 autotune = None,
+                 retrieval = None):
         """
         Initializes a new instance of the LocalTranscription class.
         
         This method initializes the LocalTranscription object by calling the base class's __init__ method.
         It prompts the user to select a whisper model from the available models list and loads the selected model.
+        Models are shared through the process-wide ModelRegistry, so repeated transcriptions skip model loading.
+        With shard_workers, recordings are transcribed on that many CPU worker processes at once.
+        With autotune (or MERIDIAN_AUTOTUNE=1), the device, model, compute type, batch size and thread
+        counts come from this host's calibrated ExecutionProfile instead of the arguments.
+        With window_seconds (or MERIDIAN_WINDOW_SECONDS), recordings are processed in checkpointed
+        windows of that many seconds, so an interrupted transcription can resume.
+        With retrieval (or MERIDIAN_RETRIEVAL=1), questions are answered from the transcript passages
+        most relevant to each question instead of the whole transcript.
         """
         super().__init__()
         self._device = device
@@ -34,9 +92,53 @@ class LocalTranscription(BaseTranscription):
         self._audio_model = audio_model
         self._text_model = text_model
         self._compute_type = compute_type
-        self._whisper_model = None
+        self.last_stage_report = None
+        self.last_transcript = None
+        if window_seconds is None and os.getenv("MERIDIAN_WINDOW_SECONDS"):
+            window_seconds = int(os.getenv("MERIDIAN_WINDOW_SECONDS"))
+        self._window_seconds = window_seconds
+        self._skip_silence = skip_silence
+        self._shard_workers = shard_workers
+        self._sharded = None
+        self._asr_threads = None
+        self._profile = None
+        self._retriever = None
+        self.last_question_report = None
+        self.last_chat_timings = None
+        self._keep_alive = None
+        self._session_num_ctx = None
+        if retrieval is None:
+            retrieval = os.getenv("MERIDIAN_RETRIEVAL") == "1"
+        self._retrieval = retrieval
+        if autotune is None:
+            autotune = os.getenv("MERIDIAN_AUTOTUNE") == "1"
+        if autotune:
+            self.apply_profile(ExecutionProfile.load_or_calibrate())
+        self._result_cache = result_cache if result_cache is not None else ResultCache()
+        self._model_registry = ModelRegistry.get_instance()
+        if model_memory_budget_mb is not None:
+            self._model_registry.memory_budget_mb = model_memory_budget_mb
         self.load_ollama_model()
 
+        # Ollama only runs as many requests at once as OLLAMA_NUM_PARALLEL allows, so keep the map small
+        self._summary_model = self._text_model
+        self._summary_template = "Summarize the following text:\n {text}"
+        self._summary_context_tokens = SUMMARY_CONTEXT_TOKENS
+        self._summary_output_tokens = SUMMARY_OUTPUT_TOKENS
+        self._summary_concurrency = 2
+
+    def apply_profile(self, profile: ExecutionProfile) -> None:
+        """
+        Uses the settings of a calibrated execution profile for the models loaded from now on.
+        """
+        self._profile = profile
+        self._device = profile.device
+        self._audio_model = profile.audio_model
+        self._compute_type = profile.compute_type
+        self._batch_size = profile.batch_size
+        self._asr_threads = profile.asr_threads
+        profile.apply()
+
     def load_ollama_model(self):
         if not torch.cuda.is_available():
             self._text_model = "phi3"
@@ -44,106 +146,467 @@ class LocalTranscription(BaseTranscription):
 
     def load_whisper_model(self):
         """
-        Loads the whisper model for audio transcription.
+        Returns the whisper model for audio transcription from the model registry, loading it on a miss.
+
+        The model is not kept on the instance, so the registry frees it when it is evicted; call this
+        once per transcription and hold the model only for its duration.
         """
-        # Default to CPU and smaller models for resources if a GPU is not present
-        if not torch.cuda.is_available():
+        # Default to CPU and smaller models for resources if a GPU is not present, unless a calibrated profile chose already
+        if not torch.cuda.is_available() and self._profile is None:
             self._device = 'cpu'
             self._compute_type = "int8"
             self._audio_model = "small.en"
 
-        self._whisper_model = whisper.load_model(
+        options = {} if self._asr_threads is None else {"threads": self._asr_threads}
+        key = ModelRegistry.make_key("asr", self._audio_model, self._device, self._compute_type, threads=self._asr_threads)
+        whisper_model = self._model_registry.get(key, lambda: whisper.load_model(
             whisper_arch=self._audio_model,
             device=self._device,
-            compute_type=self._compute_type
-        )
+            compute_type=self._compute_type,
+            **options
+        ))
 
-        if self._whisper_model is None:
+        if whisper_model is None:
             raise Exception("Was not able to create local whisper model instance")
+        return whisper_model
+
+    def load_align_model(self, language_code):
+        """
+        Returns the alignment model and its metadata for the given language.
+        """
+        key = ModelRegistry.make_key("align", language_code, self._device, language=language_code)
+        return self._model_registry.get(key, lambda: whisper.load_align_model(
+            language_code=language_code,
+            device=self._device))
+
+    def load_diarization_model(self):
+        """
+        Returns the diarization pipeline used to label speakers.
+        """
+        key = ModelRegistry.make_key("diarize", DIARIZATION_MODEL, self._device)
+        return self._model_registry.get(key, lambda: whisper.DiarizationPipeline(
+            use_auth_token=os.getenv("HF_ACCESS_TOKEN"),
+            device=self._device))
+
+    @property
+    def _audio_pipeline(self):
+        # The legacy diarize-first path calls the underlying pyannote pipeline directly
+        return self.load_diarization_model().model
+
+    def get_model_stats(self) -> dict:
+        """
+        Returns the hit/miss counters and load times of the model registry.
+        """
+        return self._model_registry.get_stats()
     
-    def transcribe_audio_v2(self, file_path, num_speakers=4) -> str:
-        
-        if self._whisper_model is None:
-            self.load_whisper_model()
+    def transcribe_audio_v2(self, file_path, num_speakers=4, resume=False) -> str:
+        """
+        Transcribes the audio file and labels each segment with its speaker.
+
+        Each stage result is saved to the result cache as soon as the stage finishes, so a rerun after
+        a failure continues after the last completed stage. If the instance was created with
+        window_seconds, the recording is processed in windows and checkpointed after every window.
+
+        Args:
+            file_path (str): The path to the audio file.
+            num_speakers (int, optional): The maximum number of speakers. Defaults to 4.
+            resume (bool, optional): Continue a windowed run from its last checkpoint. Defaults to False.
+                Runs without windows always reuse the stages cached by an earlier run.
+
+        Returns:
+            str: The transcription, one "SPEAKER: text" line per segment.
+        """
+        if resume and self._window_seconds is None:
+            logging.info("Resuming without windows - stages finished by an earlier run are reused from the result cache")
+
+        if self._shard_workers is not None and self._window_seconds is None:
+            try:
+                return self.transcribe_audio_sharded(file_path, num_speakers)
+            except PipelineCancelled:
+                raise
+            except Exception as e:
+                logging.error(e)
+                return TRANSCRIPTION_ERROR
+
+        if self._window_seconds is not None:
+            try:
+                return '\n'.join(self.transcribe_audio_stream(file_path, num_speakers, self._window_seconds, resume=resume))
+            except PipelineCancelled:
+                raise
+            except Exception as e:
+                logging.error(e)
+                return TRANSCRIPTION_ERROR
 
         # save model to local path (optional)
         # model_dir = "/path/"
         # model = whisperx.load_model("large-v2", device, compute_type=compute_type, download_root=model_dir)
         try:
-            audio = whisper.load_audio(file_path)
-            logging.info("Beginning transcription")
-            start_time = time.time()
-            result = self._whisper_model.transcribe(
-                audio,
-                batch_size=self._batch_size,
-                print_progress=True,
-                )
-            
-            logging.info(f"Finished transcription - total time: {(time.time() - start_time):.3f} seconds")
-            logging.debug("Before alignment")
-            logging.debug(result["segments"]) # before alignment
+            whisper_model = self.load_whisper_model()
+
+            # Stage results are cached by audio content, so the audio is only decoded if a stage has to run
+            audio_hash = self._result_cache.hash_file(file_path)
+            vad_params = {"detector": "energy"} if self._skip_silence else None
+            asr_params = {"model": self._audio_model, "compute_type": self._compute_type, "vad": vad_params}
+            diarize_params = {"model": DIARIZATION_MODEL, "min_speakers": 1, "max_speakers": num_speakers, "vad": vad_params}
+            audio_lock = threading.RLock()
+            decoded = {}
+
+            def get_raw_audio():
+                with audio_lock:
+                    if "raw" not in decoded:
+                        self.check_cancelled("decode")
+                        self.report_progress("decode", "started")
+                        decoded["raw"] = load_audio(file_path)
+                        self.report_progress("decode", "finished")
+                    return decoded["raw"]
+
+            # Silence is cut out once up front, so every model only sees the speech regions
+            def get_timeline():
+                if vad_params is None:
+                    return None
+                with audio_lock:
+                    if "timeline" not in decoded:
+                        data = self._result_cache.get("vad", audio_hash, vad_params)
+                        if data is None:
+                            timeline = SpeechTimeline.detect(get_raw_audio())
+                            self._result_cache.put("vad", audio_hash, vad_params, timeline.to_dict())
+                        else:
+                            timeline = SpeechTimeline.from_dict(data)
+                        if not timeline.regions:
+                            logging.warning("No speech found by voice activity detection - processing the whole recording")
+                            timeline = None
+                        decoded["timeline"] = timeline
+                    return decoded["timeline"]
+
+            def get_audio():
+                with audio_lock:
+                    if "audio" not in decoded:
+                        timeline = get_timeline()
+                        audio = get_raw_audio()
+                        decoded["audio"] = audio if timeline is None else timeline.compact(audio)
+                        decoded.pop("raw")
+                    return decoded["audio"]
+
+            def transcribe():
+                result = self._result_cache.get("asr", audio_hash, asr_params)
+                if result is not None:
+                    return result
+                result = self._transcribe_batched(whisper_model, get_audio())
+                logging.debug("Before alignment")
+                logging.debug(result["segments"]) # before alignment
+                self._result_cache.put("asr", audio_hash, asr_params, result)
+                return result
 
             # delete model if low on GPU resources
             # import gc; gc.collect(); torch.cuda.empty_cache(); del model
 
             # 2. Align whisper output
-            logging.info("Beginning alignment")
-            start_time = time.time()
-            
-            model_a, metadata = whisper.load_align_model(
-                language_code=result["language"],
-                device=self._device)
-            
-            result = whisper.align(result["segments"],
-                model_a,
-                metadata,
-                audio,
-                self._device,
-                return_char_alignments=False,
-                print_progress=True)
-            
-            logging.info(f"Finished alignment - total time: {(time.time() - start_time):.3f} seconds")
-            logging.debug("After alignment")
-            logging.debug(result["segments"]) # after alignment
-            
-            diarize_model = whisper.DiarizationPipeline(use_auth_token=os.getenv("HF_ACCESS_TOKEN"), device=self._device)
+            def align(result):
+                align_params = dict(asr_params, language=result["language"])
+                aligned = self._result_cache.get("align", audio_hash, align_params)
+                if aligned is not None:
+                    return aligned
+                model_a, metadata = self.load_align_model(result["language"])
+                aligned = self._align_batched(result["segments"], model_a, metadata, get_audio())
+                logging.debug("After alignment")
+                logging.debug(aligned["segments"]) # after alignment
+                self._result_cache.put("align", audio_hash, align_params, aligned)
+                return aligned
 
-            # add min/max number of speakers if known
-            logging.info("Beginning diarization")
-            start_time = time.time()
-            diarize_segments = diarize_model(
-                audio,
-                min_speakers=1,
-                max_speakers=num_speakers)
-            logging.info(f"Finished diarization - total time: {(time.time() - start_time):.3f} seconds")
-            logging.debug(diarize_segments)
-            # diarize_model(audio, min_speakers=min_speakers, max_speakers=max_speakers)
-
-            logging.info("Assigning word speakers")
-            start_time = time.time()
-            results = whisper.assign_word_speakers(
-                diarize_segments,
-                result)
-            logging.info(f"Finished assigning word speakers - total time: {(time.time() - start_time):.3f} seconds")
+            # Diarization only needs the audio, so it runs alongside transcription and alignment
+            def diarize():
+                turns = self._result_cache.get("diarize", audio_hash, diarize_params)
+                if turns is not None:
+                    return pd.DataFrame(turns, columns=['start', 'end', 'speaker'])
+                diarize_model = self.load_diarization_model()
+                diarize_segments = diarize_model(
+                    get_audio(),
+                    min_speakers=1,
+                    max_speakers=num_speakers)
+                logging.debug(diarize_segments)
+                self._result_cache.put("diarize", audio_hash, diarize_params,
+                                       diarize_segments[['start', 'end', 'speaker']].to_dict(orient='records'))
+                return diarize_segments
+
+            def assign_speakers(result, diarize_segments):
+                return assign_word_speakers(
+                    diarize_segments,
+                    result)
+
+            pipeline = StagePipeline(on_event=self.report_progress, cancel=self.cancel_event)
+            if vad_params is not None:
+                pipeline.add_stage("voice activity detection", get_timeline)
+                pipeline.add_stage("transcription", lambda timeline: transcribe(), after=["voice activity detection"])
+                pipeline.add_stage("diarization", lambda timeline: diarize(), after=["voice activity detection"])
+            else:
+                pipeline.add_stage("transcription", transcribe)
+                pipeline.add_stage("diarization", diarize)
+            pipeline.add_stage("alignment", align, after=["transcription"])
+            pipeline.add_stage("speaker assignment", assign_speakers, after=["alignment", "diarization"])
+            try:
+                results = pipeline.run()["speaker assignment"]
+            finally:
+                self.last_stage_report = pipeline.report
+
+            timeline = get_timeline()
+            if timeline is not None:
+                timeline.remap_result(results)
+                self.last_stage_report.notes.append(f"Voice activity: {timeline.summary()}")
             logging.debug(results)
             
-            transcription = []
             logging.info("Constructing response")
             start_time = time.time()
-            for i, entry in enumerate(results['segments']):
-                logging.debug(f"Segment {i}: {entry}")
-                if 'speaker' in entry.keys():
-                    transcription.append(entry['speaker'] + ": " + entry['text'])
-                else:
-                    transcription.append("Unknown speaker: " + entry['text'])
-                    
+            self.last_transcript = CompactTranscript.from_result(results)
+            transcription = str(self.last_transcript)
             logging.info(f"Done constructing response - total time: {(time.time() - start_time):.3f} seconds")
+            self._model_registry.log_stats()
             
             logging.debug(f"Returning from transcribe_audio_v2 - transcription is below:\n\n{transcription}")
-            return '\n'.join(statement for statement in transcription)
+            return transcription
+        except PipelineCancelled:
+            raise
         except Exception as e:
             logging.error(e)
-            return "Could not transcribe audio. Please try again."
+            return TRANSCRIPTION_ERROR
+
+    def transcribe_audio_sharded(self, file_path, num_speakers=4) -> str:
+        """
+        Transcribes the audio file on several CPU worker processes and labels each segment with its speaker.
+
+        The recording is split into overlapping shards which are transcribed and aligned in parallel by
+        worker processes, each with its own model, while this process diarizes the whole recording.
+
+        Args:
+            file_path (str): The path to the audio file.
+            num_speakers (int, optional): The maximum number of speakers. Defaults to 4.
+
+        Returns:
+            str: The transcription, one "SPEAKER: text" line per segment.
+        """
+        if self._sharded is None:
+            # The workers always run on the CPU, so they use the CPU model defaults. Only the workers do:
+            # this process keeps its own device for diarization and every later model it loads
+            self._sharded = ShardedTranscription(
+                workers=self._shard_workers,
+                audio_model=self._audio_model if torch.cuda.is_available() else "small.en",
+                compute_type="int8",
+                batch_size=self._batch_size,
+                skip_silence=self._skip_silence)
+
+        audio_hash = self._result_cache.hash_file(file_path)
+        vad_params = {"detector": "energy"} if self._skip_silence else None
+        shard_params = {"model": self._sharded.audio_model, "compute_type": self._sharded.compute_type, "vad": vad_params,
+                        "shards": self._sharded.workers, "overlap": self._sharded.overlap_seconds}
+        diarize_params = {"model": DIARIZATION_MODEL, "min_speakers": 1, "max_speakers": num_speakers, "vad": vad_params}
+
+        def transcribe():
+            result = self._result_cache.get("align", audio_hash, shard_params)
+            if result is None:
+                result = self._sharded.transcribe(file_path)
+                self._result_cache.put("align", audio_hash, shard_params, result)
+            return result
+
+        # Diarization is shared with transcribe_audio_v2, so its cached turns are on the speech-only timeline
+        def diarize():
+            timeline = None
+            turns = self._result_cache.get("diarize", audio_hash, diarize_params)
+            if vad_params is not None:
+                data = self._result_cache.get("vad", audio_hash, vad_params)
+                if data is not None:
+                    timeline = SpeechTimeline.from_dict(data)
+
+            if turns is None or (vad_params is not None and timeline is None):
+                audio = load_audio(file_path)
+                if vad_params is not None:
+                    timeline = SpeechTimeline.detect(audio)
+                    self._result_cache.put("vad", audio_hash, vad_params, timeline.to_dict())
+                    if timeline.regions:
+                        audio = timeline.compact(audio)
+                    else:
+                        timeline = None
+                diarize_segments = self.load_diarization_model()(audio, min_speakers=1, max_speakers=num_speakers)
+                turns = diarize_segments[['start', 'end', 'speaker']].to_dict(orient='records')
+                self._result_cache.put("diarize", audio_hash, diarize_params, turns)
+
+            if timeline is not None and timeline.regions:
+                for turn in turns:
+                    turn["start"] = timeline.to_original(turn["start"])
+                    turn["end"] = timeline.to_original(turn["end"], is_end=True)
+            return turns
+
+        pipeline = StagePipeline(on_event=self.report_progress, cancel=self.cancel_event)
+        pipeline.add_stage("sharded transcription", transcribe)
+        pipeline.add_stage("diarization", diarize)
+        pipeline.add_stage("speaker assignment", lambda result, turns: assign_word_speakers(turns, result),
+                           after=["sharded transcription", "diarization"])
+        try:
+            results = pipeline.run()["speaker assignment"]
+        finally:
+            self.last_stage_report = pipeline.report
+        if self._sharded.shard_times:
+            self.last_stage_report.notes.append(
+                f"Shards: {self._sharded.workers} workers, {sum(self._sharded.shard_times):.1f} s of shard time "
+                f"({', '.join(f'{shard_time:.1f}' for shard_time in self._sharded.shard_times)} s)")
+
+        self.last_transcript = CompactTranscript.from_result(results)
+        self._model_registry.log_stats()
+        return str(self.last_transcript)
+
+    def transcribe_audio_stream(self, file_path, num_speakers=4, window_seconds=600, overlap_seconds=30, resume=False):
+        """
+        Transcribes the audio file in overlapping windows, yielding lines as soon as they are final.
+
+        Only one window of audio is decoded at a time, so peak memory does not depend on the length
+        of the recording. Words are stitched at the middle of each overlap and speakers are matched
+        across windows by their voice embeddings. Progress is checkpointed after every window.
+        Once the last window is done, last_transcript holds the word timings of the whole recording
+        and last_stage_report the time taken by each window.
+
+        Args:
+            file_path (str): The path to the audio file.
+            num_speakers (int, optional): The maximum number of speakers. Defaults to 4.
+            window_seconds (float, optional): The length of each window in seconds. Defaults to 600.
+            overlap_seconds (float, optional): The overlap between neighbouring windows. Defaults to 30.
+            resume (bool, optional): Continue from the last completed window of an earlier run. Defaults to False.
+
+        Yields:
+            str: Transcribed lines in the form "SPEAKER: text".
+        """
+        # Cleared first, so a failed or cancelled run never leaves the previous recording's results behind
+        self.last_transcript = None
+        self.last_stage_report = report = StageReport()
+        report.start_time = time.time()
+        whisper_model = self.load_whisper_model()
+
+        duration = get_audio_duration(file_path)
+        windows = plan_windows(duration, window_seconds, overlap_seconds)
+        boundaries = commit_boundaries(windows)
+        tracker = SpeakerTracker(max_speakers=num_speakers)
+        committed_until = 0.0
+        first_window = 0
+        segments_so_far = []
+
+        checkpoint = TranscriptionCheckpoint(self._result_cache.hash_file(file_path), {
+            "model": self._audio_model,
+            "compute_type": self._compute_type,
+            "num_speakers": num_speakers,
+            "window_seconds": window_seconds,
+            "overlap_seconds": overlap_seconds,
+            "format": "segments",
+        })
+        state = checkpoint.load() if resume else None
+        if state is None:
+            checkpoint.discard()
+        else:
+            first_window = state["next_window"]
+            committed_until = state["committed_until"]
+            tracker.set_state(state["tracker"])
+            logging.info(f"Resuming transcription of {file_path} from window {first_window + 1} of {len(windows)}")
+            report.notes.append(f"Resumed from window {first_window + 1} of {len(windows)}")
+            segments_so_far = checkpoint.lines()
+            for segment in segments_so_far:
+                yield self._format_segment(segment)
+
+        logging.info(f"Streaming transcription of {file_path} ({duration:.1f} seconds) in {len(windows)} windows")
+
+        for index in range(first_window, len(windows)):
+            self.check_cancelled(f"window {index + 1}")
+            start, end = windows[index]
+            start_time = time.time()
+            audio = load_audio_window(file_path, start, end - start)
+            segments = self._transcribe_window(whisper_model, audio, num_speakers, tracker)
+            del audio
+
+            shift_segments(segments, start)
+            segments = [self._segment_record(entry) for entry in clip_segments(segments, committed_until, boundaries[index])]
+            committed_until = boundaries[index]
+            report.stages[f"window {index + 1}"] = (start_time, time.time())
+            report.end_time = time.time()
+            logging.info(f"Finished window {index + 1} of {len(windows)} ({start:.1f}-{end:.1f}s) - total time: {(time.time() - start_time):.3f} seconds")
+
+            checkpoint.save_window(index + 1, committed_until, tracker.get_state(), segments)
+            segments_so_far.extend(segments)
+            self.report_progress("transcription", "progress", 100.0 * (index + 1) / len(windows))
+            for segment in segments:
+                yield self._format_segment(segment)
+
+        report.end_time = time.time()
+        self.last_transcript = CompactTranscript.from_result({"segments": segments_so_far})
+        checkpoint.discard()
+
+    def _transcribe_window(self, whisper_model, audio, num_speakers, tracker: SpeakerTracker) -> list:
+        """
+        Runs transcription, alignment and diarization over a single window of audio.
+
+        Returns:
+            list: The aligned segments with session-wide speaker labels and window-relative times.
+        """
+        timeline = None
+        if self._skip_silence:
+            timeline = SpeechTimeline.detect(audio)
+            if not timeline.regions:
+                return []
+            audio = timeline.compact(audio)
+
+        result = whisper_model.transcribe(audio, batch_size=self._batch_size)
+        if not result["segments"]:
+            return []
+
+        model_a, metadata = self.load_align_model(result["language"])
+        result = whisper.align(result["segments"], model_a, metadata, audio, self._device, return_char_alignments=False)
+
+        diarize_segments = self._diarize_window(audio, num_speakers, tracker)
+        result = assign_word_speakers(diarize_segments, result)
+        if timeline is not None:
+            timeline.remap_result(result)
+        return result["segments"]
+
+    def _diarize_window(self, audio, num_speakers, tracker: SpeakerTracker) -> pd.DataFrame:
+        # Call the pyannote pipeline directly so the speaker embeddings are returned alongside the turns
+        diarize_model = self.load_diarization_model()
+        audio_data = {
+            "waveform": torch.from_numpy(audio[None, :]),
+            "sample_rate": SAMPLE_RATE
+        }
+        diarization, embeddings = diarize_model.model(
+            audio_data,
+            min_speakers=1,
+            max_speakers=num_speakers,
+            return_embeddings=True)
+
+        diarize_df = pd.DataFrame(diarization.itertracks(yield_label=True), columns=['segment', 'label', 'speaker'])
+        diarize_df['start'] = diarize_df['segment'].apply(lambda x: x.start)
+        diarize_df['end'] = diarize_df['segment'].apply(lambda x: x.end)
+
+        labels = diarization.labels()
+        durations = {label: diarization.label_duration(label) for label in labels}
+        mapping = tracker.map_labels(labels, embeddings, durations)
+        diarize_df['speaker'] = diarize_df['speaker'].map(mapping)
+        return diarize_df
+
+    @staticmethod
+    def _segment_record(entry) -> dict:
+        # The parts of a whisperx segment kept in checkpoints, as plain JSON types
+        def word_record(word):
+            record = {"word": word["word"]}
+            for key in ("start", "end", "score"):
+                if word.get(key) is not None:
+                    record[key] = float(word[key])
+            if word.get("speaker") is not None:
+                record["speaker"] = word["speaker"]
+            return record
+
+        record = {"start": float(entry["start"]), "end": float(entry["end"]), "text": entry["text"],
+                  "words": [word_record(word) for word in entry.get("words", [])]}
+        if entry.get("speaker") is not None:
+            record["speaker"] = entry["speaker"]
+        return record
+
+    @staticmethod
+    def _format_segment(entry) -> str:
+        if 'speaker' in entry.keys():
+            return entry['speaker'] + ": " + entry['text']
+        return "Unknown speaker: " + entry['text']
         
     def transcribe_audio(self, file_path) -> str:
         """
@@ -156,63 +619,23 @@ class LocalTranscription(BaseTranscription):
             str: The transcription of the audio file.
         """
 
-        if self._whisper_model is None:
-            self.load_whisper_model()
-        
-        def millisec(val: float ) -> int:
-
-            logging.info(f"Time: {val}")
-            return int(val * 1000.0)
-      
-        # apply pretrained pipeline for diarization
-        def get_audiosegment(_file_path):
-            temp_filename = _file_path
-            file_extension = os.path.splitext(temp_filename)[1][1:]
-            start_time = time.time()
-            logging.info(f"Loading audio file: {temp_filename}")
-            audio = AudioSegment.from_file(temp_filename, format=file_extension)
-            logging.info(f"Done loading audio file: {temp_filename}. Time to load: {(time.time() - start_time):.3f}")
-            
-            # Diarization requires the audio to be in .wav format - convert if necessary
-            if file_extension != 'wav':
-                temp_filename = os.path.splitext(temp_filename)[0] + '.wav'
-                logging.info(f"Converting file from {file_extension} to .wav format. File: {temp_filename}")
-                start_time = time.time()
-                audio.export(temp_filename, format='wav')
-                logging.info(f"Done converting file to .wav format. File: {temp_filename}. Time to transcribe: {(time.time() - start_time):.3f}")
-                
-            # Return handle to both AudioSegment and the filename of the audio file    
-            return (temp_filename, audio)
-        
-        (diarization_filename, audio) = get_audiosegment(file_path)
-        
-        diarization_json = os.path.splitext(diarization_filename)[0] + '_diarization.json'
-        logging.info(f"Checking if diarization file exists: {diarization_json}")
+        audio_hash = self._result_cache.hash_file(file_path)
+        diarize_params = {"model": DIARIZATION_MODEL, "pipeline": "legacy"}
+        logging.info(f"Checking result cache for diarization of {file_path}")
        
-        groups = None
-        if os.path.exists(diarization_json):
-            logging.info(f"File exists - attempt to load file")
-            try:
-                logging.info(f"Loading diarization from file: {diarization_json}")
-                with open(diarization_json, 'r') as f:
-                    groups = json.loads(f.read())
-                logging.info(f"Loaded diarization from file: {diarization_json}")
-            except Exception as e:
-                logging.error(e)
-                # Remove diariazation file if it exists
-                if os.path.exists(diarization_json):
-                    logging.info(f"Removing diarization file: {diarization_json}")
-                    os.remove(diarization_json)
-                    
-                return "Could not load diarization. Please try again."
-        
-        else:
-            logging.info(f"File does not exist - attempt to diarize audio file")
+        groups = self._result_cache.get("diarize", audio_hash, diarize_params)
+        audio_data = None
+        if groups is None:
+            logging.info("No cached diarization - attempt to diarize audio file")
             try:
+                audio_data = load_audio(file_path)
                 start_time = time.time()
-                logging.info(f"Begin diarizing audio file: {diarization_filename}")
-                diarization = self._audio_pipeline(diarization_filename)
-                # Write diarization to a file
+                logging.info(f"Begin diarizing audio file: {file_path}")
+                # Diarize the decoded samples in memory rather than converting the recording to a .wav next to it
+                diarization = self._audio_pipeline({
+                    "waveform": torch.from_numpy(audio_data[None, :]),
+                    "sample_rate": SAMPLE_RATE
+                })
                 logging.info(f"Finished diarizing audio file: {file_path}. Time to transcribe: {(time.time() - start_time):.3f}")
                 logging.info(f"Type of diarization: {type(diarization)}")
             
@@ -229,129 +652,192 @@ class LocalTranscription(BaseTranscription):
                     logging.debug(f"Speaker: {speaker_id} - Start: {start} - End: {end}")
                     groups[speaker_id].append({"start":start, "end": end})
         
-                logging.info(f"Writing speaker diarization info to {diarization_json}")
-                for speaker, times in groups.items():
-                    with open(diarization_json, 'w') as f:
-                        f.write(json.dumps(groups))
-                logging.info(f"Speaker diarization info written to file: {diarization_json}")
+                self._result_cache.put("diarize", audio_hash, diarize_params, groups)
+                logging.info("Speaker diarization info written to result cache")
 
             except Exception as e:
                 logging.error(e)                    
-                return "Could not transcribe audio. Please try again."
+                return TRANSCRIPTION_ERROR
         
-        gidx = -1
+        # Map each diarized turn to its speaker and slice the turns out of the decoded audio in memory
         speaker_dict = {}
-        filenames = [] 
-        
-        if not os.path.exists(os.path.curdir + r'\tmp'):
-            logging.info(f"Making temporary directory for audio files: {os.path.curdir} \\tmp")
-            os.makedirs(os.path.curdir + '\\tmp')
-            logging.info(f"Done making temporary directory for audio files")
-
-            
+        spans = []
         for speaker, time_list in groups.items():
             logging.info(f"Processing speaker {speaker}")
             for seg in time_list:
-                logging.info(f"Time tuple: {seg}")
-                start = seg['start']
-                end = seg['end']
-                gidx +=1
-                tmp_filename = 'tmp/' + str(gidx) + '.wav'
-                speaker_dict[gidx] = speaker
+                logging.debug(f"Time tuple: {seg}")
+                speaker_dict[len(spans)] = speaker
+                spans.append((seg['start'], seg['end']))
+
+        # The audio was only decoded above if diarization had to run
+        if audio_data is None:
+            audio_data = load_audio(file_path)
 
-                try:
-                    audio[millisec(start):millisec(end)].export(tmp_filename, format='wav')
-                    filenames.append(tmp_filename)
-                except Exception as e:
-                    logging.error(e)
-                    logging.error(f"Could not export audio file: {tmp_filename} for times {start} to {end}.")
-        
         # Now that we have the diarization, do the transcription
         start_time = time.time()
-        transcription = []
-        logging.info(f"Begin transcribing audio files for {file_path}")
-        gidx = 0
-        idx_len = len(filenames)
-        for tmpfile in filenames:
-            logging.info(f"Transcribing audio file {tmpfile} for idx {gidx} of {idx_len}")
-            start_time = time.time()
-            audio_data = whisper.load_audio(tmpfile)
-            segment_transcription = self._whisper_model.transcribe(
-                audio_data, batch_size=self._batch_size)
-                
-            logging.info(f"Done transcribing audio {tmpfile}. Time to transcribe: {(time.time() - start_time):.3f}")
-            transcription.append(f"Speaker {speaker_dict[gidx]}: {segment_transcription['text']}")
-            gidx +=1
-            
+        logging.info(f"Begin transcribing {len(spans)} speaker turns for {file_path}")
+        texts = self._transcribe_spans(self.load_whisper_model(), audio_data, spans)
+        transcription = [f"Speaker {speaker_dict[gidx]}: {text}" for gidx, text in enumerate(texts)]
         logging.info(f"Finished transcribing audio files for {file_path}. Time to transcribe: {(time.time() - start_time):.3f}")
                 
         return "\n".join(transcription)
-        
 
-    def summarize_text(self, transcription, num_lines = 20, levels = 2, granularity=2) -> str:
+    def _transcribe_batched(self, whisper_model, audio, chunk_seconds=30) -> dict:
         """
-        Summarizes the transcription of a session.
+        Transcribes decoded audio like whisperx's transcribe(), checking for cancellation between batches.
+
+        The speech found by whisperx's voice activity model is merged into pieces of up to chunk_seconds
+        and transcribed by _transcribe_spans, which reports the share of pieces done as progress.
 
         Args:
-            transcription (str): The transcription of the session.
+            whisper_model: The whisperx pipeline from load_whisper_model.
+            audio (np.ndarray): The decoded 16 kHz mono audio.
+            chunk_seconds (int, optional): The longest piece passed to whisper. Defaults to 30.
 
         Returns:
-            str: The summarized version of the transcription.
+            dict: The segments and language, in the form whisperx's transcribe() returns them.
         """
-        num_summarizations = 0
-        # Break the text up into smaller chunks to increase the ability for the LLM to extract data
-        def summarize_chunk(chunk, num_summarizations):
-            
-            prompt = f"Summarize the following text:\n {chunk}"
-            try:
-                logging.info("Summarizing chunk %0d with prompt: %s", num_summarizations, prompt)
-                response = ollama.generate(model=self._text_model, prompt=prompt, system="You are an assistant trying to help summarize a text", stream=False)
-                logging.info("Response from ollama for chunk %0d: %s", num_summarizations, response['response'])
-                num_summarizations+=1
-                return response['response']
-            except Exception as e:
-                logging.error(e)
-                return None
-            
-        def consolidate_chunks(responses, num_summarizations):
-            consolidated = ""
-            for response in responses:
-                consolidated += response + "\n"
-            
-            return summarize_chunk(consolidated, num_summarizations)
-        
-        responses = []
-        chunks = []
-        transcription_lines = transcription.split("\n")
-        for i in range(0, len(transcription_lines), num_lines):
-            lines = "\n".join(transcription_lines[i:i+num_lines])
-            logging.info("Summarizing lines %0d to %0d", i, i+num_lines)
-            chunk = summarize_chunk(lines, num_summarizations)
-            chunks.append(chunk)
+        vad_segments = whisper_model.vad_model({"waveform": torch.from_numpy(audio).unsqueeze(0), "sample_rate": SAMPLE_RATE})
+        vad_segments = merge_chunks(vad_segments, chunk_seconds,
+                                    onset=whisper_model._vad_params["vad_onset"],
+                                    offset=whisper_model._vad_params["vad_offset"])
+        if whisper_model.preset_language is None:
+            # Detect the language of every recording, as transcribe() does
+            whisper_model.tokenizer = None
+        self._ensure_tokenizer(whisper_model, audio)
+
+        spans = [(segment["start"], segment["end"]) for segment in vad_segments]
+        texts = self._transcribe_spans(whisper_model, audio, spans, chunk_seconds, stage="transcription")
+        segments = [{"text": text, "start": round(start, 3), "end": round(end, 3)}
+                    for (start, end), text in zip(spans, texts) if text]
+        return {"segments": segments, "language": whisper_model.tokenizer.language_code}
+
+    def _align_batched(self, segments, model_a, metadata, audio, batch_segments=ALIGN_BATCH_SEGMENTS) -> dict:
+        """
+        Aligns the segments a batch at a time, reporting progress and checking for cancellation between batches.
+
+        Returns:
+            dict: The aligned segments and word segments, as whisperx's align() returns them.
+        """
+        aligned = {"segments": [], "word_segments": []}
+        for first in range(0, len(segments), batch_segments):
+            self.check_cancelled("alignment")
+            batch = whisper.align(segments[first:first + batch_segments], model_a, metadata, audio, self._device,
+                                  return_char_alignments=False)
+            aligned["segments"].extend(batch["segments"])
+            aligned["word_segments"].extend(batch["word_segments"])
+            self.report_progress("alignment", "progress", 100.0 * min(first + batch_segments, len(segments)) / len(segments))
+        return aligned
+
+    def _transcribe_spans(self, whisper_model, audio, spans, chunk_seconds=30, min_seconds=0.1, stage=None) -> list:
+        """
+        Transcribes many (start, end) spans of a decoded recording in full batches.
+
+        Spans are sliced out of the audio buffer as views, split into pieces no longer than whisper's
+        30 second context and fed to the pipeline as one stream, so short turns share batches.
+
+        Args:
+            whisper_model: The whisperx pipeline from load_whisper_model.
+            audio (np.ndarray): The decoded 16 kHz mono audio.
+            spans (list): (start, end) times in seconds.
+            chunk_seconds (int, optional): The longest piece passed to whisper. Defaults to 30.
+            min_seconds (float, optional): Pieces shorter than this are skipped. Defaults to 0.1.
+            stage (str, optional): If given, progress is reported for this stage after every batch and
+                a cancelled transcription stops before the next one.
+
+        Returns:
+            list: The text of each span, in the order of the spans.
+        """
+        pieces = []
+        step = int(chunk_seconds * SAMPLE_RATE)
+        for idx, (start, end) in enumerate(spans):
+            f1 = max(int(start * SAMPLE_RATE), 0)
+            f2 = min(int(end * SAMPLE_RATE), len(audio))
+            for p in range(f1, f2, step):
+                if min(p + step, f2) - p >= min_seconds * SAMPLE_RATE:
+                    pieces.append((idx, p, min(p + step, f2)))
+
+        texts = [[] for _ in spans]
+        if not pieces:
+            return ["" for _ in spans]
+
+        self._ensure_tokenizer(whisper_model, audio)
+
+        def data():
+            for _, f1, f2 in pieces:
+                yield {'inputs': audio[f1:f2]}
+
+        outputs = whisper_model(data(), batch_size=self._batch_size, num_workers=0)
+        for i, ((idx, _, _), out) in enumerate(zip(pieces, outputs)):
+            text = out['text']
+            if self._batch_size in [0, 1, None]:
+                text = text[0]
+            texts[idx].append(text.strip())
+            if stage is not None and ((i + 1) % (self._batch_size or 1) == 0 or i + 1 == len(pieces)):
+                self.report_progress(stage, "progress", 100.0 * (i + 1) / len(pieces))
+                self.check_cancelled(stage)
+            if (i + 1) % 100 == 0:
+                logging.info(f"Transcribed {i + 1} of {len(pieces)} audio pieces")
+
+        return [" ".join(text) for text in texts]
+
+    @staticmethod
+    def _ensure_tokenizer(whisper_model, audio) -> None:
+        # The whisperx pipeline only creates its tokenizer inside transcribe(), so set it up when it is called directly
+        if whisper_model.tokenizer is None:
+            language = whisper_model.detect_language(audio)
+            whisper_model.tokenizer = faster_whisper.tokenizer.Tokenizer(
+                whisper_model.model.hf_tokenizer,
+                whisper_model.model.model.is_multilingual,
+                task="transcribe",
+                language=language)
         
-        logging.info("Summarizing chunks")
-        for i in range(0, levels):
-            logging.info("Summarizing level %0d",i+1)
-            for i in range(0, len(chunks), granularity):
-                logging.info("Summarizing chunk %0d to %0d", i, i+granularity)
-                try:
-                    response = consolidate_chunks(chunk[i:i+granularity], num_summarizations)
-                    logging.info("Consolidated response: %s", {response})
-                    responses.append(response)
-                except Exception as e:
-                    logging.error(e)
-                    return None
-            logging.info(f"Finished summarizing level {i+1} - resizing chunks ({len(chunks)}) to {len(responses)}")
-            logging.info(f"Responses: {responses}")
-            chunks = responses
-        logging.info("Returning consolidated %0d responses: %s", num_summarizations, "\n".join(chunks) )
-        return "\n".join(chunks)
+
+    def complete(self, system_prompt, prompt) -> str:
+        """
+        Sends a single prompt to the ollama text model and returns its answer.
+        """
+        response = ollama.generate(model=self._text_model, prompt=prompt, system=system_prompt, stream=False,
+                                   options={"num_ctx": self._summary_context_tokens})
+        return response['response']
         
-    def ask_question(self, question, source_info, num_ctx : int = 4096) -> str:
+    def get_retriever(self) -> TranscriptRetriever:
+        """
+        Returns the retriever of transcript passages, creating it on first use.
+        """
+        if self._retriever is None:
+            self._retriever = TranscriptRetriever(counter=TokenCounter(self._text_model))
+        return self._retriever
+
+    def ask_question(self, question, source_info, num_ctx : int = 4096, on_token = None, cancel = None) -> str:
+        """
+        Answers a question about a transcript, as the next turn of the current conversation.
+
+        With num_ctx set to None, the context size is picked to fit the prompt and the answer.
+        on_token is called with every piece of the answer as it streams in, and setting the
+        cancel event stops the generation at once, even while ollama is still evaluating the prompt,
+        and returns the answer so far. A cancelled answer is not added to the conversation.
+        """
         answer = ""
-        if self.chat_responses is None:
-            logging.info("Chat responses cleared - reinitializing with contents of transcription window.")
-            self.chat_responses = [{"role" : "system", "content" :"""
+        # Cleared first, so a failed or cancelled question never reports the previous answer's timings
+        self.last_chat_timings = None
+        report = StageReport()
+        report.start_time = time.time()
+        self.last_question_report = report
+
+        if self._retrieval:
+            # Only the passages relevant to this question are sent, so long sessions are not truncated
+            try:
+                excerpts = self.get_retriever().retrieve(question, source_info, report)
+            except Exception as e:
+                logging.error(f"Could not retrieve transcript passages: {e}")
+                return "Query failed - please try again."
+            source_info = "\n\n[...]\n\n".join(excerpts)
+
+        if self.conversation is None:
+            logging.info("Conversation cleared - starting a new one with the contents of the transcription window.")
+            transcript = "" if self._retrieval else f"\n\nTRANSCRIPT:\n\n{source_info}\n"
+            prefix = [{"role" : "system", "content" :"""
 You are a helpful assistant trying to help the user understand the written transcript. 
 Human conversation can wind from place to place, so take care in how information is understood.
 The different speakers are notified by their names, and the text is a transcription of a conversation.
@@ -360,25 +846,38 @@ Consider the context of the conversation and the information that has already be
 Summarize information considering all pieces of information shared in the conversation.
 """},
                 {"role" : "user", "content" : f'''
-You're helping to answer questions about a Dungeons & Dragons campaign. You have a text transcription of the session as your main data source, marked below. Any questions you get should be understood as being intended to extract
+You're helping to answer questions about a Dungeons & Dragons campaign. You have a text transcription of the session as your main data source{", of which the parts relevant to each question are given with it" if self._retrieval else ", marked below"}. Any questions you get should be understood as being intended to extract
 information from the transcript. Use all messages from the conversation as context when constructing your answer. If you need more information, please ask for it.
-                                
-TRANSCRIPT:
-
-{source_info}
+{transcript}'''}]
+            self.conversation = ConversationMemory(TokenCounter(self._text_model), prefix,
+                                                   summarize=self._summarize_history,
+                                                   output_tokens=CHAT_OUTPUT_TOKENS)
 
-QUESTION:
-
-{question}
-
-'''}]
-             
+        if self._retrieval:
+            content = f"EXCERPTS FROM THE TRANSCRIPT:\n\n{source_info}\n\nQUESTION:\n\n{question}"
+        else:
+            content = f"QUESTION:\n\n{question}"
+        self.conversation.fit(num_ctx or MAX_CHAT_CONTEXT_TOKENS, CHAT_HISTORY_TOKENS)
+        messages = self.conversation.messages(content)
+        if num_ctx is None:
+            num_ctx = self.conversation.context_tokens()
+            if self._keep_alive is not None:
+                # A new num_ctx reloads the model and drops its prompt cache, so a pinned session only grows it, with room for the history
+                if self._session_num_ctx is None or num_ctx > self._session_num_ctx:
+                    self._session_num_ctx = num_ctx + CHAT_HISTORY_TOKENS
+                num_ctx = self._session_num_ctx
+            num_ctx = min(num_ctx, MAX_CHAT_CONTEXT_TOKENS)
         logging.info("Query:\n\n%s", question)
+        logging.info(f"Prompt of {self.conversation.last_prompt_tokens} tokens in a context of {num_ctx} tokens")
         
         try:
-            logging.info(f"Attempting to send query to ollama for question analysis: {self.chat_responses}")
-            responses = ollama.chat(
-                messages=self.chat_responses,
+            logging.info(f"Attempting to send query to ollama for question analysis: {messages}")
+            generate_start = time.time()
+            first_token_time = None
+            # A client of its own, so a cancel can shut down this question's connection
+            client = AbortableClient()
+            responses = client.chat(
+                messages=messages,
                 model=self._text_model,
                 stream = True,
                 options={
@@ -386,21 +885,118 @@ QUESTION:
                     "repeat_last_n":-1,
                     "num_ctx": num_ctx,
                     
-                    }
+                    },
+                keep_alive=self._keep_alive
                 )
+            # The stream is read on its own thread, since waiting for it would block a cancel made
+            # while ollama is still evaluating the prompt until the first token arrives
+            pieces = queue.Queue()
+
+            def read_stream():
+                try:
+                    for piece in responses:
+                        pieces.put(piece)
+                except Exception as e:
+                    pieces.put(e)
+                finally:
+                    responses.close()
+                    client.close()
+                    pieces.put(None)
+
+            threading.Thread(target=read_stream, name="ollama-chat", daemon=True).start()
             response_num = 0
-            for response in responses:
+            cancelled = False
+            while True:
+                if cancel is not None and cancel.is_set():
+                    # Shutting down the connection stops ollama, and fails the read of the stream
+                    client.abort()
+                    cancelled = True
+                    logging.info("Question cancelled")
+                    break
+                try:
+                    response = pieces.get(timeout=CANCEL_POLL_SECONDS)
+                except queue.Empty:
+                    continue
+                if response is None:
+                    break
+                if isinstance(response, Exception):
+                    raise response
                 if not response['done']:
-                    self.chat_responses.append({"role": "assistant",
-                                                "content": response['message']['content']})
+                    if first_token_time is None:
+                        first_token_time = time.time()
                     answer+=response['message']['content']
                     response_num +=1
+                    if on_token is not None:
+                        on_token(response['message']['content'])
                 else:
+                    self.last_chat_timings = self._chat_timings(response, generate_start, first_token_time)
                     break
             logging.info(f"Received {response_num} responses from ollama")
             logging.info(f"Response from ollama: {answer}")
+            # One message per turn, whatever the number of streamed pieces. A cancelled answer is cut
+            # short, and later questions should not take it for a complete one
+            if not cancelled:
+                self.conversation.add_turn(question, answer)
+            end_time = time.time()
+            report.stages["prompt eval"] = (generate_start, first_token_time or end_time)
+            report.stages["generate"] = (first_token_time or end_time, end_time)
+            report.end_time = end_time
+            report.notes.append(f"Conversation: {self.conversation.get_stats()}")
+            if self.last_chat_timings is not None:
+                report.notes.append(f"Ollama: {self.last_chat_timings}")
+            logging.info(f"Question timings:\n{report}")
             return answer
         
         except Exception as e:
             logging.error(e)
             return "Query failed - please try again."
+
+    def _summarize_history(self, prompt) -> str:
+        # A pinned session is asked with its own context size, since any other size reloads the model
+        num_ctx = self._session_num_ctx or self._summary_context_tokens
+        response = ollama.generate(model=self._text_model, prompt=prompt, system=self._summary_system_prompt, stream=False,
+                                   options={"num_ctx": num_ctx}, keep_alive=self._keep_alive)
+        return response['response']
+
+    @staticmethod
+    def _chat_timings(response, start_time, first_token_time) -> dict:
+        # Ollama reports its durations in nanoseconds on the last streamed response
+        prompt_eval_seconds = response.get('prompt_eval_duration', 0) / 1e9
+        eval_seconds = response.get('eval_duration', 0) / 1e9
+        eval_count = response.get('eval_count', 0)
+        return {
+            "time_to_first_token": (first_token_time - start_time) if first_token_time is not None else None,
+            "load_seconds": response.get('load_duration', 0) / 1e9,
+            "prompt_eval_count": response.get('prompt_eval_count', 0),
+            "prompt_eval_seconds": prompt_eval_seconds,
+            "eval_count": eval_count,
+            "eval_seconds": eval_seconds,
+            "tokens_per_second": eval_count / eval_seconds if eval_seconds > 0 else 0.0,
+        }
+
+    def pin_session(self) -> None:
+        """
+        Keeps the text model loaded until unpin_session, so the questions of one analyze session
+        reuse the evaluated transcript prefix instead of reloading the model and evaluating it again.
+        """
+        self._keep_alive = -1
+        self._session_num_ctx = None
+        # Load the model now, so the first question does not wait for it
+        threading.Thread(target=self._set_keep_alive, args=(self._keep_alive,), name="pin-session", daemon=True).start()
+
+    def unpin_session(self) -> None:
+        """
+        Lets the text model unload after ollama's usual idle time again.
+        """
+        if self._keep_alive is None:
+            return
+        self._keep_alive = None
+        self._session_num_ctx = None
+        threading.Thread(target=self._set_keep_alive, args=(DEFAULT_KEEP_ALIVE,), name="unpin-session", daemon=True).start()
+
+    def _set_keep_alive(self, keep_alive) -> None:
+        # A request without a prompt only loads the model and sets how long it stays loaded
+        try:
+            ollama.generate(model=self._text_model, prompt="", keep_alive=keep_alive)
+        except Exception as e:
+            logging.warning(f"Could not set keep alive of {self._text_model}: {e}")
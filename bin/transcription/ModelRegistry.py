@@ -0,0 +1,272 @@
+import gc
+import logging
+import os
+import threading
+import time
+import types
+from collections import OrderedDict
+
+import torch
+
+
+# Approximate parameter counts (in millions) of the whisper architectures, used to
+# estimate the footprint of ctranslate2 models which torch cannot measure directly
+WHISPER_PARAMS_MILLIONS = {
+    "tiny": 39,
+    "base": 74,
+    "small": 244,
+    "medium": 769,
+    "large": 1550,
+}
+
+BYTES_PER_PARAM = {
+    "float32": 4,
+    "float16": 2,
+    "bfloat16": 2,
+    "int8_float32": 1,
+    "int8_float16": 1,
+    "int8_bfloat16": 1,
+    "int8": 1,
+}
+
+
+class ModelEntry:
+    """
+    A single model held by the registry along with its bookkeeping data.
+    """
+
+    def __init__(self, key, model, size_bytes, load_time):
+        self.key = key
+        self.model = model
+        self.size_bytes = size_bytes
+        self.load_time = load_time
+        self.hits = 0
+        self.last_used = time.time()
+
+
+class ModelRegistry:
+    """
+    Process-wide cache which keeps ASR, alignment and diarization models resident between calls.
+
+    Models are keyed by (kind, architecture, device, compute_type, language). When a memory budget
+    is configured, the least recently used models are evicted to make room for newly loaded ones.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, memory_budget_mb: int = None):
+        """
+        Initializes a new instance of the ModelRegistry class.
+
+        Args:
+            memory_budget_mb (int, optional): Upper bound for the estimated size of all resident models.
+                Defaults to the MERIDIAN_MODEL_MEMORY_MB environment variable, or no limit if unset.
+        """
+        if memory_budget_mb is None and os.getenv("MERIDIAN_MODEL_MEMORY_MB"):
+            memory_budget_mb = int(os.getenv("MERIDIAN_MODEL_MEMORY_MB"))
+
+        self._memory_budget = None if memory_budget_mb is None else memory_budget_mb * 1024 * 1024
+        self._models = OrderedDict()
+        self._lock = threading.RLock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._load_times = {}
+        self._loading = {}
+
+    @classmethod
+    def get_instance(cls) -> "ModelRegistry":
+        """
+        Returns the registry shared by every transcription agent in this process.
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = ModelRegistry()
+            return cls._instance
+
+    @property
+    def memory_budget_mb(self):
+        return None if self._memory_budget is None else self._memory_budget // (1024 * 1024)
+
+    @memory_budget_mb.setter
+    def memory_budget_mb(self, budget_mb):
+        with self._lock:
+            self._memory_budget = None if budget_mb is None else budget_mb * 1024 * 1024
+            self._evict(0)
+
+    @staticmethod
+    def make_key(kind, architecture, device, compute_type=None, language=None, threads=None) -> tuple:
+        # Models loaded with other CPU thread settings are different models
+        return (kind, architecture, device, compute_type, language, threads)
+
+    def get(self, key: tuple, loader, size_bytes: int = None):
+        """
+        Returns the model stored under the given key, loading it with the loader on a miss.
+
+        Args:
+            key (tuple): The key created with make_key.
+            loader (callable): Function taking no arguments which loads and returns the model.
+            size_bytes (int, optional): Known size of the model. Estimated after loading if not given.
+
+        Returns:
+            The cached or newly loaded model.
+        """
+        with self._lock:
+            model = self._lookup(key)
+            if model is not None:
+                return model
+            key_lock = self._loading.setdefault(key, threading.Lock())
+
+        # Load outside the registry lock so different models can load concurrently, while
+        # concurrent requests for the same model wait for the first load to finish
+        with key_lock:
+            with self._lock:
+                model = self._lookup(key)
+                if model is not None:
+                    return model
+                self._misses += 1
+                logging.info(f"Model registry miss for {key} - loading model")
+
+            cuda_before = self._cuda_allocated(key)
+            start_time = time.time()
+            try:
+                model = loader()
+            except Exception:
+                with self._lock:
+                    self._loading.pop(key, None)
+                raise
+            load_time = time.time() - start_time
+
+            if size_bytes is None:
+                size_bytes = self._estimate_size(key, model, cuda_before)
+
+            with self._lock:
+                self._evict(size_bytes)
+                self._models[key] = ModelEntry(key, model, size_bytes, load_time)
+                self._load_times.setdefault(key, []).append(load_time)
+                self._loading.pop(key, None)
+            logging.info(f"Loaded model {key} in {load_time:.3f} seconds (~{size_bytes / (1024 * 1024):.0f} MB)")
+
+            return model
+
+    def _lookup(self, key: tuple):
+        entry = self._models.get(key)
+        if entry is None:
+            return None
+        self._models.move_to_end(key)
+        entry.hits += 1
+        entry.last_used = time.time()
+        self._hits += 1
+        logging.info(f"Model registry hit for {key}")
+        return entry.model
+
+    def evict(self, key: tuple) -> bool:
+        """
+        Removes a single model from the registry.
+
+        Returns:
+            bool: True if the model was resident.
+        """
+        with self._lock:
+            entry = self._models.pop(key, None)
+            if entry is None:
+                return False
+            self._release(entry)
+            return True
+
+    def clear(self) -> None:
+        with self._lock:
+            while self._models:
+                _, entry = self._models.popitem(last=False)
+                self._release(entry)
+
+    def resident_bytes(self) -> int:
+        with self._lock:
+            return sum(entry.size_bytes for entry in self._models.values())
+
+    def get_stats(self) -> dict:
+        """
+        Returns hit/miss counters, load times and the resident models.
+        """
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "resident_mb": self.resident_bytes() / (1024 * 1024),
+                "memory_budget_mb": self.memory_budget_mb,
+                "load_times": {str(key): times for key, times in self._load_times.items()},
+                "models": [
+                    {
+                        "key": str(entry.key),
+                        "size_mb": entry.size_bytes / (1024 * 1024),
+                        "load_time": entry.load_time,
+                        "hits": entry.hits,
+                    }
+                    for entry in self._models.values()
+                ],
+            }
+
+    def log_stats(self) -> None:
+        stats = self.get_stats()
+        logging.info(f"Model registry: {stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions, "
+                     f"{stats['resident_mb']:.0f} MB resident across {len(stats['models'])} models")
+
+    def _evict(self, incoming_bytes: int) -> None:
+        # Drop least recently used models until the incoming model fits in the budget
+        if self._memory_budget is None:
+            return
+
+        while self._models and self.resident_bytes() + incoming_bytes > self._memory_budget:
+            key, entry = self._models.popitem(last=False)
+            self._evictions += 1
+            logging.info(f"Evicting model {key} from registry (~{entry.size_bytes / (1024 * 1024):.0f} MB)")
+            self._release(entry)
+
+    def _release(self, entry: ModelEntry) -> None:
+        entry.model = None
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def _cuda_allocated(self, key: tuple) -> int:
+        device = key[2]
+        if device is not None and str(device).startswith("cuda") and torch.cuda.is_available():
+            return torch.cuda.memory_allocated()
+        return 0
+
+    def _estimate_size(self, key: tuple, model, cuda_before: int) -> int:
+        kind, architecture, device, compute_type = key[:4]
+
+        # ctranslate2 models do not allocate through torch, so derive the size from the architecture
+        if kind == "asr" and architecture is not None:
+            family = str(architecture).split(".")[0].split("-")[0]
+            params = WHISPER_PARAMS_MILLIONS.get(family)
+            if params is not None:
+                return params * 1000 * 1000 * BYTES_PER_PARAM.get(compute_type, 2)
+
+        cuda_delta = self._cuda_allocated(key) - cuda_before
+        if cuda_delta > 0:
+            return cuda_delta
+
+        return self._torch_parameter_bytes(model)
+
+    @staticmethod
+    def _torch_parameter_bytes(model, max_depth: int = 3) -> int:
+        # Walk the model (and the tuples/pipelines wrapping it) a few levels deep looking for torch modules
+        seen = set()
+        total = 0
+        pending = [(model, 0)]
+        while pending:
+            obj, depth = pending.pop()
+            if obj is None or id(obj) in seen or depth > max_depth:
+                continue
+            seen.add(id(obj))
+            if isinstance(obj, torch.nn.Module):
+                total += sum(p.numel() * p.element_size() for p in obj.parameters())
+            elif isinstance(obj, (tuple, list)):
+                pending.extend((item, depth + 1) for item in obj)
+            elif hasattr(obj, "__dict__") and not isinstance(obj, (type, types.ModuleType, types.FunctionType)):
+                pending.extend((value, depth + 1) for value in vars(obj).values())
+        return total
@@ -0,0 +1,252 @@
+import logging
+import os
+import re
+import zlib
+
+# Pieces a BPE tokenizer rarely merges across: runs of letters, single digits and single symbols
+_PIECE_PATTERN = re.compile(r"[^\W\d_]+|\d|[^\w\s]|_")
+
+# Speaker prefix of a transcript line, e.g. "SPEAKER_01: ..." or "Speaker SPEAKER_01: ..."
+_SPEAKER_PATTERN = re.compile(r"^([^:\n]{1,40}):\s")
+
+# Tokens per line for the newline joining the lines of a chunk
+NEWLINE_TOKENS = 1
+
+# HuggingFace repositories with the tokenizer of each ollama model. Their tokenizer.json is only read
+# from the local HuggingFace cache, unless MERIDIAN_TOKENIZER_DOWNLOAD=1 allows fetching it from the hub
+TOKENIZER_REPOS = {
+    "llama3": "meta-llama/Meta-Llama-3-8B-Instruct",
+    "phi3": "microsoft/Phi-3-mini-4k-instruct",
+}
+
+# Tokenizers of the repositories above loaded by this process, or None where there was none
+_hub_tokenizers = {}
+
+# Models already warned about falling back to the estimate
+_estimated_models = set()
+
+
+def _load_hub_tokenizer(model: str):
+    repo = TOKENIZER_REPOS.get(model.split(":")[0]) if model else None
+    if repo is None:
+        return None
+    if repo not in _hub_tokenizers:
+        download = os.getenv("MERIDIAN_TOKENIZER_DOWNLOAD") == "1"
+        try:
+            from huggingface_hub import hf_hub_download
+            from tokenizers import Tokenizer
+            path = hf_hub_download(repo, "tokenizer.json", token=os.getenv("HF_ACCESS_TOKEN"), local_files_only=not download)
+            _hub_tokenizers[repo] = Tokenizer.from_file(path)
+        except Exception as e:
+            if download:
+                logging.warning(f"Could not load the {model} tokenizer from {repo}: {e}")
+            else:
+                logging.debug(f"The {model} tokenizer from {repo} is not in the HuggingFace cache: {e}")
+            _hub_tokenizers[repo] = None
+    return _hub_tokenizers[repo]
+
+
+class TokenCounter:
+    """
+    Counts model tokens offline, remembering the count of every line it has seen.
+
+    Uses a local HuggingFace tokenizer.json when one is given (or set in MERIDIAN_TOKENIZER), then
+    the model's own tokenizer for the ollama models in TOKENIZER_REPOS if it is in the HuggingFace
+    cache, then tiktoken, and otherwise an estimate from word lengths, which is logged as a warning.
+    Nothing is downloaded unless MERIDIAN_TOKENIZER_DOWNLOAD=1 is set.
+    """
+
+    def __init__(self, model: str = None, tokenizer_file: str = None, max_cached_lines: int = 200000):
+        """
+        Initializes a new instance of the TokenCounter class.
+
+        Args:
+            model (str, optional): The name of the model, used to pick its tokenizer.
+            tokenizer_file (str, optional): Path to a HuggingFace tokenizer.json. Defaults to MERIDIAN_TOKENIZER.
+            max_cached_lines (int, optional): The most line counts remembered. Defaults to 200000.
+        """
+        self._encode = None
+        self.backend = "estimate"
+        self._cache = {}
+        self._max_cached_lines = max_cached_lines
+
+        tokenizer_file = tokenizer_file or os.getenv("MERIDIAN_TOKENIZER")
+        if tokenizer_file:
+            try:
+                from tokenizers import Tokenizer
+                tokenizer = Tokenizer.from_file(tokenizer_file)
+                self._encode = lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+                self.backend = f"tokenizers:{os.path.basename(tokenizer_file)}"
+            except Exception as e:
+                logging.warning(f"Could not load tokenizer {tokenizer_file}: {e}")
+
+        if self._encode is None:
+            tokenizer = _load_hub_tokenizer(model)
+            if tokenizer is not None:
+                self._encode = lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+                self.backend = f"tokenizers:{TOKENIZER_REPOS[model.split(':')[0]]}"
+
+        if self._encode is None:
+            try:
+                import tiktoken
+                try:
+                    encoding = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    # Local models such as llama3 use BPE vocabularies close to cl100k
+                    encoding = tiktoken.get_encoding("cl100k_base")
+                self._encode = lambda text: len(encoding.encode(text, disallowed_special=()))
+                self.backend = f"tiktoken:{encoding.name}"
+            except Exception:
+                if model not in _estimated_models:
+                    _estimated_models.add(model)
+                    logging.warning(f"No tokenizer available for {model or 'the model'} - estimating token counts from "
+                                    "word lengths, so prompts may not fill or may overflow the context window. "
+                                    "Set MERIDIAN_TOKENIZER to the model's tokenizer.json for exact counts.")
+
+    @staticmethod
+    def estimate(text: str) -> int:
+        # Roughly one token per short word, one more for every further six letters, one per digit or symbol
+        return sum(1 + (len(piece) - 1) // 6 for piece in _PIECE_PATTERN.findall(text))
+
+    def count(self, text: str) -> int:
+        """
+        Returns the number of tokens in the text, without caching it.
+        """
+        return self._encode(text) if self._encode is not None else self.estimate(text)
+
+    def count_line(self, line: str) -> int:
+        """
+        Returns the number of tokens in a line, using the cached count if the line was seen before.
+        """
+        count = self._cache.get(line)
+        if count is None:
+            if len(self._cache) >= self._max_cached_lines:
+                self._cache.clear()
+            count = self.count(line)
+            self._cache[line] = count
+        return count
+
+
+class PromptChunker:
+    """
+    Splits a transcript into chunks which fill, but do not overflow, a model's context window.
+
+    The budget of each chunk is the context size minus the system prompt, the prompt template and
+    the room kept for the model's answer. Chunks are packed from whole speaker turns where possible
+    and fall back to line and then word boundaries for turns too long to fit.
+    """
+
+    def __init__(self, counter: TokenCounter, context_tokens: int, system_prompt: str = "",
+                 prompt_template: str = "{text}", output_tokens: int = 1024, min_fill: float = 0.75,
+                 anchor_divisor: int = 4):
+        """
+        Initializes a new instance of the PromptChunker class.
+
+        Args:
+            counter (TokenCounter): Counts the tokens of the model.
+            context_tokens (int): The context window of the model.
+            system_prompt (str, optional): The system prompt sent with every chunk.
+            prompt_template (str, optional): The user prompt, with {text} where the chunk goes.
+            output_tokens (int, optional): Tokens kept free for the answer. Defaults to 1024.
+            min_fill (float, optional): A turn that does not fit is split across chunks rather than
+                started in a new chunk while the current one is less full than this. Defaults to 0.75.
+            anchor_divisor (int, optional): Once a chunk is min_fill full, it also ends after any turn
+                whose hash is divisible by this. Because these cuts depend only on the text of the
+                turns, editing a line moves the chunk boundaries near it and no others. 0 disables
+                this. Defaults to 4.
+        """
+        self.counter = counter
+        overhead = counter.count(system_prompt) + counter.count(prompt_template.replace("{text}", ""))
+        # Chat templates add a few tokens around every message
+        self.budget = context_tokens - overhead - output_tokens - 16
+        if self.budget <= 0:
+            raise ValueError(f"A context of {context_tokens} tokens leaves no room for text after the prompt and output")
+        self.min_fill = min_fill
+        self.anchor_divisor = anchor_divisor
+
+    @staticmethod
+    def speaker_turns(lines: list) -> list:
+        """
+        Groups consecutive lines of the same speaker into turns.
+        """
+        turns = []
+        previous = object()
+        for line in lines:
+            match = _SPEAKER_PATTERN.match(line)
+            speaker = match.group(1) if match else None
+            if turns and (speaker is None or speaker == previous):
+                turns[-1].append(line)
+            else:
+                turns.append([line])
+            if speaker is not None:
+                previous = speaker
+        return turns
+
+    def is_anchor(self, turn: list) -> bool:
+        return zlib.crc32("\n".join(turn).encode('utf-8')) % self.anchor_divisor == 0
+
+    def _split_line(self, line: str) -> list:
+        # A line longer than the budget is cut between words
+        pieces = []
+        words = line.split(" ")
+        current = []
+        used = 0
+        for word in words:
+            tokens = self.counter.count(word) + 1
+            if current and used + tokens > self.budget:
+                pieces.append(" ".join(current))
+                current = []
+                used = 0
+            current.append(word)
+            used += tokens
+        if current:
+            pieces.append(" ".join(current))
+        return pieces
+
+    def chunk(self, text: str) -> list:
+        """
+        Splits the text into chunks of at most the token budget.
+
+        Returns:
+            list: The chunks, each a string of whole lines where possible.
+        """
+        lines = [line for line in text.split("\n") if line.strip()]
+        chunks = []
+        current = []
+        used = 0
+
+        def flush():
+            nonlocal current, used
+            if current:
+                chunks.append("\n".join(current))
+            current = []
+            used = 0
+
+        for turn in self.speaker_turns(lines):
+            counts = [self.counter.count_line(line) + NEWLINE_TOKENS for line in turn]
+            turn_tokens = sum(counts)
+
+            # Start a new chunk at the turn boundary if the current one is full enough
+            if used + turn_tokens > self.budget and used >= self.min_fill * self.budget:
+                flush()
+
+            for line, count in zip(turn, counts):
+                if count > self.budget:
+                    flush()
+                    pieces = self._split_line(line)
+                    for piece in pieces[:-1]:
+                        chunks.append(piece)
+                    current = [pieces[-1]]
+                    used = self.counter.count(pieces[-1]) + NEWLINE_TOKENS
+                    continue
+                if used + count > self.budget:
+                    flush()
+                current.append(line)
+                used += count
+
+            if self.anchor_divisor and used >= self.min_fill * self.budget and self.is_anchor(turn):
+                flush()
+        flush()
+
+        logging.info(f"Split {len(lines)} lines into {len(chunks)} chunks of at most {self.budget} tokens ({self.counter.backend})")
+        return chunks
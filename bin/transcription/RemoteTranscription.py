@@ -1,11 +1,19 @@
 
-from openai import APIError, OpenAI
+from openai import APIConnectionError, APIStatusError, OpenAI, RateLimitError
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import os
-import subprocess
+import random
 import sys
-import threading
+import tempfile
+import time
 from bin.transcription.BaseTranscription import BaseTranscription
+from bin.transcription.AudioDecoder import split_audio
+
+# Context window and answer budget of the summarization model
+SUMMARY_MODEL = "gpt-4-turbo"
+SUMMARY_CONTEXT_TOKENS = 128000
+SUMMARY_OUTPUT_TOKENS = 4096
 
 class RemoteTranscription(BaseTranscription):
     """
@@ -16,14 +24,43 @@ class RemoteTranscription(BaseTranscription):
 
     Methods:
         transcribe_audio(file_path): Transcribes the audio file located at the given file path.
-        summarize_session(transcription): Summarizes the transcription of a session.
+        complete(system_prompt, prompt): Sends one prompt to the chat model, used to summarize sessions.
     """
 
-    def __init__(self):
+    def __init__(self, base_url=None, max_concurrency=4, max_retries=5, backoff_seconds=1.0, max_backoff_seconds=60.0, on_missing="fail",
+                 reencode=False):
         """
         Initializes the RemoteTranscription object.
+
+        Args:
+            base_url (str, optional): URL of the OpenAI-compatible API. Defaults to OPENAI_BASE_URL or the OpenAI API.
+            max_concurrency (int, optional): The most segments uploaded at once. Defaults to 4.
+            max_retries (int, optional): Retries per segment after rate limits or transient errors. Defaults to 5.
+            backoff_seconds (float, optional): The first retry delay, doubled after every attempt. Defaults to 1.
+            max_backoff_seconds (float, optional): The longest retry delay. Defaults to 60.
+            on_missing (str, optional): "fail" to fail the transcription when a segment cannot be transcribed,
+                or "gap" to mark the missing segment in the text. Defaults to "fail".
+            reencode (bool, optional): Re-encode segments to low bit rate mono Opus to upload fewer bytes. Defaults to False.
         """
-        self.client = OpenAI()
+        super().__init__()
+        if on_missing not in ("fail", "gap"):
+            raise ValueError(f"on_missing must be 'fail' or 'gap', not {on_missing}")
+        # Retries are handled per segment below, so the client itself does not retry
+        self.client = OpenAI(base_url=base_url or os.getenv("OPENAI_BASE_URL"), max_retries=0)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.on_missing = on_missing
+        self.reencode = reencode
+
+        role = "You are an assistant helping to summarize the events of a Dungeons and Dragons session"
+        role += "There may be multiple speakers - one of whome is the Game Master of the transcript. When possible, try to summarize each character's actions."
+        role+= "Summarize the session in a way that is easy to understand and captures the essence of the session."
+        self._summary_model = SUMMARY_MODEL
+        self._summary_system_prompt = role
+        self._summary_context_tokens = SUMMARY_CONTEXT_TOKENS
+        self._summary_output_tokens = SUMMARY_OUTPUT_TOKENS
 
     def transcribe_audio(self, file_path) -> str:
         """
@@ -37,7 +74,6 @@ class RemoteTranscription(BaseTranscription):
         """
         # Check the file type
         file_extension = os.path.splitext(file_path)[1].lower()
-        base_name = os.path.basename(file_path).split('.')[0]
         logging.info("file_extension: %s", file_extension)
         supported_extensions = ['flac', 'm4a', 'mp3', 'mp4', 'mpeg', 'mpga', 'oga', 'ogg', 'wav', 'webm']
         if file_extension[1:] not in supported_extensions:
@@ -46,183 +82,102 @@ class RemoteTranscription(BaseTranscription):
         else:
             logging.info(f"File {file_path} has a supported audio file type. Continuing...")
 
-        def split_m4a(input_file, segment_time, output_format='m4a'):
-            """
-            Splits the given M4A audio file into segments.
-
-            Args:
-                input_file (str): The path to the input audio file.
-                segment_time (int): The duration of each segment in seconds.
-                output_format (str, optional): The format of the output files. Defaults to 'm4a'.
-            """
-            # Construct the ffmpeg command to split the file
-            file_name = os.path.splitext(input_file)[0].lower()
-            command = [
-                'ffmpeg',
-                '-i', input_file,              # Input file
-                '-f', 'segment',               # Use the segment muxer
-                '-segment_time', str(segment_time),  # Duration of each segment
-                '-c', 'copy',                  # Copy the streams without re-encoding
-                f'{file_name}_%03d.{output_format}'  # Output file pattern
-            ]
-            logging.info("Running ffmpeg command: %s", command)
-            # Execute the command
-            subprocess.run(command, check=True)
-
-        split_m4a(file_path, 500)
-
-        # Extract the directory from file_path
-        directory = os.path.dirname(file_path)
-
-        # Find a list of files that start with the name "output_segment" in the current directory
-        logging.info("Looking for files starting with %s in the current directory", base_name)
-        logging.info("Files in the directory: %s", os.listdir(directory))
-        output_files = [file for file in os.listdir(directory) if file.startswith(base_name.lower()) and file.endswith(".m4a")]
+        # Segments go to a private temporary directory, never next to the user's recording, and are
+        # sized from the bit rate to stay under the upload limit
+        segment_dir = tempfile.TemporaryDirectory(prefix="meridian-")
+        try:
+            output_files = split_audio(file_path, segment_dir.name, reencode=self.reencode)
+        except Exception:
+            segment_dir.cleanup()
+            raise
         logging.info("Output files: %s", output_files)
 
-        # Transcribe each chunk individually
-        transcriptions = []
-
-        # Create a list to hold the threads
-        threads = []
+        # Upload the segments from a bounded pool and keep every result at its segment's position
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="upload") as executor:
+                futures = [executor.submit(self._transcribe_segment, file, i, len(output_files)) for i, file in enumerate(output_files)]
+                transcriptions = []
+                for i, future in enumerate(futures):
+                    try:
+                        transcriptions.append(future.result())
+                    except Exception as e:
+                        logging.error("Transcription of segment %d of %d failed: %s", i + 1, len(output_files), e)
+                        transcriptions.append(None)
+        finally:
+            segment_dir.cleanup()
+
+        missing = [i for i, transcription in enumerate(transcriptions) if transcription is None]
+        if missing:
+            if self.on_missing == "fail":
+                logging.error("Segments %s could not be transcribed - failing the transcription", [i + 1 for i in missing])
+                return None
+            for i in missing:
+                transcriptions[i] = f"[Segment {i + 1} of {len(output_files)} could not be transcribed]"
+
+        logging.info("Transcriptions: %s", transcriptions)
+        return ' '.join(transcription.strip() for transcription in transcriptions)
+
+    def _transcribe_segment(self, file, index, count) -> str:
+        """
+        Transcribes one segment, retrying rate limits and transient errors with exponential backoff.
 
-        # Create a semaphore to protect the logging.info call
-        logging_semaphore = threading.Semaphore()
+        Args:
+            file (str): The path to the segment file.
+            index (int): The index of the segment.
+            count (int): The number of segments.
 
-        for i, file in enumerate(output_files):
+        Returns:
+            str: The transcribed text of the segment.
+        """
+        for attempt in range(self.max_retries + 1):
             try:
-                logging_semaphore.acquire()  # Acquire the semaphore before logging
-                logging.info("Processing segment %d", i)
-                logging_semaphore.release()  # Release the semaphore after logging
-
-                # Define the function to be executed in the thread
-                def process_segment(file, i):
-                    """
-                    Transcribes a segment of the audio file.
-
-                    Args:
-                        file (str): The path to the segment file.
-                        i (int): The index of the segment.
-
-                    """
+                logging.info("Processing segment %d of %d (attempt %d)", index + 1, count, attempt + 1)
+                with open(file, 'rb') as audio_file:
                     transcription = self.client.audio.transcriptions.create(
                         model="whisper-1",
-                        file=open(f"{directory}/{file}", 'rb'),
+                        file=audio_file,
                         response_format="text",
                         language="en"
                         #prompt="Generate a transcript of the audio file and return a response in English."
                     )
-                    logging_semaphore.acquire()  # Acquire the semaphore before logging
-                    logging.info("Finished with segment %d", i)
-                    logging.info("Response: %s", transcription)
-                    logging_semaphore.release()  # Release the semaphore after logging
-
-                    # Append the transcription to the list in a thread-safe way
-                    with threading.Lock():
-                        transcriptions.append((i, transcription))
-
-                # Create a new thread for each iteration
-                thread = threading.Thread(target=process_segment, args=(file, i))
-                threads.append(thread)
-
-                # Start the thread
-                thread.start()
-
-            except APIError as e:
-                logging_semaphore.acquire()  # Acquire the semaphore before logging
-                logging.error("APIError: Transcription request for chunk %d failed.", i+1)
-                logging.error(e)
-                logging_semaphore.release()  # Release the semaphore after logging
-
-            except Exception as e:
-                logging_semaphore.acquire()  # Acquire the semaphore before logging
-                logging.error(e)
-                logging_semaphore.release()  # Release the semaphore after logging
-
-
-        # Wait for all threads to complete
-        for thread in threads:
-            thread.join()
-
-        sorted_transcriptions = sorted(transcriptions, key=lambda x: x[0])
-        sorted_transcriptions = [t[1] for t in sorted_transcriptions]
-        logging.info("Transcriptions: %s", sorted_transcriptions)
-
-        # Combine the transcriptions and sort them
-        transcribed_text = ' '.join(t[1] for t in sorted_transcriptions)
-
-        return transcribed_text
-
-    def summarize_text(self, transcription) -> str:
+                logging.info("Finished with segment %d", index + 1)
+                logging.debug("Response: %s", transcription)
+                return transcription
+            except (RateLimitError, APIConnectionError, APIStatusError) as e:
+                # Client errors other than rate limits will fail the same way again
+                if isinstance(e, APIStatusError) and not isinstance(e, RateLimitError) and e.status_code < 500:
+                    raise
+                if attempt == self.max_retries:
+                    raise
+                delay = self._retry_delay(e, attempt)
+                logging.warning("APIError: Transcription request for segment %d failed (%s) - retrying in %.1f seconds", index + 1, e, delay)
+                time.sleep(delay)
+
+    def _retry_delay(self, error, attempt) -> float:
+        # Honour the server's Retry-After header on rate limits, otherwise back off exponentially with jitter
+        response = getattr(error, "response", None)
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+            if retry_after is not None:
+                try:
+                    return min(float(retry_after), self.max_backoff_seconds)
+                except ValueError:
+                    pass
+        delay = min(self.backoff_seconds * (2 ** attempt), self.max_backoff_seconds)
+        return delay * random.uniform(0.5, 1.0)
+
+    def complete(self, system_prompt, prompt) -> str:
         """
-        Summarizes the transcription of a session.
-
-        Args:
-            transcription (str or list): The transcription of the session, either as a single string or a list of strings.
-
-        Returns:
-            str: The summarized text.
+        Sends a single prompt to the OpenAI chat model and returns its answer.
         """
-        # Check if the input is a list of strings, if so, concatenate them
-        if isinstance(transcription, list):
-            transcription = ' '.join(transcription)
-
-        logging.info("Submitting text for summary:\n", transcription)
-
-        role = "You are an assistant helping to summarize the events of a Dungeons and Dragons session"
-        role += "There may be multiple speakers - one of whome is the Game Master of the transcript. When possible, try to summarize each character's actions."
-        role+= "Summarize the session in a way that is easy to understand and captures the essence of the session."
-
-        # Analyze the transcription string and break it into a list of strings that are 128,000 tokens
-        transcription_list = []
-        max_tokens = 128000
-        num_tokens = 0
-        current_string = ""
-
-        logging.info(f"Found {len(transcription.split())} tokens in the transcription.")
-        for word in transcription.split():
-            num_tokens += len(word.split())
-            if num_tokens <= max_tokens:
-                current_string += word + " "
-            else:
-                transcription_list.append(current_string.strip())
-                current_string = word + " "
-                num_tokens = len(word.split())
-
-        # Add the last string to the list
-        if current_string:
-            transcription_list.append(current_string.strip())
-
-        logging.info("Number of segments: ", len(transcription_list))
-        # Submit a request to OpenAI's service for summarization
-        summary = None
-        output_string = ""
-
-        for i in range(len(transcription_list)):
-            print(f"Calling OpenAI API for summary of transcription segment {i}")
-            try:
-                summary = self.client.chat.completions.create(
-                    model="gpt-4-turbo",
-                    messages=[
-                        {"role": "system", "content" :role},
-                        {"role": "user", "content": transcription_list[i]}
-                    ]
-                )
-                print(f"Summary response: {summary}")
-                if summary.choices[0].message.role == 'assistant':
-                    print("Response for chunk ", i, ":", summary.choices[0].message.content  )
-                    output_string += summary.choices[0].message.content + " "
-                else:
-                    logging.error("Error: Summary request failed.")
-                    sys.exit(2)
-
-            except APIError as e:
-                logging.error("APIError: Summary request failed.")
-                logging.error(e)
-                sys.exit(2)
-            except Exception as e:
-                logging.error(e)
-                sys.exit(2)
-            print(f"Done with summarization of segment {i}")
-
-        return output_string
\ No newline at end of file
+        summary = self.client.chat.completions.create(
+            model=SUMMARY_MODEL,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=SUMMARY_OUTPUT_TOKENS
+        )
+        if summary.choices[0].message.role != 'assistant':
+            raise RuntimeError("Summary request failed.")
+        return summary.choices[0].message.content
@@ -0,0 +1,217 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+
+def atomic_write_json(file_path: str, data) -> None:
+    """
+    Writes data as JSON so that readers see either the old or the new file, never a partial one.
+    """
+    directory = os.path.dirname(file_path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, default=_json_default)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _json_default(value):
+    # whisperx results can contain numpy scalars
+    if hasattr(value, "item"):
+        return value.item()
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class ResultCache:
+    """
+    On-disk cache of transcription stage results, keyed by the audio content and the stage parameters.
+
+    Transcription, alignment and diarization results are stored as separate entries, so changing the
+    parameters of one stage (e.g. the number of speakers) still reuses the results of the others.
+    Entries are evicted least recently used first once the cache grows past its size limit.
+    """
+
+    def __init__(self, cache_dir: str = "./cache/results", max_size_mb: int = None):
+        """
+        Initializes a new instance of the ResultCache class.
+
+        Args:
+            cache_dir (str, optional): The directory holding the cache. Defaults to ./cache/results.
+            max_size_mb (int, optional): Size limit of the cache. Defaults to the MERIDIAN_CACHE_MB
+                environment variable, or 2048 MB if unset.
+        """
+        if max_size_mb is None:
+            max_size_mb = int(os.getenv("MERIDIAN_CACHE_MB", "2048"))
+
+        self.cache_dir = cache_dir
+        self.max_size_mb = max_size_mb
+        self._hashes_path = os.path.join(cache_dir, "file_hashes.json")
+        self._lock = threading.Lock()
+
+    def hash_file(self, file_path: str) -> str:
+        """
+        Returns the SHA-256 of the file contents.
+
+        Hashes are remembered by path, size and modification time so unchanged files are only read once.
+        """
+        stat = os.stat(file_path)
+        memo_key = f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+        with self._lock:
+            hashes = self._read_json(self._hashes_path) or {}
+        if memo_key in hashes:
+            return hashes[memo_key]
+
+        start_time = time.time()
+        sha = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(block)
+        digest = sha.hexdigest()
+        logging.info(f"Hashed {file_path} in {(time.time() - start_time):.3f} seconds: {digest}")
+
+        with self._lock:
+            hashes = self._read_json(self._hashes_path) or {}
+            hashes[memo_key] = digest
+            atomic_write_json(self._hashes_path, hashes)
+        return digest
+
+    @staticmethod
+    def fingerprint(params: dict) -> str:
+        return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+    def entry_path(self, kind: str, audio_hash: str, params: dict) -> str:
+        return os.path.join(self.cache_dir, audio_hash[:2], audio_hash, f"{kind}-{self.fingerprint(params)}.json")
+
+    def get(self, kind: str, audio_hash: str, params: dict):
+        """
+        Returns the cached result of a stage, or None on a miss.
+
+        Args:
+            kind (str): The stage, e.g. "asr", "align" or "diarize".
+            audio_hash (str): The content hash returned by hash_file.
+            params (dict): Every model name and option that affects the result.
+        """
+        path = self.entry_path(kind, audio_hash, params)
+        data = self._read_json(path)
+        if data is None:
+            logging.info(f"Result cache miss for {kind} of {audio_hash[:12]}")
+            return None
+
+        # Touch the entry so eviction sees it as recently used
+        os.utime(path)
+        logging.info(f"Result cache hit for {kind} of {audio_hash[:12]}")
+        return data["result"]
+
+    def put(self, kind: str, audio_hash: str, params: dict, result) -> None:
+        path = self.entry_path(kind, audio_hash, params)
+        atomic_write_json(path, {"kind": kind, "params": params, "created": time.time(), "result": result})
+        self.prune()
+
+    def entries(self) -> list:
+        """
+        Returns a description of every entry in the cache, oldest first.
+        """
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                if path == self._hashes_path or name.startswith(".tmp-"):
+                    continue
+                stat = os.stat(path)
+                entries.append({
+                    "path": path,
+                    "audio_hash": os.path.basename(root),
+                    "kind": name.split("-")[0],
+                    "size": stat.st_size,
+                    "last_used": stat.st_mtime,
+                })
+        entries.sort(key=lambda entry: entry["last_used"])
+        return entries
+
+    def size_bytes(self) -> int:
+        return sum(entry["size"] for entry in self.entries())
+
+    def prune(self, max_size_mb: int = None) -> int:
+        """
+        Removes least recently used entries until the cache fits in max_size_mb.
+
+        Returns:
+            int: The number of entries removed.
+        """
+        if max_size_mb is None:
+            max_size_mb = self.max_size_mb
+
+        entries = self.entries()
+        total = sum(entry["size"] for entry in entries)
+        limit = max_size_mb * 1024 * 1024
+        removed = 0
+        for entry in entries:
+            if total <= limit:
+                break
+            try:
+                os.remove(entry["path"])
+            except FileNotFoundError:
+                pass
+            total -= entry["size"]
+            removed += 1
+
+        if removed:
+            logging.info(f"Removed {removed} entries from the result cache")
+            self._remove_empty_dirs()
+        return removed
+
+    def clear(self) -> int:
+        return self.prune(0)
+
+    def summary(self) -> str:
+        entries = self.entries()
+        by_kind = {}
+        for entry in entries:
+            count, size = by_kind.get(entry["kind"], (0, 0))
+            by_kind[entry["kind"]] = (count + 1, size + entry["size"])
+
+        lines = [f"Result cache at {os.path.abspath(self.cache_dir)}: {len(entries)} entries for "
+                 f"{len({entry['audio_hash'] for entry in entries})} recordings, "
+                 f"{sum(entry['size'] for entry in entries) / (1024 * 1024):.1f} MB of {self.max_size_mb} MB"]
+        for kind, (count, size) in sorted(by_kind.items()):
+            lines.append(f"  {kind}: {count} entries, {size / (1024 * 1024):.1f} MB")
+        return "\n".join(lines)
+
+    def _remove_empty_dirs(self) -> None:
+        for root, dirs, files in os.walk(self.cache_dir, topdown=False):
+            if root != self.cache_dir and not dirs and not files:
+                try:
+                    os.rmdir(root)
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _read_json(path: str):
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f"Removing unreadable cache file {path}: {e}")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
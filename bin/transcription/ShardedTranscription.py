@@ -0,0 +1,219 @@
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from bin.transcription.AudioDecoder import get_audio_duration
+from bin.transcription.AudioWindowing import clip_segments, commit_boundaries, load_audio_window, plan_windows, shift_segments
+
+# Settings of the current worker process, set once by _init_worker
+_worker_settings = {}
+
+
+def plan_shards(duration: float, num_shards: int, overlap_seconds: float = 30.0) -> list:
+    """
+    Splits the timeline [0, duration) into num_shards overlapping (start, end) shards of equal length.
+
+    Recordings too short to give every shard more than its overlap get fewer shards.
+    """
+    num_shards = max(1, min(num_shards, int(duration // (2 * overlap_seconds)) or 1))
+    if num_shards == 1:
+        return [(0.0, duration)]
+    # Every shard advances by (duration - overlap) / num_shards and is one overlap longer than that
+    step = (duration - overlap_seconds) / num_shards
+    shards = plan_windows(duration, step + overlap_seconds, overlap_seconds)[:num_shards]
+    # Rounding can leave the last shard a hair short of the end
+    shards[-1] = (shards[-1][0], duration)
+    return shards
+
+
+def merge_shards(shard_segments: list, shards: list) -> list:
+    """
+    Joins the segments of every shard into one timeline, cutting each overlap in its middle.
+
+    Args:
+        shard_segments (list): The segments of each shard, in absolute time, in shard order.
+        shards (list): The (start, end) of each shard.
+
+    Returns:
+        list: The merged segments, ordered by start time, with words from the overlaps kept once.
+    """
+    boundaries = commit_boundaries(shards)
+    merged = []
+    lower = 0.0
+    for segments, upper in zip(shard_segments, boundaries):
+        merged.extend(clip_segments(segments, lower, upper))
+        lower = upper
+    merged.sort(key=lambda segment: segment["start"])
+    return merged
+
+
+def _init_worker(audio_model: str, compute_type: str, batch_size: int, threads: int, skip_silence: bool) -> None:
+    # Each worker loads its own model once and limits its thread pools so workers don't oversubscribe the cores
+    import torch
+    import whisperx as whisper
+    from bin.transcription.ModelRegistry import ModelRegistry
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(process)d - %(levelname)s - %(message)s',
+                        handlers=[logging.StreamHandler(sys.stdout)])
+    torch.set_num_threads(threads)
+
+    key = ModelRegistry.make_key("asr", audio_model, "cpu", compute_type, threads=threads)
+    _worker_settings["model"] = ModelRegistry.get_instance().get(key, lambda: whisper.load_model(
+        whisper_arch=audio_model,
+        device="cpu",
+        compute_type=compute_type,
+        threads=threads
+    ))
+    _worker_settings["batch_size"] = batch_size
+    _worker_settings["skip_silence"] = skip_silence
+
+
+def _transcribe_shard(file_path: str, start: float, end: float) -> dict:
+    import whisperx as whisper
+    from bin.transcription.ModelRegistry import ModelRegistry
+    from bin.transcription.SpeechTimeline import SpeechTimeline
+
+    start_time = time.time()
+    audio = load_audio_window(file_path, start, end - start)
+
+    timeline = None
+    if _worker_settings["skip_silence"]:
+        timeline = SpeechTimeline.detect(audio)
+        if not timeline.regions:
+            return {"segments": [], "language": None, "time": time.time() - start_time}
+        audio = timeline.compact(audio)
+
+    result = _worker_settings["model"].transcribe(audio, batch_size=_worker_settings["batch_size"])
+    language = result["language"]
+    if result["segments"]:
+        key = ModelRegistry.make_key("align", language, "cpu", language=language)
+        model_a, metadata = ModelRegistry.get_instance().get(key, lambda: whisper.load_align_model(
+            language_code=language,
+            device="cpu"))
+        result = whisper.align(result["segments"], model_a, metadata, audio, "cpu", return_char_alignments=False)
+
+    if timeline is not None:
+        timeline.remap_result(result)
+    segments = shift_segments(result["segments"], start)
+    return {"segments": segments, "language": language, "time": time.time() - start_time}
+
+
+class ShardedTranscription:
+    """
+    Transcribes and aligns one recording on several CPU worker processes at once.
+
+    The recording is split into overlapping time shards, one per worker. Every worker decodes only its
+    own shard and runs its own model, and the shards are stitched back together in the middle of each
+    overlap so words heard by two workers are kept once.
+    """
+
+    def __init__(self, workers: int = None, audio_model: str = "small.en", compute_type: str = "int8",
+                 batch_size: int = 16, threads_per_worker: int = None, overlap_seconds: float = 30.0,
+                 skip_silence: bool = True):
+        """
+        Initializes a new instance of the ShardedTranscription class.
+
+        Args:
+            workers (int, optional): The number of worker processes. Defaults to one per four cores.
+            audio_model (str, optional): The whisper model every worker loads. Defaults to "small.en".
+            compute_type (str, optional): The CTranslate2 compute type. Defaults to "int8".
+            batch_size (int, optional): The transcription batch size of each worker. Defaults to 16.
+            threads_per_worker (int, optional): CPU threads per worker. Defaults to the cores divided by the workers.
+            overlap_seconds (float, optional): The overlap between neighbouring shards. Defaults to 30.
+            skip_silence (bool, optional): Cut silence out of each shard before transcribing it. Defaults to True.
+        """
+        cores = os.cpu_count() or 1
+        self.workers = workers or max(1, cores // 4)
+        self.threads_per_worker = threads_per_worker or max(1, cores // self.workers)
+        self.audio_model = audio_model
+        self.compute_type = compute_type
+        self.batch_size = batch_size
+        self.overlap_seconds = overlap_seconds
+        self.skip_silence = skip_silence
+        self.shard_times = []
+        self._executor = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # The pool is kept between recordings so the workers only load their models once
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.audio_model, self.compute_type, self.batch_size, self.threads_per_worker, self.skip_silence))
+        return self._executor
+
+    def close(self) -> None:
+        """
+        Stops the worker processes.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def transcribe(self, file_path: str) -> dict:
+        """
+        Transcribes and aligns the recording.
+
+        Returns:
+            dict: A whisperx result with the merged, word-aligned segments in absolute time.
+        """
+        duration = get_audio_duration(file_path)
+        shards = plan_shards(duration, self.workers, self.overlap_seconds)
+        logging.info(f"Transcribing {file_path} ({duration:.1f} seconds) in {len(shards)} shards "
+                     f"on {self.workers} workers with {self.threads_per_worker} threads each")
+
+        executor = self._get_executor()
+        futures = [executor.submit(_transcribe_shard, file_path, start, end) for start, end in shards]
+        results = [future.result() for future in futures]
+
+        self.shard_times = [result["time"] for result in results]
+        languages = [result["language"] for result in results if result["language"] is not None]
+        segments = merge_shards([result["segments"] for result in results], shards)
+        logging.info(f"Shard times: {', '.join(f'{shard_time:.1f}' for shard_time in self.shard_times)} seconds")
+
+        return {"segments": segments, "language": max(set(languages), key=languages.count) if languages else "en"}
+
+
+def benchmark(file_path: str, worker_counts: list = None, **kwargs) -> list:
+    """
+    Times sharded transcription of a recording with different numbers of workers.
+
+    Model loading is excluded: every pool is warmed up on a short slice before it is timed.
+    """
+    cores = os.cpu_count() or 1
+    worker_counts = worker_counts or [count for count in (1, 2, 4, 8) if count <= cores]
+    reports = []
+    for workers in worker_counts:
+        sharded = ShardedTranscription(workers=workers, threads_per_worker=max(1, cores // max(worker_counts)), **kwargs)
+        try:
+            warmups = [sharded._get_executor().submit(_transcribe_shard, file_path, 0.0, 1.0) for _ in range(workers)]
+            for future in warmups:
+                future.result()
+
+            start_time = time.time()
+            result = sharded.transcribe(file_path)
+            wall_time = time.time() - start_time
+        finally:
+            sharded.close()
+
+        reports.append({
+            "workers": workers,
+            "wall_seconds": wall_time,
+            "words": sum(len(segment.get("words", [])) for segment in result["segments"]),
+            "speedup": reports[0]["wall_seconds"] / wall_time if reports else 1.0,
+        })
+        logging.info(f"Sharded transcription benchmark: {reports[-1]}")
+    return reports
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if len(sys.argv) < 2:
+        print("Usage: python -m bin.transcription.ShardedTranscription <audio_file> [worker counts...]")
+        sys.exit(1)
+    for report in benchmark(sys.argv[1], [int(count) for count in sys.argv[2:]] or None):
+        print(report)
@@ -0,0 +1,230 @@
+import logging
+import random
+import time
+
+import numpy as np
+
+# Overlaps smaller than this are treated as touching rather than overlapping
+EPSILON = 1e-9
+
+
+class SpeakerIntervals:
+    """
+    Diarization turns arranged as sorted per-speaker interval arrays for fast overlap queries.
+
+    For each speaker, F(t) = sum over turns of the part of the turn before t. The total overlap of
+    [a, b] with that speaker's turns is F(b) - F(a), and F(t) is found with two binary searches over
+    the sorted turn starts and ends and their prefix sums.
+    """
+
+    def __init__(self, starts, ends, speakers):
+        """
+        Initializes a new instance of the SpeakerIntervals class.
+
+        Args:
+            starts (array-like): Start time of each turn.
+            ends (array-like): End time of each turn.
+            speakers (array-like): Speaker label of each turn.
+        """
+        starts = np.asarray(starts, dtype=np.float64)
+        # Sorting starts and ends independently is only valid for well-formed turns
+        ends = np.maximum(np.asarray(ends, dtype=np.float64), starts)
+        speakers = np.asarray(speakers)
+
+        self.labels = sorted(set(speakers.tolist()))
+        self._tables = []
+        for label in self.labels:
+            mask = speakers == label
+            speaker_starts = np.sort(starts[mask])
+            speaker_ends = np.sort(ends[mask])
+            self._tables.append((
+                speaker_starts,
+                np.concatenate(([0.0], np.cumsum(speaker_starts))),
+                speaker_ends,
+                np.concatenate(([0.0], np.cumsum(speaker_ends))),
+            ))
+
+        # All turns ordered by start and by end, used to find the nearest turn
+        order_by_start = np.argsort(starts, kind='stable')
+        order_by_end = np.argsort(ends, kind='stable')
+        self._all_starts = starts[order_by_start]
+        self._speakers_by_start = speakers[order_by_start]
+        self._all_ends = ends[order_by_end]
+        self._speakers_by_end = speakers[order_by_end]
+
+    @classmethod
+    def from_diarization(cls, diarize_segments) -> "SpeakerIntervals":
+        """
+        Creates the intervals from a diarization DataFrame or a list of {"start", "end", "speaker"} turns.
+        """
+        if isinstance(diarize_segments, list):
+            return cls([turn["start"] for turn in diarize_segments],
+                       [turn["end"] for turn in diarize_segments],
+                       [turn["speaker"] for turn in diarize_segments])
+        return cls(diarize_segments["start"], diarize_segments["end"], diarize_segments["speaker"])
+
+    def _covered_before(self, times: np.ndarray, table) -> np.ndarray:
+        starts, start_prefix, ends, end_prefix = table
+        started = np.searchsorted(starts, times, side='right')
+        ended = np.searchsorted(ends, times, side='right')
+        return (started * times - start_prefix[started]) - (ended * times - end_prefix[ended])
+
+    def overlaps(self, starts, ends) -> np.ndarray:
+        """
+        Returns the total overlap of every query interval with every speaker.
+
+        Returns:
+            np.ndarray: Array of shape (number of speakers, number of intervals).
+        """
+        starts = np.asarray(starts, dtype=np.float64)
+        ends = np.asarray(ends, dtype=np.float64)
+        result = np.empty((len(self.labels), len(starts)), dtype=np.float64)
+        for i, table in enumerate(self._tables):
+            result[i] = self._covered_before(ends, table) - self._covered_before(starts, table)
+        return result
+
+    def nearest(self, starts, ends) -> list:
+        """
+        Returns the speaker of the turn closest to each query interval.
+        """
+        starts = np.asarray(starts, dtype=np.float64)
+        ends = np.asarray(ends, dtype=np.float64)
+
+        # Latest turn ending before the interval starts, and earliest turn starting after it ends
+        before = np.searchsorted(self._all_ends, starts, side='right') - 1
+        after = np.searchsorted(self._all_starts, ends, side='left')
+        gap_before = np.where(before >= 0, starts - self._all_ends[np.maximum(before, 0)], np.inf)
+        gap_after = np.where(after < len(self._all_starts),
+                             self._all_starts[np.minimum(after, len(self._all_starts) - 1)] - ends, np.inf)
+
+        speakers = []
+        for i in range(len(starts)):
+            if gap_before[i] == np.inf and gap_after[i] == np.inf:
+                speakers.append(None)
+            elif gap_before[i] <= gap_after[i]:
+                speakers.append(self._speakers_by_end[before[i]])
+            else:
+                speakers.append(self._speakers_by_start[after[i]])
+        return speakers
+
+    def assign(self, starts, ends, fill_nearest: bool = False) -> list:
+        """
+        Returns the speaker with the most overlap for each query interval, or None if none overlaps.
+
+        Args:
+            starts (array-like): Start time of each interval.
+            ends (array-like): End time of each interval.
+            fill_nearest (bool, optional): Use the nearest speaker for intervals without overlap. Defaults to False.
+        """
+        if len(starts) == 0:
+            return []
+        if not self.labels:
+            return [None] * len(starts)
+
+        overlaps = self.overlaps(starts, ends)
+        best = np.argmax(overlaps, axis=0)
+        has_overlap = overlaps[best, np.arange(len(best))] > EPSILON
+        speakers = [self.labels[index] if overlap else None for index, overlap in zip(best, has_overlap)]
+
+        if fill_nearest and not has_overlap.all():
+            missing = np.flatnonzero(~has_overlap)
+            nearest = self.nearest(np.asarray(starts)[missing], np.asarray(ends)[missing])
+            for index, speaker in zip(missing, nearest):
+                speakers[index] = speaker
+        return speakers
+
+
+def assign_word_speakers(diarize_segments, transcript_result: dict, fill_nearest: bool = False) -> dict:
+    """
+    Labels every segment and word with the speaker it overlaps the most.
+
+    Drop-in replacement for whisperx.assign_word_speakers: the result is modified in place and
+    returned, segments and timed words get a "speaker" key when a speaker overlaps them.
+
+    Args:
+        diarize_segments: Diarization turns, as a DataFrame or a list of {"start", "end", "speaker"}.
+        transcript_result (dict): The aligned whisperx result.
+        fill_nearest (bool, optional): Assign the nearest speaker when no turn overlaps. Defaults to False.
+
+    Returns:
+        dict: The transcript result with speaker labels.
+    """
+    intervals = SpeakerIntervals.from_diarization(diarize_segments)
+
+    # Gather every segment and timed word into one batch of queries
+    items = []
+    starts = []
+    ends = []
+    for segment in transcript_result["segments"]:
+        items.append(segment)
+        starts.append(segment["start"])
+        ends.append(segment["end"])
+        for word in segment.get("words", []):
+            if "start" in word:
+                items.append(word)
+                starts.append(word["start"])
+                ends.append(word.get("end", word["start"]))
+
+    speakers = intervals.assign(starts, ends, fill_nearest)
+    for item, speaker in zip(items, speakers):
+        if speaker is not None:
+            item["speaker"] = speaker
+
+    return transcript_result
+
+
+def _synthetic_session(num_words: int, num_turns: int, num_speakers: int, seed: int = 0):
+    rng = random.Random(seed)
+    duration = num_words * 0.4
+    boundaries = sorted(rng.uniform(0, duration) for _ in range(num_turns - 1))
+    edges = [0.0] + boundaries + [duration]
+    turns = [{"start": edges[i], "end": max(edges[i], edges[i + 1] - rng.uniform(0, 0.3)), "speaker": f"SPEAKER_{rng.randrange(num_speakers):02d}"}
+             for i in range(num_turns)]
+
+    segments = []
+    for i in range(0, num_words, 20):
+        words = [{"word": f"w{j}", "start": j * 0.4, "end": j * 0.4 + 0.3} for j in range(i, min(i + 20, num_words))]
+        segments.append({"start": words[0]["start"], "end": words[-1]["end"], "text": " ".join(w["word"] for w in words), "words": words})
+    return turns, {"segments": segments}
+
+
+def benchmark(num_words: int = 50000, num_turns: int = 5000, num_speakers: int = 6) -> dict:
+    """
+    Times this engine against whisperx.assign_word_speakers on a synthetic session and checks they agree.
+    """
+    import copy
+    import pandas as pd
+    import whisperx
+
+    turns, result = _synthetic_session(num_words, num_turns, num_speakers)
+    diarize_df = pd.DataFrame(turns)
+
+    start_time = time.time()
+    expected = whisperx.assign_word_speakers(diarize_df.copy(), copy.deepcopy(result))
+    whisperx_time = time.time() - start_time
+
+    start_time = time.time()
+    actual = assign_word_speakers(diarize_df, copy.deepcopy(result))
+    engine_time = time.time() - start_time
+
+    mismatches = 0
+    for expected_segment, actual_segment in zip(expected["segments"], actual["segments"]):
+        pairs = [(expected_segment, actual_segment)] + list(zip(expected_segment["words"], actual_segment["words"]))
+        mismatches += sum(1 for e, a in pairs if e.get("speaker") != a.get("speaker"))
+
+    report = {
+        "words": num_words,
+        "turns": num_turns,
+        "whisperx_seconds": whisperx_time,
+        "engine_seconds": engine_time,
+        "speedup": whisperx_time / engine_time if engine_time > 0 else float("inf"),
+        "mismatches": mismatches,
+    }
+    logging.info(f"Speaker assignment benchmark: {report}")
+    return report
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    for words, turns in [(5000, 500), (50000, 5000)]:
+        print(benchmark(words, turns))
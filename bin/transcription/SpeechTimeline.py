@@ -0,0 +1,163 @@
+import logging
+import time
+
+import numpy as np
+
+from bin.transcription.AudioWindowing import SAMPLE_RATE
+
+
+class SpeechTimeline:
+    """
+    The speech regions of a recording, found with a cheap energy-based voice activity detector.
+
+    The regions can be cut out of the audio into one compact buffer so the expensive models only see
+    speech, and timestamps produced on the compact buffer can be mapped back to the original recording.
+    """
+
+    def __init__(self, regions: list, duration: float):
+        """
+        Initializes a new instance of the SpeechTimeline class.
+
+        Args:
+            regions (list): Sorted, non-overlapping (start, end) speech regions in seconds.
+            duration (float): The length of the original recording in seconds.
+        """
+        self.regions = [(float(start), float(end)) for start, end in regions]
+        self.duration = float(duration)
+
+        lengths = np.array([end - start for start, end in self.regions], dtype=np.float64)
+        self._original_starts = np.array([start for start, _ in self.regions], dtype=np.float64)
+        self._compact_starts = np.concatenate(([0.0], np.cumsum(lengths)[:-1])) if len(lengths) else np.zeros(0)
+        self._lengths = lengths
+
+    @classmethod
+    def detect(cls, audio: np.ndarray, sr: int = SAMPLE_RATE, frame_ms: int = 30, margin_db: float = 12.0,
+               floor_db: float = -55.0, min_speech: float = 0.25, min_silence: float = 1.0,
+               padding: float = 0.3) -> "SpeechTimeline":
+        """
+        Finds the speech regions of a recording.
+
+        A frame counts as speech when its energy is margin_db above the noise floor (the 10th percentile
+        of frame energies) and above floor_db. Short gaps are bridged, short blips dropped and the
+        remaining regions padded so word onsets and endings are not clipped.
+
+        Args:
+            audio (np.ndarray): The decoded mono audio.
+            sr (int, optional): The sample rate of the audio. Defaults to 16 kHz.
+            frame_ms (int, optional): Length of the analysis frames. Defaults to 30 ms.
+            margin_db (float, optional): Required energy above the noise floor. Defaults to 12 dB.
+            floor_db (float, optional): Absolute minimum energy of speech. Defaults to -55 dBFS.
+            min_speech (float, optional): Shortest region kept, in seconds. Defaults to 0.25.
+            min_silence (float, optional): Shortest gap kept between regions, in seconds. Defaults to 1.0.
+            padding (float, optional): Seconds added on both sides of each region. Defaults to 0.3.
+        """
+        start_time = time.time()
+        duration = len(audio) / sr
+        frame_length = int(sr * frame_ms / 1000)
+        num_frames = len(audio) // frame_length
+        if num_frames == 0:
+            return cls([], duration)
+
+        frames = audio[:num_frames * frame_length].reshape(num_frames, frame_length)
+        # einsum avoids materializing a squared copy of the whole recording
+        energy = np.einsum('ij,ij->i', frames, frames, dtype=np.float64) / frame_length
+        energy_db = 10 * np.log10(energy + 1e-10)
+        threshold = max(np.percentile(energy_db, 10) + margin_db, floor_db)
+        active = energy_db > threshold
+
+        edges = np.diff(np.concatenate(([0], active.astype(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1) * frame_ms / 1000
+        ends = np.flatnonzero(edges == -1) * frame_ms / 1000
+
+        regions = []
+        for start, end in zip(starts, ends):
+            if regions and start - regions[-1][1] < min_silence:
+                regions[-1][1] = end
+            else:
+                regions.append([start, end])
+
+        padded = []
+        for start, end in regions:
+            if end - start < min_speech:
+                continue
+            start = max(start - padding, 0.0)
+            end = min(end + padding, duration)
+            if padded and start <= padded[-1][1]:
+                padded[-1][1] = end
+            else:
+                padded.append([start, end])
+
+        timeline = cls(padded, duration)
+        logging.info(f"Voice activity detection finished in {(time.time() - start_time):.3f} seconds - {timeline.summary()}")
+        return timeline
+
+    @property
+    def speech_seconds(self) -> float:
+        return float(self._lengths.sum())
+
+    @property
+    def skipped_seconds(self) -> float:
+        return self.duration - self.speech_seconds
+
+    @property
+    def speedup(self) -> float:
+        return self.duration / self.speech_seconds if self.speech_seconds > 0 else 1.0
+
+    def summary(self) -> str:
+        if self.duration <= 0:
+            return "no audio"
+        return (f"{len(self.regions)} speech regions, skipped {self.skipped_seconds:.1f} of {self.duration:.1f} seconds "
+                f"({100 * self.skipped_seconds / self.duration:.0f}%), expected speed-up {self.speedup:.2f}x")
+
+    def to_dict(self) -> dict:
+        return {"regions": self.regions, "duration": self.duration}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SpeechTimeline":
+        return cls(data["regions"], data["duration"])
+
+    def compact(self, audio: np.ndarray, sr: int = SAMPLE_RATE) -> np.ndarray:
+        """
+        Returns the speech regions of the audio joined into one buffer.
+        """
+        if not self.regions:
+            return audio[:0]
+        return np.concatenate([audio[int(start * sr):int(end * sr)] for start, end in self.regions])
+
+    def to_original(self, times, is_end: bool = False):
+        """
+        Maps times on the compact buffer back to the original recording.
+
+        Args:
+            times (float or np.ndarray): Times in seconds on the compact buffer.
+            is_end (bool, optional): Map times on a region boundary to the end of the earlier region
+                rather than the start of the later one. Defaults to False.
+        """
+        if not self.regions:
+            return times
+        side = 'left' if is_end else 'right'
+        index = np.clip(np.searchsorted(self._compact_starts, times, side=side) - 1, 0, len(self.regions) - 1)
+        offset = np.minimum(np.asarray(times) - self._compact_starts[index], self._lengths[index])
+        mapped = self._original_starts[index] + offset
+        return float(mapped) if np.ndim(mapped) == 0 else mapped
+
+    def remap_result(self, result: dict) -> dict:
+        """
+        Moves the segment and word timestamps of a whisperx result to the original timeline, in place.
+        """
+        seen = set()
+        items = []
+        for segment in result.get("segments", []):
+            items.append(segment)
+            items.extend(segment.get("words", []))
+        items.extend(result.get("word_segments", []))
+
+        for item in items:
+            if id(item) in seen:
+                continue
+            seen.add(id(item))
+            if "start" in item:
+                item["start"] = self.to_original(item["start"])
+            if "end" in item:
+                item["end"] = self.to_original(item["end"], is_end=True)
+        return result
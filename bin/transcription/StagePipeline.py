@@ -0,0 +1,145 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PipelineCancelled(Exception):
+    """
+    Raised when a run is cancelled before it finished.
+    """
+
+
+class StageReport:
+    """
+    Wall time of every stage of a pipeline run and how much of it overlapped.
+    """
+
+    def __init__(self):
+        self.start_time = None
+        self.end_time = None
+        self.stages = {}
+        self.notes = []
+
+    @property
+    def wall_time(self) -> float:
+        if self.start_time is None or self.end_time is None:
+            return 0.0
+        return self.end_time - self.start_time
+
+    @property
+    def serial_time(self) -> float:
+        return sum(end - start for start, end in self.stages.values())
+
+    @property
+    def overlap_time(self) -> float:
+        return max(self.serial_time - self.wall_time, 0.0)
+
+    @property
+    def speedup(self) -> float:
+        return self.serial_time / self.wall_time if self.wall_time > 0 else 1.0
+
+    def to_dict(self) -> dict:
+        return {
+            "stages": {
+                name: {"start": start - self.start_time, "end": end - self.start_time, "duration": end - start}
+                for name, (start, end) in self.stages.items()
+            },
+            "wall_time": self.wall_time,
+            "serial_time": self.serial_time,
+            "overlap_time": self.overlap_time,
+            "speedup": self.speedup,
+            "notes": list(self.notes),
+        }
+
+    def __str__(self) -> str:
+        lines = []
+        for name, (start, end) in self.stages.items():
+            lines.append(f"{name}: {(end - start):.1f} s (from {(start - self.start_time):.1f} s to {(end - self.start_time):.1f} s)")
+        lines.append(f"Total: {self.wall_time:.1f} s wall time for {self.serial_time:.1f} s of stage time - "
+                     f"{self.overlap_time:.1f} s overlapped ({self.speedup:.2f}x)")
+        lines.extend(self.notes)
+        return "\n".join(lines)
+
+
+class StagePipeline:
+    """
+    Runs named stages on worker threads as soon as the stages they depend on have finished.
+
+    Each stage function is called with the results of its dependencies, in the order they were listed.
+    """
+
+    def __init__(self, on_event=None, cancel=None):
+        """
+        Initializes a new instance of the StagePipeline class.
+
+        Args:
+            on_event (callable, optional): Called as on_event(name, "started") before every stage and
+                on_event(name, "finished") or on_event(name, "failed") after it.
+            cancel (threading.Event, optional): Once set, no further stage starts and run() raises PipelineCancelled.
+        """
+        self._stages = {}
+        self._on_event = on_event
+        self._cancel = cancel
+        self.report = StageReport()
+
+    def add_stage(self, name: str, function, after: list = None) -> None:
+        """
+        Adds a stage to the pipeline.
+
+        Args:
+            name (str): The name of the stage, used for dependencies and the report.
+            function (callable): The work of the stage.
+            after (list, optional): Names of the stages whose results this stage needs.
+        """
+        after = after or []
+        for dependency in after:
+            if dependency not in self._stages:
+                raise ValueError(f"Stage {name} depends on unknown stage {dependency}")
+        self._stages[name] = (function, after)
+
+    def run(self) -> dict:
+        """
+        Runs every stage and waits for all of them to finish.
+
+        Returns:
+            dict: The result of each stage, keyed by stage name.
+        """
+        self.report = StageReport()
+        self.report.start_time = time.time()
+        report_lock = threading.Lock()
+        futures = {}
+
+        def run_stage(name, function, dependencies):
+            arguments = [future.result() for future in dependencies]
+            if self._cancel is not None and self._cancel.is_set():
+                raise PipelineCancelled(f"Cancelled before {name}")
+            start_time = time.time()
+            logging.info(f"Beginning {name}")
+            if self._on_event is not None:
+                self._on_event(name, "started")
+            state = "failed"
+            try:
+                result = function(*arguments)
+                state = "finished"
+                return result
+            finally:
+                end_time = time.time()
+                with report_lock:
+                    self.report.stages[name] = (start_time, end_time)
+                logging.info(f"Finished {name} - total time: {(end_time - start_time):.3f} seconds")
+                if self._on_event is not None:
+                    self._on_event(name, state)
+
+        # Stages are added in dependency order, so every dependency already has a future
+        with ThreadPoolExecutor(max_workers=len(self._stages) or 1, thread_name_prefix="stage") as executor:
+            for name, (function, after) in self._stages.items():
+                futures[name] = executor.submit(run_stage, name, function, [futures[dependency] for dependency in after])
+
+            try:
+                results = {name: future.result() for name, future in futures.items()}
+            finally:
+                self.report.end_time = time.time()
+
+        logging.info(f"Stage report:\n{self.report}")
+        return results
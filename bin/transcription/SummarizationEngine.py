@@ -0,0 +1,186 @@
+import logging
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from bin.transcription.PromptChunker import PromptChunker
+from bin.transcription.StagePipeline import StageReport
+
+REDUCE_TEMPLATE = ("The following are summaries of consecutive parts of one session, in order. "
+                   "Combine them into a single summary that keeps the events in order:\n\n{text}")
+
+
+class SummarizationEngine:
+    """
+    Map-reduce summarization over any text completion backend.
+
+    The text is split into chunks that fill the model's context and the chunks are summarized
+    concurrently (map). The summaries are then merged in groups of up to fan_in, level by level
+    (reduce), until they fit in one prompt, which produces the final summary. Every reduce prompt
+    fits the context: a summary that cannot share a prompt with its neighbour is passed up to the
+    next level unchanged.
+    """
+
+    def __init__(self, complete, chunker: PromptChunker, system_prompt: str, map_template: str = "{text}",
+                 reduce_template: str = REDUCE_TEMPLATE, max_concurrency: int = 4, fan_in: int = 4,
+                 cache=None, cache_params: dict = None):
+        """
+        Initializes a new instance of the SummarizationEngine class.
+
+        Args:
+            complete (callable): Called as complete(system_prompt, prompt) and returns the model's answer.
+            chunker (PromptChunker): Splits the text into chunks that fit the model's context.
+            system_prompt (str): The system prompt of every call.
+            map_template (str, optional): The prompt for a chunk of text, with {text} where it goes.
+            reduce_template (str, optional): The prompt for a group of summaries, with {text} where they go.
+            max_concurrency (int, optional): The most calls in flight at once. Defaults to 4.
+            fan_in (int, optional): The most summaries merged by one reduce call. Defaults to 4.
+            cache (SummaryCache, optional): Memo of earlier calls. Defaults to no memo.
+            cache_params (dict, optional): The model and options, which are part of the memo key.
+        """
+        if fan_in < 2:
+            raise ValueError("fan_in must be at least 2")
+        self._complete = complete
+        self.chunker = chunker
+        self.system_prompt = system_prompt
+        self.map_template = map_template
+        self.reduce_template = reduce_template
+        self.max_concurrency = max_concurrency
+        self.fan_in = fan_in
+        self.cache = cache
+        self.cache_params = dict(cache_params or {}, system=system_prompt)
+        # The chunker's budget leaves room for the map template, and the reduce template is usually longer
+        counter = chunker.counter
+        self.reduce_budget = (chunker.budget + counter.count(map_template.replace("{text}", ""))
+                              - counter.count(reduce_template.replace("{text}", "")))
+        if self.reduce_budget <= 0:
+            raise ValueError("The reduce template leaves no room for summaries in the context")
+        self.report = StageReport()
+
+    def _call(self, template: str, text: str):
+        # Returns the summary and whether it came from the memo
+        prompt = template.format(text=text)
+        if self.cache is not None:
+            response = self.cache.lookup(prompt, self.cache_params)
+            if response is not None:
+                return response, True
+
+        response = self._complete(self.system_prompt, prompt)
+        if response is None:
+            raise RuntimeError("The model returned no summary")
+        if self.cache is not None:
+            self.cache.store(prompt, self.cache_params, response)
+        return response, False
+
+    def _group(self, summaries: list) -> list:
+        # Merge consecutive summaries into groups of up to fan_in that still fit one prompt. Groups
+        # also end after a summary whose hash is divisible by fan_in, so an edit early in the session
+        # does not shift every later group and the unchanged groups are answered from the memo.
+        # A summary that does not fit with the one before it starts a new group, which may stay
+        # on its own.
+        groups = []
+        closed = True
+        for summary in summaries:
+            if not closed and self._fits(groups[-1] + [summary]):
+                groups[-1].append(summary)
+            else:
+                groups.append([summary])
+            closed = len(groups[-1]) >= self.fan_in or (len(groups[-1]) >= 2 and zlib.crc32(summary.encode('utf-8')) % self.fan_in == 0)
+        # A summary left on its own at the end joins the group before it if that still fits, or
+        # else takes the last summary of that group as a partner
+        if len(groups) > 1 and len(groups[-1]) == 1:
+            if self._fits(groups[-2] + groups[-1]):
+                groups[-2].extend(groups.pop())
+            elif len(groups[-2]) > 2 and self._fits(groups[-2][-1:] + groups[-1]):
+                groups[-1].insert(0, groups[-2].pop())
+        return groups
+
+    def _fits(self, summaries: list) -> bool:
+        return self.chunker.counter.count("\n\n".join(summaries)) <= self.reduce_budget
+
+    def stream(self, text: str):
+        """
+        Summarizes the text, yielding every partial summary as soon as it is ready.
+
+        Yields:
+            dict: "level" (0 for the map, then 1, 2, ... for each reduce), "index" and "count" of the
+                call within its level, the summary "text", "final", which is True for the last one,
+                "cached", which is True if the summary came from the memo, and "carried", which is True
+                for a summary passed up unchanged from the level before, without a call.
+        """
+        self.report = StageReport()
+        self.report.start_time = time.time()
+        inputs = self.chunker.chunk(text)
+        if not inputs:
+            self.report.end_time = time.time()
+            return
+
+        level = 0
+        template = self.map_template
+        carried = set()
+        stalled = False
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="summarize") as executor:
+            while True:
+                level_start = time.time()
+                final = len(inputs) == 1
+                outputs = [None] * len(inputs)
+                for index in sorted(carried):
+                    outputs[index] = inputs[index]
+                    yield {"level": level, "index": index, "count": len(inputs), "text": outputs[index],
+                           "final": final, "cached": False, "carried": True}
+                futures = {executor.submit(self._call, template, item): index
+                           for index, item in enumerate(inputs) if index not in carried}
+                cached = 0
+                for future in as_completed(futures):
+                    index = futures[future]
+                    outputs[index], hit = future.result()
+                    cached += hit
+                    yield {"level": level, "index": index, "count": len(inputs), "text": outputs[index],
+                           "final": final, "cached": hit, "carried": False}
+
+                name = "map" if level == 0 else f"reduce level {level}"
+                self.report.stages[name] = (level_start, time.time())
+                note = f"{name}: {len(futures)} calls, {cached} answered from the summary cache"
+                self.report.notes.append(note + (f", {len(carried)} passed up unchanged" if carried else ""))
+                logging.info(f"Finished summarization {name} - {len(futures)} calls in {(time.time() - level_start):.3f} seconds")
+                if final:
+                    break
+
+                # Once every summary fits in one prompt, the next call is the last
+                groups = [outputs] if self._fits(outputs) else self._group(outputs)
+                if all(len(group) == 1 for group in groups):
+                    # No two summaries fit one prompt, so each is summarized again on its own to shorten it
+                    if stalled:
+                        raise RuntimeError(f"The summaries are too long to merge in a prompt of {self.reduce_budget} tokens")
+                    stalled = True
+                    carried = set()
+                else:
+                    stalled = False
+                    carried = {index for index, group in enumerate(groups) if len(group) == 1}
+                inputs = ["\n\n".join(group) for group in groups]
+                template = self.reduce_template
+                level += 1
+
+        self.report.end_time = time.time()
+        if self.cache is not None:
+            self.cache.prune()
+        logging.info(f"Summarization report:\n{self.report}")
+
+    def summarize(self, text: str, on_partial=None) -> str:
+        """
+        Summarizes the text.
+
+        Args:
+            text (str): The text to summarize.
+            on_partial (callable, optional): Called with every partial summary event from stream().
+
+        Returns:
+            str: The final summary.
+        """
+        summary = ""
+        for event in self.stream(text):
+            if on_partial is not None:
+                on_partial(event)
+            if event["final"]:
+                summary = event["text"]
+        return summary
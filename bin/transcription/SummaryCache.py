@@ -0,0 +1,79 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from bin.transcription.ResultCache import ResultCache, atomic_write_json
+
+
+class SummaryCache(ResultCache):
+    """
+    On-disk memo of summarization calls, keyed by the prompt text, the model and its options.
+
+    Re-summarizing an edited transcript only calls the model for the chunks that changed and for
+    the reduce steps above them; every other call is answered from the memo. Entries are evicted
+    least recently used first, like the result cache, and hits and misses are counted.
+    """
+
+    def __init__(self, cache_dir: str = "./cache/summaries", max_size_mb: int = None):
+        """
+        Initializes a new instance of the SummaryCache class.
+
+        Args:
+            cache_dir (str, optional): The directory holding the memo. Defaults to ./cache/summaries.
+            max_size_mb (int, optional): Size limit of the memo. Defaults to the MERIDIAN_SUMMARY_CACHE_MB
+                environment variable, or 256 MB if unset.
+        """
+        if max_size_mb is None:
+            max_size_mb = int(os.getenv("MERIDIAN_SUMMARY_CACHE_MB", "256"))
+        super().__init__(cache_dir, max_size_mb)
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    @staticmethod
+    def hash_text(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def lookup(self, prompt: str, params: dict):
+        """
+        Returns the memoized answer to the prompt, or None on a miss.
+
+        Args:
+            prompt (str): The full prompt sent to the model.
+            params (dict): The model, system prompt and every option that affects the answer.
+        """
+        path = self.entry_path("summary", self.hash_text(prompt), params)
+        data = self._read_json(path)
+        with self._stats_lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        os.utime(path)
+        return data["result"]
+
+    def store(self, prompt: str, params: dict, summary: str) -> None:
+        """
+        Memoizes an answer. Call prune() once a summarization finishes to apply the size limit.
+        """
+        path = self.entry_path("summary", self.hash_text(prompt), params)
+        atomic_write_json(path, {"kind": "summary", "params": params, "created": time.time(), "result": summary})
+
+    def reset_stats(self) -> None:
+        with self._stats_lock:
+            self.hits = 0
+            self.misses = 0
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            calls = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / calls if calls else 0.0,
+            }
+
+    def log_stats(self) -> None:
+        stats = self.get_stats()
+        logging.info(f"Summary cache: {stats['hits']} hits, {stats['misses']} misses ({100 * stats['hit_rate']:.0f}% hit rate)")
@@ -0,0 +1,172 @@
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+
+import ollama
+from llama_index.core import VectorStoreIndex
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.schema import TextNode
+
+from bin.transcription.PromptChunker import NEWLINE_TOKENS, PromptChunker, TokenCounter
+
+# Embedding model pulled from ollama for the transcript passages
+EMBEDDING_MODEL = os.getenv("MERIDIAN_EMBED_MODEL", "nomic-embed-text")
+
+
+class OllamaTextEmbedding(BaseEmbedding):
+    """
+    llama_index embedding model backed by the ollama embeddings endpoint.
+    """
+
+    def _get_query_embedding(self, query: str) -> list:
+        return ollama.embeddings(model=self.model_name, prompt=query)["embedding"]
+
+    def _get_text_embedding(self, text: str) -> list:
+        return ollama.embeddings(model=self.model_name, prompt=text)["embedding"]
+
+    async def _aget_query_embedding(self, query: str) -> list:
+        return self._get_query_embedding(query)
+
+
+class TranscriptIndex:
+    """
+    In-memory vector index over the passages of one transcript.
+    """
+
+    def __init__(self, passages: list, embed_model: BaseEmbedding):
+        self.passages = passages
+        nodes = [TextNode(text=passage, id_=str(number), metadata={"passage": number},
+                          excluded_embed_metadata_keys=["passage"], excluded_llm_metadata_keys=["passage"])
+                 for number, passage in enumerate(passages)]
+        self.index = VectorStoreIndex(nodes, embed_model=embed_model)
+
+    def search(self, question: str, top_k: int) -> list:
+        """
+        Returns the numbers of the passages most similar to the question, best first.
+        """
+        retriever = self.index.as_retriever(similarity_top_k=top_k)
+        return [result.node.metadata["passage"] for result in retriever.retrieve(question)]
+
+
+class TranscriptRetriever:
+    """
+    Finds the passages of a transcript that are relevant to a question.
+
+    The transcript is split into passages of whole speaker turns, which are embedded once and kept
+    in an in-memory vector index. Each question then only costs one embedding and a similarity
+    search, and the best passages are returned together with the passages around them so that
+    the model sees each excerpt in its context. The indexes of the most recent transcripts are
+    kept, so switching back and forth between transcripts does not embed them again.
+    """
+
+    def __init__(self, embed_model: BaseEmbedding = None, counter: TokenCounter = None, passage_tokens: int = 256,
+                 top_k: int = 4, neighbors: int = 1, max_indexes: int = 4):
+        """
+        Initializes a new instance of the TranscriptRetriever class.
+
+        Args:
+            embed_model (BaseEmbedding, optional): The embedding model. Defaults to EMBEDDING_MODEL through ollama.
+            counter (TokenCounter, optional): Counts the tokens of the passages.
+            passage_tokens (int, optional): The most tokens in one passage. Defaults to 256.
+            top_k (int, optional): The number of passages retrieved per question. Defaults to 4.
+            neighbors (int, optional): Passages added on each side of every retrieved passage. Defaults to 1.
+            max_indexes (int, optional): The number of transcript indexes kept in memory. Defaults to 4.
+        """
+        if embed_model is None:
+            ollama.pull(EMBEDDING_MODEL)
+            embed_model = OllamaTextEmbedding(model_name=EMBEDDING_MODEL)
+        self.embed_model = embed_model
+        self.counter = counter or TokenCounter()
+        self.passage_tokens = passage_tokens
+        self.top_k = top_k
+        self.neighbors = neighbors
+        self.max_indexes = max_indexes
+        self._indexes = OrderedDict()
+
+    def split_passages(self, text: str) -> list:
+        """
+        Splits a transcript into passages of whole speaker turns of at most passage_tokens, where possible.
+        """
+        lines = [line for line in text.split("\n") if line.strip()]
+        passages = []
+        current = []
+        used = 0
+        for turn in PromptChunker.speaker_turns(lines):
+            for line in turn:
+                tokens = self.counter.count_line(line) + NEWLINE_TOKENS
+                if current and used + tokens > self.passage_tokens:
+                    passages.append("\n".join(current))
+                    current = []
+                    used = 0
+                current.append(line)
+                used += tokens
+            # Turns are kept together, but a passage ends once it is half full and a turn ends
+            if used >= self.passage_tokens // 2:
+                passages.append("\n".join(current))
+                current = []
+                used = 0
+        if current:
+            passages.append("\n".join(current))
+        return passages
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get_index(self, text: str) -> TranscriptIndex:
+        """
+        Returns the index of a transcript, building it if it is not in memory.
+        """
+        key = self._key(text)
+        index = self._indexes.get(key)
+        if index is not None:
+            self._indexes.move_to_end(key)
+            return index
+
+        start_time = time.time()
+        passages = self.split_passages(text)
+        index = TranscriptIndex(passages, self.embed_model)
+        logging.info(f"Indexed {len(passages)} transcript passages in {(time.time() - start_time):.3f} seconds")
+
+        self._indexes[key] = index
+        while len(self._indexes) > self.max_indexes:
+            self._indexes.popitem(last=False)
+        return index
+
+    def retrieve(self, question: str, text: str, report=None) -> list:
+        """
+        Returns the passages relevant to the question, in transcript order.
+
+        Consecutive passages are joined, so each item of the list is one continuous excerpt.
+
+        Args:
+            question (str): The question.
+            text (str): The transcript.
+            report (StageReport, optional): Receives the "index" and "retrieve" timings.
+        """
+        start_time = time.time()
+        built = self._key(text) not in self._indexes
+        index = self.get_index(text)
+        index_time = time.time()
+        if report is not None and built:
+            report.stages["index"] = (start_time, index_time)
+
+        numbers = set()
+        for number in index.search(question, self.top_k):
+            numbers.update(range(max(number - self.neighbors, 0), min(number + self.neighbors + 1, len(index.passages))))
+
+        excerpts = []
+        previous = None
+        for number in sorted(numbers):
+            if previous is not None and number == previous + 1:
+                excerpts[-1] += "\n" + index.passages[number]
+            else:
+                excerpts.append(index.passages[number])
+            previous = number
+
+        if report is not None:
+            report.stages["retrieve"] = (index_time, time.time())
+            report.notes.append(f"Retrieved {len(numbers)} of {len(index.passages)} passages in {len(excerpts)} excerpts")
+        return excerpts
@@ -0,0 +1,93 @@
+import json
+import logging
+import os
+
+from bin.transcription.ResultCache import ResultCache, atomic_write_json
+
+
+class TranscriptionCheckpoint:
+    """
+    Durable progress of a windowed transcription job, so a crashed or cancelled job can resume.
+
+    Finished lines (any JSON value, e.g. segments) are appended to a lines file and the job state (next window, speaker centroids and
+    the number of valid bytes in the lines file) is replaced atomically after every window. Anything
+    written to the lines file after the last state update is ignored on resume.
+    """
+
+    def __init__(self, audio_hash: str, params: dict, checkpoint_dir: str = "./cache/checkpoints"):
+        """
+        Initializes a new instance of the TranscriptionCheckpoint class.
+
+        Args:
+            audio_hash (str): The content hash of the recording.
+            params (dict): Every setting that affects the output, so changed settings start a new job.
+            checkpoint_dir (str, optional): Where checkpoints are kept. Defaults to ./cache/checkpoints.
+        """
+        self.job_id = f"{audio_hash[:16]}-{ResultCache.fingerprint(params)}"
+        self.state_path = os.path.join(checkpoint_dir, f"{self.job_id}.json")
+        self.lines_path = os.path.join(checkpoint_dir, f"{self.job_id}.lines")
+        self._state = None
+
+    def load(self) -> dict:
+        """
+        Returns the saved job state, or None if there is nothing to resume.
+        """
+        if not os.path.exists(self.state_path):
+            return None
+        try:
+            with open(self.state_path, 'r') as f:
+                self._state = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f"Ignoring unreadable checkpoint {self.state_path}: {e}")
+            self._state = None
+        return self._state
+
+    def lines(self) -> list:
+        """
+        Returns the lines finished before the checkpoint was saved.
+        """
+        if self._state is None or not os.path.exists(self.lines_path):
+            return []
+        with open(self.lines_path, 'rb') as f:
+            data = f.read(self._state["lines_bytes"])
+        return [json.loads(line) for line in data.decode('utf-8').splitlines()]
+
+    def save_window(self, next_window: int, committed_until: float, tracker_state: dict, new_lines: list) -> None:
+        """
+        Records that every window before next_window is finished.
+
+        Args:
+            next_window (int): The index of the first window still to process.
+            committed_until (float): The time up to which output has been kept.
+            tracker_state (dict): The state of the SpeakerTracker.
+            new_lines (list): The lines finished by the window just processed, as JSON-serializable values.
+        """
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        lines_bytes = self._state["lines_bytes"] if self._state else 0
+
+        with open(self.lines_path, 'ab') as f:
+            # Drop anything appended after the last saved state
+            f.truncate(lines_bytes)
+            for line in new_lines:
+                f.write((json.dumps(line) + "\n").encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+            lines_bytes = f.tell()
+
+        self._state = {
+            "next_window": next_window,
+            "committed_until": committed_until,
+            "tracker": tracker_state,
+            "lines_bytes": lines_bytes,
+        }
+        atomic_write_json(self.state_path, self._state)
+        logging.info(f"Saved checkpoint {self.job_id} before window {next_window}")
+
+    def discard(self) -> None:
+        """
+        Removes the checkpoint, e.g. once the job has finished.
+        """
+        self._state = None
+        for path in (self.state_path, self.lines_path):
+            if os.path.exists(path):
+                os.remove(path)
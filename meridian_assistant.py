@@ -10,7 +10,10 @@ import time
 
 from bin.transcription.LocalTranscription import LocalTranscription
 from bin.transcription.RemoteTranscription import RemoteTranscription
+from bin.transcription.ResultCache import ResultCache
+from bin.transcription.ExecutionProfile import ExecutionProfile
 from bin.gui.MeridianGUI import MeridianGUI
+from bin.controller.BatchRunner import BatchRunner, load_jobs
 
 def main():
 
@@ -23,7 +26,22 @@ def main():
     parser.add_argument('--remote', action='store_true', help='Use remote transcription service')
     parser.add_argument('--summarize_text', type=str, help='Summarize the text in the given file')
     parser.add_argument('--output_file', type=str, help='Path to the output file')
-    parser.add_argument("--gui", action="store_true", help="Don't launch the GUI", default=True)
+    parser.add_argument('--window_seconds', type=int, help='Transcribe locally in windows of this many seconds, checkpointing after each window')
+    parser.add_argument('--shard_workers', type=int, help='Transcribe locally on this many CPU worker processes, each taking one time shard of the recording')
+    parser.add_argument('--autotune', action='store_true', help='Use the calibrated execution profile of this host for local transcription, calibrating it on first use')
+    parser.add_argument('--recalibrate', action='store_true', help='Calibrate and save a new execution profile for this host')
+    parser.add_argument('--resume', action='store_true', help='Resume an interrupted local transcription from its last checkpoint')
+    parser.add_argument("--gui", action="store_true", help="Launch the GUI (the default when no other action is given)")
+    parser.add_argument('--batch', type=str, metavar='SOURCE', help='Transcribe, summarize and save to the campaign every recording in a directory or manifest, without the GUI')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes for --batch')
+    parser.add_argument('--retries', type=int, default=1, help='How often a failed --batch job is retried')
+    parser.add_argument('--num_speakers', type=int, default=4, help='Number of speakers for --batch recordings which do not set it')
+    parser.add_argument('--output_dir', type=str, help='Where --batch writes transcripts and summaries (defaults to next to each recording)')
+    parser.add_argument('--report', type=str, help='Path of the --batch JSON report (defaults to batch_report.json in the output directory)')
+    parser.add_argument('--no_campaign', action='store_true', help="Don't save --batch summaries to the campaign")
+    parser.add_argument('--cache_info', action='store_true', help='Show the contents of the transcription result cache')
+    parser.add_argument('--cache_prune', type=int, metavar='MB', help='Shrink the transcription result cache to the given size in MB')
+    parser.add_argument('--cache_clear', action='store_true', help='Remove every entry from the transcription result cache')
 
     # Parse the arguments
     args = parser.parse_args()
@@ -37,23 +55,52 @@ def main():
     else:
         output_filename = "transcription.txt"
 
-    if args.gui:
-           
-        app = MeridianGUI()
-        
+    # Calibrate first, so a transcription in the same run already uses the new profile
+    if args.recalibrate:
+        print(ExecutionProfile.load_or_calibrate(recalibrate=True))
+
+    if args.cache_info or args.cache_prune is not None or args.cache_clear:
+
+        cache = ResultCache()
+        if args.cache_clear:
+            logging.info(f"Removed {cache.clear()} entries from the result cache")
+        elif args.cache_prune is not None:
+            logging.info(f"Removed {cache.prune(args.cache_prune)} entries from the result cache")
+        print(cache.summary())
+
+    elif args.batch:
+
+        if not os.path.exists(args.batch):
+            logging.error("Error: Batch source does not exist.")
+            sys.exit(1)
+
+        jobs = load_jobs(args.batch, args.num_speakers)
+        if not jobs:
+            logging.error(f"Error: No recordings found in {args.batch}.")
+            sys.exit(1)
+
+        transcription_service = "remote" if args.remote else "local"
+        runner = BatchRunner(transcription_service, workers=args.workers, retries=args.retries,
+                             output_dir=args.output_dir, save_to_campaign=not args.no_campaign,
+                             window_seconds=args.window_seconds, shard_workers=args.shard_workers,
+                             autotune=args.autotune or None)
+        report = runner.run(jobs, args.report)
+        if report["failed"]:
+            sys.exit(1)
+
     elif args.transcription_audio or args.summarize_text:
         
         if not args.local and not args.remote:    
             transcription_service = input("Choose transcription service (Local/Remote): ")
             if transcription_service.lower() == "local":
-                agent = LocalTranscription()
+                agent = LocalTranscription(window_seconds=args.window_seconds, shard_workers=args.shard_workers, autotune=args.autotune or None)
             elif transcription_service.lower() == "remote":
                 agent = RemoteTranscription()
             else:
                 print("Invalid transcription service choice. Defaulting to Local.")
-                agent = LocalTranscription()
+                agent = LocalTranscription(window_seconds=args.window_seconds, shard_workers=args.shard_workers, autotune=args.autotune or None)
         elif args.local:
-            agent = LocalTranscription()
+            agent = LocalTranscription(window_seconds=args.window_seconds, shard_workers=args.shard_workers, autotune=args.autotune or None)
         elif args.remote:
             agent = RemoteTranscription()
             
@@ -71,11 +118,16 @@ def main():
             logging.info(f"Transcribing audio file... {args.transcription_audio}")
             
             start_time = time.time()
-            transcribed_text = agent.transcribe_audio(args.transcription_audio)
+            if isinstance(agent, LocalTranscription):
+                transcribed_text = agent.transcribe_audio_v2(args.transcription_audio, resume=args.resume)
+            else:
+                transcribed_text = agent.transcribe_audio(args.transcription_audio)
             end_time = time.time()
 
             execution_time = end_time - start_time
             logging.info(f"Transcription completed in {str(execution_time)} seconds.")
+            if getattr(agent, "last_stage_report", None) is not None:
+                logging.info(f"Stage timings:\n{agent.last_stage_report}")
             
             # Check if transcription is None
             if transcribed_text is None:
@@ -84,24 +136,30 @@ def main():
 
             # Output the transcription to a text file            
             with open(output_filename, 'w') as text_file:
-                text_file.write(transcribed_text['text'])
+                text_file.write(transcribed_text)
                 
         elif args.summarize_text:
             
             logging.info(f"Beginning text summary for {args.summarize_text}")
             start_time = time.time()
-            summary = agent.summarize_text(args.summarize_text)
+            with open(args.summarize_text, 'r') as text_file:
+                summary = agent.summarize_text(text_file.read())
             end_time = time.time()
 
             execution_time = end_time - start_time
             logging.info(f"Text summarization completed in {str(execution_time)} seconds.")
+            if agent.last_summary_report is not None:
+                logging.info(f"Summarization timings:\n{agent.last_summary_report}")
+            if summary is None:
+                logging.error("Error: Text could not be summarized.")
+                sys.exit(1)
             
             print(summary)
             # Write out the summary to a text file
             open(output_filename, "w").write(summary)        
-    else:
-        parser.print_help()
-        sys.exit(1)
+    elif not args.recalibrate:
+
+        app = MeridianGUI()
     
 if __name__ == '__main__':
     
@@ -0,0 +1,105 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("ollama")
+from bin.transcription.AbortableClient import AbortableClient
+
+
+class FakeOllamaServer:
+    """
+    Local stand-in for ollama's chat endpoint. It waits prompt_seconds, as if evaluating the prompt,
+    before streaming the answer one word per line.
+    """
+
+    def __init__(self, answer: str = "the party enters the tavern", prompt_seconds: float = 0.0):
+        self.answer = answer
+        self.prompt_seconds = prompt_seconds
+        self.requests = []
+        self.disconnected = threading.Event()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                server.requests.append(json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0)))))
+                time.sleep(server.prompt_seconds)
+                try:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/x-ndjson")
+                    self.end_headers()
+                    for word in server.answer.split():
+                        self.wfile.write(json.dumps({"message": {"role": "assistant", "content": word + " "}, "done": False}).encode() + b"\n")
+                    self.wfile.write(json.dumps({"message": {"role": "assistant", "content": ""}, "done": True}).encode() + b"\n")
+                    self.wfile.flush()
+                except OSError:
+                    server.disconnected.set()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def chat(client: AbortableClient):
+    return client.chat(model="llama3", messages=[{"role": "user", "content": "What happened?"}], stream=True)
+
+
+def test_streams_like_an_ollama_client():
+    with FakeOllamaServer() as server:
+        client = AbortableClient(server.url)
+        pieces = list(chat(client))
+        client.close()
+
+    assert "".join(piece["message"]["content"] for piece in pieces).strip() == "the party enters the tavern"
+    assert pieces[-1]["done"]
+    assert server.requests[0]["model"] == "llama3"
+
+
+def test_abort_stops_a_request_still_evaluating_the_prompt():
+    with FakeOllamaServer(prompt_seconds=2.0) as server:
+        client = AbortableClient(server.url)
+        errors = []
+        started = time.time()
+
+        def read():
+            try:
+                list(chat(client))
+            except Exception as e:
+                errors.append(e)
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        time.sleep(0.3)
+        client.abort()
+        reader.join(timeout=1.0)
+
+        assert not reader.is_alive()
+        assert time.time() - started < 1.5
+        assert len(errors) == 1
+        # The server finds the connection gone once it has an answer to send
+        assert server.disconnected.wait(timeout=3.0)
+
+
+def test_abort_before_connecting_fails_the_request():
+    with FakeOllamaServer() as server:
+        client = AbortableClient(server.url)
+        client.abort()
+
+        with pytest.raises(Exception):
+            list(chat(client))
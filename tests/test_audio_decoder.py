@@ -0,0 +1,163 @@
+import json
+import os
+import subprocess
+import sys
+import wave
+
+import numpy as np
+import pytest
+
+from bin.transcription import AudioDecoder as decoder
+from bin.transcription.AudioDecoder import AudioDecoder, split_audio
+
+
+class FakeFFmpeg:
+    """
+    Answers ffprobe with a fixed audio stream and records the ffmpeg segment command, writing
+    the segment list it would have written.
+    """
+
+    def __init__(self, codec: str, duration: float = 600.0, bit_rate: int = 128000):
+        self.probe = {"format": {"duration": str(duration), "bit_rate": str(bit_rate * 4)},
+                      "streams": [{"codec_name": codec, "bit_rate": str(bit_rate)}]}
+        self.commands = []
+
+    def __call__(self, command, **kwargs):
+        self.commands.append(command)
+        if command[0] == 'ffprobe':
+            return subprocess.CompletedProcess(command, 0, stdout=json.dumps(self.probe).encode("utf-8"))
+        segment_list = command[command.index('-segment_list') + 1]
+        with open(segment_list, 'w') as f:
+            f.write(os.path.basename(command[-1]) % 0 + "\n")
+        return subprocess.CompletedProcess(command, 0, stdout=b"", stderr=b"")
+
+    @property
+    def segment_command(self) -> list:
+        return next(command for command in self.commands if '-f' in command and 'segment' in command)
+
+
+@pytest.mark.parametrize("source, codec, container", [
+    ("session.mp4", "aac", ".m4a"),
+    ("session.webm", "opus", ".ogg"),
+    ("session.mpga", "mp3", ".mp3"),
+    ("session.wav", "pcm_s16le", ".wav"),
+])
+def test_copy_uses_a_container_for_the_audio_codec(monkeypatch, tmp_path, source, codec, container):
+    ffmpeg = FakeFFmpeg(codec)
+    monkeypatch.setattr(decoder.subprocess, "run", ffmpeg)
+
+    segments = split_audio(source, str(tmp_path))
+
+    command = ffmpeg.segment_command
+    assert command[command.index('-map') + 1] == '0:a:0'
+    assert command[command.index('-c:a') + 1] == 'copy'
+    assert command[-1].endswith(container)
+    assert segments == [os.path.join(str(tmp_path), f"segment_000{container}")]
+
+
+def test_codec_without_an_uploadable_container_is_reencoded(monkeypatch, tmp_path):
+    ffmpeg = FakeFFmpeg("ac3")
+    monkeypatch.setattr(decoder.subprocess, "run", ffmpeg)
+
+    split_audio("session.mkv", str(tmp_path))
+
+    command = ffmpeg.segment_command
+    assert command[command.index('-c:a') + 1] == 'libopus'
+    assert command[-1].endswith(".ogg")
+
+
+def test_segment_length_follows_the_audio_stream_bit_rate(monkeypatch, tmp_path):
+    # The container's bit rate includes the video, which would make the segments needlessly short
+    ffmpeg = FakeFFmpeg("aac", duration=7200.0, bit_rate=128000)
+    monkeypatch.setattr(decoder.subprocess, "run", ffmpeg)
+    monkeypatch.setattr(decoder, "detect_silences", lambda file_path: [])
+
+    split_audio("session.mp4", str(tmp_path))
+
+    command = ffmpeg.segment_command
+    cuts = [float(cut) for cut in command[command.index('-segment_times') + 1].split(",")]
+    assert cuts[0] == pytest.approx(decoder.MAX_UPLOAD_BYTES * 0.9 * 8 / 128000, abs=0.001)
+
+
+def write_wav(path, samples: np.ndarray, channels: int = 1) -> str:
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(decoder.SAMPLE_RATE)
+        f.writeframes(np.repeat(samples, channels).astype("<i2").tobytes())
+    return str(path)
+
+
+def make_samples(seconds: float) -> np.ndarray:
+    return (np.arange(int(seconds * decoder.SAMPLE_RATE)) % 20000 - 10000).astype(np.int16)
+
+
+@pytest.fixture
+def fake_pipe(monkeypatch, tmp_path):
+    # ffmpeg is not needed: a child process writes the 16 kHz mono PCM it would have decoded
+    def use(samples: np.ndarray):
+        raw = tmp_path / "decoded.raw"
+        samples.astype("<i2").tofile(raw)
+
+        def open_pipe(self, start=0.0, duration=None):
+            first = int(start * self.sr) * decoder.SAMPLE_WIDTH
+            size = -1 if duration is None else int(duration * self.sr) * decoder.SAMPLE_WIDTH
+            script = f"import sys; f = open({str(raw)!r}, 'rb'); f.seek({first}); sys.stdout.buffer.write(f.read({size}))"
+            return subprocess.Popen([sys.executable, "-c", script], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+        monkeypatch.setattr(AudioDecoder, "_open_pipe", open_pipe)
+
+    return use
+
+
+def collect(chunks) -> list:
+    # The decoder reuses its output buffer, so every chunk is copied before asking for the next
+    return [chunk.copy() for chunk in chunks]
+
+
+@pytest.mark.parametrize("seconds, lengths", [(2.5, [16000, 16000, 8000]), (2.0, [16000, 16000])])
+def test_chunks_of_a_mapped_wav(tmp_path, seconds, lengths):
+    samples = make_samples(seconds)
+    audio = AudioDecoder(write_wav(tmp_path / "session.wav", samples))
+
+    chunks = collect(audio.iter_chunks(chunk_seconds=1.0))
+
+    assert audio.is_native
+    assert [len(chunk) for chunk in chunks] == lengths
+    assert all(chunk.dtype == np.float32 for chunk in chunks)
+    np.testing.assert_array_equal(np.concatenate(chunks), samples / np.float32(32768.0))
+
+
+@pytest.mark.parametrize("seconds, lengths", [(2.5, [16000, 16000, 8000]), (2.0, [16000, 16000])])
+def test_chunks_of_a_decoded_file(tmp_path, fake_pipe, seconds, lengths):
+    samples = make_samples(seconds)
+    fake_pipe(samples)
+    audio = AudioDecoder(write_wav(tmp_path / "session.wav", samples, channels=2))
+
+    chunks = collect(audio.iter_chunks(chunk_seconds=1.0))
+
+    assert not audio.is_native
+    assert [len(chunk) for chunk in chunks] == lengths
+    np.testing.assert_array_equal(np.concatenate(chunks), samples / np.float32(32768.0))
+
+
+def test_chunks_of_a_range_match_on_both_paths(tmp_path, fake_pipe):
+    samples = make_samples(3.0)
+    fake_pipe(samples)
+    mapped = AudioDecoder(write_wav(tmp_path / "mono.wav", samples))
+    decoded = AudioDecoder(write_wav(tmp_path / "stereo.wav", samples, channels=2))
+
+    expected = samples[8000:8000 + 19200] / np.float32(32768.0)
+    for audio in (mapped, decoded):
+        chunks = collect(audio.iter_chunks(chunk_seconds=1.0, start=0.5, duration=1.2))
+        assert [len(chunk) for chunk in chunks] == [16000, 3200]
+        np.testing.assert_array_equal(np.concatenate(chunks), expected)
+
+
+def test_stopping_early_stops_the_decoder(tmp_path, fake_pipe):
+    fake_pipe(make_samples(60.0))
+    audio = AudioDecoder(write_wav(tmp_path / "session.wav", make_samples(1.0), channels=2))
+
+    chunks = audio.iter_chunks(chunk_seconds=1.0)
+    assert len(next(chunks)) == 16000
+    chunks.close()
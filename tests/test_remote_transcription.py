@@ -0,0 +1,168 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("openai")
+from openai import BadRequestError, InternalServerError
+
+from bin.transcription import RemoteTranscription as remote
+from bin.transcription.RemoteTranscription import RemoteTranscription
+
+
+class FakeWhisperServer:
+    """
+    Local stand-in for the OpenAI transcription endpoint. Every request to /audio/transcriptions
+    is answered with the next (status, headers, body) that respond(request_body) returns.
+    """
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                server.requests.append((self.path, body))
+                status, headers, text = server.respond(body)
+                payload = text.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "text/plain" if status == 200 else "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def error(status: int, headers: dict = None):
+    return status, headers or {}, '{"error": {"message": "fake error", "type": "server_error"}}'
+
+
+def make_agent(server: FakeWhisperServer, **kwargs) -> RemoteTranscription:
+    options = dict(max_retries=2, backoff_seconds=0.01, max_backoff_seconds=0.05)
+    options.update(kwargs)
+    return RemoteTranscription(base_url=server.base_url, **options)
+
+
+@pytest.fixture(autouse=True)
+def api_key(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+
+
+@pytest.fixture
+def segment(tmp_path):
+    path = tmp_path / "segment-0.mp3"
+    path.write_bytes(b"segment-0 audio")
+    return str(path)
+
+
+@pytest.fixture
+def three_segments(monkeypatch):
+    # ffmpeg is not needed: the recording is "split" into three small files
+    def fake_split_audio(file_path, output_dir, reencode=False):
+        files = []
+        for i in range(3):
+            path = os.path.join(output_dir, f"segment-{i}.mp3")
+            with open(path, "wb") as file:
+                file.write(f"segment-{i} audio".encode("utf-8"))
+            files.append(path)
+        return files
+
+    monkeypatch.setattr(remote, "split_audio", fake_split_audio)
+
+
+def test_rate_limit_is_retried_after_retry_after(segment):
+    answers = iter([error(429, {"Retry-After": "0"}), (200, {}, "the party enters the tavern")])
+    with FakeWhisperServer(lambda body: next(answers)) as server:
+        agent = make_agent(server)
+
+        text = agent._transcribe_segment(segment, 0, 1)
+
+    assert text.strip() == "the party enters the tavern"
+    assert len(server.requests) == 2
+    assert all(path == "/v1/audio/transcriptions" for path, _ in server.requests)
+    assert b"segment-0 audio" in server.requests[-1][1]
+
+
+def test_server_error_gives_up_after_max_retries(segment):
+    with FakeWhisperServer(lambda body: error(500)) as server:
+        agent = make_agent(server, max_retries=2)
+
+        with pytest.raises(InternalServerError):
+            agent._transcribe_segment(segment, 0, 1)
+
+    assert len(server.requests) == 3
+
+
+def test_client_error_is_not_retried(segment):
+    with FakeWhisperServer(lambda body: error(400)) as server:
+        agent = make_agent(server)
+
+        with pytest.raises(BadRequestError):
+            agent._transcribe_segment(segment, 0, 1)
+
+    assert len(server.requests) == 1
+
+
+def segment_one_always_fails(body: bytes):
+    if b"segment-1 audio" in body:
+        return error(500)
+    return 200, {}, "segment-0 text" if b"segment-0 audio" in body else "segment-2 text"
+
+
+def test_missing_segment_fails_the_transcription(three_segments):
+    with FakeWhisperServer(segment_one_always_fails) as server:
+        agent = make_agent(server, on_missing="fail")
+
+        assert agent.transcribe_audio("session.mp3") is None
+
+    # Segment 2 was tried once and retried max_retries times
+    assert sum(b"segment-1 audio" in body for _, body in server.requests) == 3
+
+
+def test_missing_segment_is_marked_as_a_gap(three_segments):
+    with FakeWhisperServer(segment_one_always_fails) as server:
+        agent = make_agent(server, on_missing="gap")
+
+        text = agent.transcribe_audio("session.mp3")
+
+    assert text == "segment-0 text [Segment 2 of 3 could not be transcribed] segment-2 text"
+
+
+def test_unknown_on_missing_is_rejected():
+    with pytest.raises(ValueError):
+        RemoteTranscription(on_missing="skip")
+
+
+def test_stream_yields_the_whole_transcription(three_segments):
+    def transcribe(body: bytes):
+        segment = next(i for i in range(3) if f"segment-{i} audio".encode("utf-8") in body)
+        return 200, {}, f"segment-{segment} text"
+
+    with FakeWhisperServer(transcribe) as server:
+        agent = make_agent(server)
+
+        lines = list(agent.transcribe_audio_stream("session.mp3", num_speakers=2))
+
+    assert lines == ["segment-0 text segment-1 text segment-2 text"]
@@ -0,0 +1,304 @@
+import hashlib
+import json
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from bin.transcription.PromptChunker import PromptChunker
+from bin.transcription.SummarizationEngine import REDUCE_TEMPLATE, SummarizationEngine
+from bin.transcription.SummaryCache import SummaryCache
+
+SYSTEM_PROMPT = "Summarize the session."
+MAP_TEMPLATE = "Summarize the following text:\n {text}"
+REDUCE_PREFIX = REDUCE_TEMPLATE.split("{text}")[0]
+
+
+class WordCounter:
+    # One token per word, so budgets are easy to reason about
+    backend = "words"
+
+    def count(self, text: str) -> int:
+        return len(text.split())
+
+    def count_line(self, line: str) -> int:
+        return self.count(line)
+
+
+class FakeLLMServer:
+    """
+    Local stand-in for the text model, serving the OpenAI chat completions endpoint and ollama's
+    generate endpoint. Every prompt is answered with a fixed-length summary derived from its hash.
+    """
+
+    def __init__(self, summary_words: int = 60, merged_words: int = None):
+        self.summary_words = summary_words
+        self.merged_words = merged_words
+        self.prompts = []
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                if self.path == "/v1/chat/completions":
+                    system, prompt = (message["content"] for message in request["messages"])
+                    text = server.record(system, prompt)
+                    response = {"id": "fake", "object": "chat.completion", "created": 0, "model": request["model"],
+                                "choices": [{"index": 0, "finish_reason": "stop",
+                                             "message": {"role": "assistant", "content": text}}]}
+                elif self.path == "/api/generate":
+                    text = server.record(request["system"], request["prompt"])
+                    response = {"model": request["model"], "created_at": "", "response": text, "done": True}
+                else:
+                    self.send_error(404)
+                    return
+                payload = json.dumps(response).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def answer(self, prompt: str) -> str:
+        kind = "merged" if prompt.startswith(REDUCE_PREFIX) else "summary"
+        words = self.merged_words if kind == "merged" and self.merged_words else self.summary_words
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return " ".join([f"{kind}-{digest[:12]}"] + [digest[i % 64] for i in range(words - 1)])
+
+    def record(self, system_prompt: str, prompt: str) -> str:
+        assert system_prompt == SYSTEM_PROMPT
+        with self._lock:
+            self.prompts.append(prompt)
+        return self.answer(prompt)
+
+    def map_prompts(self) -> list:
+        return [prompt for prompt in self.prompts if not prompt.startswith(REDUCE_PREFIX)]
+
+    def reduce_prompts(self) -> list:
+        return [prompt for prompt in self.prompts if prompt.startswith(REDUCE_PREFIX)]
+
+
+@pytest.fixture
+def llm():
+    with FakeLLMServer() as server:
+        yield server
+
+
+@pytest.fixture
+def remote_complete(monkeypatch):
+    # The OpenAI backend's complete(), pointed at a fake server
+    openai = pytest.importorskip("openai")
+    from bin.transcription.RemoteTranscription import RemoteTranscription
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+
+    def connect(server: FakeLLMServer):
+        agent = RemoteTranscription(base_url=f"{server.url}/v1")
+        assert isinstance(agent.client, openai.OpenAI)
+        return agent.complete
+
+    return connect
+
+
+def make_transcript(num_lines: int = 400, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    words = ["dragon", "tavern", "sword", "wizard", "goblin", "castle", "quest", "gold", "spell", "party"]
+    return [f"SPEAKER_0{rng.randrange(4)}: " + " ".join(rng.choice(words) for _ in range(rng.randint(5, 15)))
+            for _ in range(num_lines)]
+
+
+def make_engine(complete, cache: SummaryCache = None, context_tokens: int = 300, fan_in: int = 4) -> SummarizationEngine:
+    chunker = PromptChunker(WordCounter(), context_tokens, system_prompt=SYSTEM_PROMPT,
+                            prompt_template=MAP_TEMPLATE, output_tokens=50)
+    return SummarizationEngine(complete, chunker, SYSTEM_PROMPT, map_template=MAP_TEMPLATE,
+                               max_concurrency=4, fan_in=fan_in, cache=cache, cache_params={"model": "fake"})
+
+
+def test_map_summarizes_every_chunk_once(llm, remote_complete):
+    engine = make_engine(remote_complete(llm))
+    text = "\n".join(make_transcript())
+    chunks = engine.chunker.chunk(text)
+
+    events = list(engine.stream(text))
+
+    assert len(chunks) > 1
+    assert sorted(llm.map_prompts()) == sorted(MAP_TEMPLATE.format(text=chunk) for chunk in chunks)
+    map_events = [event for event in events if event["level"] == 0]
+    assert sorted(event["index"] for event in map_events) == list(range(len(chunks)))
+    assert all(event["count"] == len(chunks) and not event["final"] for event in map_events)
+
+
+def test_reduce_runs_several_levels_within_the_context(llm, remote_complete):
+    engine = make_engine(remote_complete(llm))
+
+    events = list(engine.stream("\n".join(make_transcript())))
+
+    levels = sorted({event["level"] for event in events})
+    assert levels == list(range(len(levels)))
+    assert len(levels) >= 3
+    counter = WordCounter()
+    for prompt in llm.reduce_prompts():
+        assert counter.count(prompt.split(REDUCE_PREFIX, 1)[1]) <= engine.reduce_budget
+        # The whole prompt, with the reduce template, leaves the room kept for the answer
+        assert counter.count(SYSTEM_PROMPT) + counter.count(prompt) <= 300 - 50
+    # Every level merges the outputs of the level before it into fewer summaries
+    counts = [next(event["count"] for event in events if event["level"] == level) for level in levels]
+    assert counts == sorted(counts, reverse=True)
+    assert counts[-1] == 1
+
+
+def test_final_summary_is_the_last_reduce(llm, remote_complete):
+    engine = make_engine(remote_complete(llm))
+    partials = []
+
+    summary = engine.summarize("\n".join(make_transcript()), on_partial=partials.append)
+
+    finals = [event for event in partials if event["final"]]
+    assert len(finals) == 1
+    assert finals[0] is partials[-1]
+    assert summary == finals[0]["text"]
+    assert summary.startswith("merged-")
+    assert summary == llm.answer(llm.reduce_prompts()[-1])
+
+
+def test_short_text_is_summarized_in_one_call(llm, remote_complete):
+    engine = make_engine(remote_complete(llm))
+
+    summary = engine.summarize("\n".join(make_transcript(5)))
+
+    assert len(llm.prompts) == 1
+    assert summary.startswith("summary-")
+
+
+def test_summaries_that_cannot_share_a_prompt_are_passed_up_alone(llm, remote_complete):
+    engine = make_engine(remote_complete(llm))
+    # Summaries of 0.7 of the budget: no two of them fit one reduce prompt
+    llm.summary_words = int(0.7 * engine.reduce_budget)
+    large = [llm.answer(f"part {i}") for i in range(3)]
+    small = [" ".join(summary.split()[:40]) for summary in large]
+
+    assert engine._group(large) == [[summary] for summary in large]
+    summaries = [large[0], small[0], small[1], large[1], large[2], small[2]]
+    groups = engine._group(summaries)
+    assert [summary for group in groups for summary in group] == summaries
+    assert all(engine._fits(group) for group in groups)
+    assert all(sum(summary in large for summary in group) <= 1 for group in groups)
+
+
+def test_oversized_summaries_are_shortened_before_they_are_merged(llm, remote_complete):
+    engine = make_engine(remote_complete(llm))
+    llm.summary_words = int(0.7 * engine.reduce_budget)
+    llm.merged_words = 40
+    text = "\n".join(make_transcript(60))
+    chunks = engine.chunker.chunk(text)
+
+    events = list(engine.stream(text))
+
+    # Each map summary is summarized again on its own, then the shorter summaries are merged
+    assert len(llm.map_prompts()) == len(chunks)
+    assert [event["count"] for event in events if event["level"] == 1] == [len(chunks)] * len(chunks)
+    assert events[-1]["final"] and events[-1]["level"] >= 2
+    for prompt in llm.reduce_prompts():
+        assert WordCounter().count(prompt.split(REDUCE_PREFIX, 1)[1]) <= engine.reduce_budget
+
+
+def test_summaries_that_never_shorten_fail_instead_of_overflowing(llm, remote_complete):
+    engine = make_engine(remote_complete(llm))
+    llm.summary_words = int(0.7 * engine.reduce_budget)
+    text = "\n".join(make_transcript(60))
+    chunks = engine.chunker.chunk(text)
+
+    with pytest.raises(RuntimeError):
+        engine.summarize(text)
+
+    assert len(llm.reduce_prompts()) == len(chunks)
+    for prompt in llm.reduce_prompts():
+        assert WordCounter().count(prompt.split(REDUCE_PREFIX, 1)[1]) <= engine.reduce_budget
+
+
+def test_cache_answers_unchanged_calls_after_a_one_line_edit(tmp_path, remote_complete):
+    cache = SummaryCache(str(tmp_path / "summaries"), max_size_mb=64)
+    lines = make_transcript()
+
+    with FakeLLMServer() as first:
+        make_engine(remote_complete(first), cache).summarize("\n".join(lines))
+    assert cache.get_stats()["hits"] == 0
+
+    # The same transcript again is answered entirely from the memo
+    cache.reset_stats()
+    with FakeLLMServer() as repeat:
+        make_engine(remote_complete(repeat), cache).summarize("\n".join(lines))
+    assert repeat.prompts == []
+    assert cache.get_stats()["misses"] == 0
+
+    edited = list(lines)
+    edited[len(lines) // 2] = edited[len(lines) // 2].split(": ")[0] + ": the wizard cast a new spell"
+    cache.reset_stats()
+    with FakeLLMServer() as second:
+        engine = make_engine(remote_complete(second), cache)
+        summary = engine.summarize("\n".join(edited))
+
+    stats = cache.get_stats()
+    chunks = engine.chunker.chunk("\n".join(edited))
+    # Only the chunks around the edit and the merges above them go to the model
+    assert 1 <= len(second.map_prompts()) <= 2
+    assert 1 <= len(second.reduce_prompts()) < len(first.reduce_prompts())
+    assert len(second.prompts) < len(first.prompts) / 2
+    assert stats["misses"] == len(second.prompts)
+    assert stats["hits"] >= len(chunks) - 2
+    assert summary != first.answer(first.reduce_prompts()[-1])
+
+
+def test_ollama_backend_summarizes_through_generate(llm, monkeypatch, tmp_path):
+    # LocalTranscription needs the whisperx stack, which is only importable with the full environment
+    ollama = pytest.importorskip("ollama")
+    for module in ("torch", "whisperx", "pyannote.audio"):
+        pytest.importorskip(module)
+    from bin.transcription import LocalTranscription as local
+    from bin.transcription.ResultCache import ResultCache
+
+    client = ollama.Client(host=llm.url)
+    monkeypatch.setattr(local.ollama, "pull", lambda model: None)
+    monkeypatch.setattr(local.ollama, "generate", client.generate)
+    agent = local.LocalTranscription(result_cache=ResultCache(str(tmp_path / "results")))
+    engine = make_engine(agent.complete)
+
+    summary = engine.summarize("\n".join(make_transcript()))
+
+    assert summary == llm.answer(llm.reduce_prompts()[-1])
+    assert sorted(llm.map_prompts()) == sorted(MAP_TEMPLATE.format(text=chunk)
+                                               for chunk in engine.chunker.chunk("\n".join(make_transcript())))
+
+
+def test_fan_in_below_two_is_rejected(llm):
+    with pytest.raises(ValueError):
+        make_engine(lambda system_prompt, prompt: llm.answer(prompt), fan_in=1)
+
+
+def test_reduce_budget_leaves_room_for_the_reduce_template(llm):
+    engine = make_engine(lambda system_prompt, prompt: llm.answer(prompt))
+
+    counter = WordCounter()
+    extra = counter.count(REDUCE_TEMPLATE.replace("{text}", "")) - counter.count(MAP_TEMPLATE.replace("{text}", ""))
+    assert extra > 0
+    assert engine.reduce_budget == engine.chunker.budget - extra
@@ -0,0 +1,69 @@
+import sys
+import types
+
+import pytest
+
+from bin.transcription import PromptChunker as chunker
+from bin.transcription.PromptChunker import TokenCounter
+
+
+@pytest.fixture
+def fake_hub(monkeypatch, tmp_path):
+    # Stands in for huggingface_hub and tokenizers: the tokenizer is only "cached" for phi3
+    downloads = []
+    cached = {"microsoft/Phi-3-mini-4k-instruct"}
+
+    def hf_hub_download(repo, filename, token=None, local_files_only=False):
+        downloads.append((repo, local_files_only))
+        if local_files_only and repo not in cached:
+            raise FileNotFoundError(f"{repo} is not in the cache")
+        return str(tmp_path / filename)
+
+    class Tokenizer:
+        @staticmethod
+        def from_file(path):
+            encode = lambda text, add_special_tokens=False: types.SimpleNamespace(ids=text.split())
+            return types.SimpleNamespace(encode=encode)
+
+    monkeypatch.setitem(sys.modules, "huggingface_hub", types.SimpleNamespace(hf_hub_download=hf_hub_download))
+    monkeypatch.setitem(sys.modules, "tokenizers", types.SimpleNamespace(Tokenizer=Tokenizer))
+    monkeypatch.setattr(chunker, "_hub_tokenizers", {})
+    monkeypatch.delenv("MERIDIAN_TOKENIZER", raising=False)
+    monkeypatch.delenv("MERIDIAN_TOKENIZER_DOWNLOAD", raising=False)
+    return downloads
+
+
+def test_cached_hub_tokenizer_is_used_without_downloading(fake_hub):
+    counter = TokenCounter("phi3:latest")
+
+    assert counter.backend == "tokenizers:microsoft/Phi-3-mini-4k-instruct"
+    assert counter.count("the party enters the tavern") == 5
+    assert fake_hub == [("microsoft/Phi-3-mini-4k-instruct", True)]
+
+
+def test_uncached_hub_tokenizer_is_not_downloaded_by_default(fake_hub):
+    counter = TokenCounter("llama3")
+
+    assert not counter.backend.startswith("tokenizers:")
+    assert fake_hub == [("meta-llama/Meta-Llama-3-8B-Instruct", True)]
+
+
+def test_download_is_opt_in(fake_hub, monkeypatch):
+    monkeypatch.setenv("MERIDIAN_TOKENIZER_DOWNLOAD", "1")
+
+    counter = TokenCounter("llama3")
+
+    assert counter.backend == "tokenizers:meta-llama/Meta-Llama-3-8B-Instruct"
+    assert fake_hub == [("meta-llama/Meta-Llama-3-8B-Instruct", False)]
+
+
+def test_estimate_is_used_without_any_tokenizer(monkeypatch):
+    monkeypatch.setitem(sys.modules, "tiktoken", None)
+    monkeypatch.setitem(sys.modules, "huggingface_hub", None)
+    monkeypatch.delenv("MERIDIAN_TOKENIZER", raising=False)
+    monkeypatch.setattr(chunker, "_hub_tokenizers", {})
+
+    counter = TokenCounter("llama3")
+
+    assert counter.backend == "estimate"
+    assert counter.count("the party enters the tavern") == TokenCounter.estimate("the party enters the tavern")